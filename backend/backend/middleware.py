@@ -0,0 +1,121 @@
+# Project middleware: request instrumentation and compression of JSON responses
+import json
+import logging
+import re
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger('gymtracker.timing')
+re_accepts_brotli = re.compile(r'\bbr\b')
+
+# Database execute wrapper counting queries and keeping the slowest ones
+class QueryTimer:
+    def __init__(self, slowest_count):
+        self.slowest_count = slowest_count
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []  # (duration, sql), slowest first
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            if len(self.slowest) < self.slowest_count or duration > self.slowest[-1][0]:
+                self.slowest.append((duration, sql))
+                self.slowest.sort(key=lambda item: item[0], reverse=True)
+                del self.slowest[self.slowest_count:]
+
+# Per-request instrumentation: wall time, database queries and their time, response rendering
+# and slowest SQL statements, sent as Server-Timing header and one JSON log line
+# Enabled by REQUEST_TIMING setting, otherwise removed from middleware chain at startup
+class RequestTimingMiddleware:
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer(settings.REQUEST_TIMING_SLOW_QUERIES)
+        request.timing_render_started = None
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        finished = time.perf_counter()
+
+        total = (finished - started) * 1000
+        db = timer.duration * 1000
+        # Rendering starts after view returned, for DRF responses it is JSON encoding
+        render = (finished - request.timing_render_started) * 1000 if request.timing_render_started else 0.0
+        response['Server-Timing'] = ', '.join([
+            f'total;dur={total:.1f}',
+            f'db;dur={db:.1f};desc="{timer.count} queries"',
+            f'render;dur={render:.1f}',
+            f'app;dur={max(total - db - render, 0.0):.1f}',
+        ])
+
+        logger.info(json.dumps({
+            'message': f"{request.method} {request.path} {response.status_code}",
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total, 1),
+            'db_ms': round(db, 1),
+            'queries': timer.count,
+            'render_ms': round(render, 1),
+            'slowest_queries': [
+                {'ms': round(duration * 1000, 1), 'sql': sql[:500]} for duration, sql in timer.slowest
+            ],
+        }))
+        return response
+
+    def process_template_response(self, request, response):
+        request.timing_render_started = time.perf_counter()
+        return response
+
+# Compress JSON API responses, brotli when installed and accepted by client, gzip otherwise
+# Other responses (admin, static files served by whitenoise) are left as they are
+# Responses carrying tokens or cookies are never compressed, compressed secrets leak through size (BREACH)
+class JSONCompressionMiddleware(GZipMiddleware):
+    brotli_quality = 5  # Fast levels, responses are compressed on every request
+    secret_paths = ('/api/users/auth/',)  # Login, registration and token refresh
+
+    def process_response(self, request, response):
+        if response.streaming or not response.get('Content-Type', '').startswith('application/json'):
+            return response
+        if response.cookies or request.path.startswith(self.secret_paths):
+            return response
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is None or not re_accepts_brotli.search(accept_encoding):
+            return super().process_response(request, response)
+
+        if len(response.content) < 200 or response.has_header('Content-Encoding'):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed_content = brotli.compress(response.content, quality=self.brotli_quality)
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response.headers['Content-Length'] = str(len(response.content))
+
+        # Strong ETag is no longer valid for encoded content
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'users',
     'exercises',
     'workouts',
@@ -59,6 +60,9 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'backend.middleware.JSONCompressionMiddleware',
+    # Inside compression, so render timing is JSON encoding only
+    'backend.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -120,6 +124,55 @@ else:
         }
     }
 
+# Cache
+# Redis in production (REDIS_URL), local memory for development and tests
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# How long cached user statistics live (seconds), they are also invalidated on every workout change
+STATS_CACHE_TIMEOUT = int(os.environ.get('STATS_CACHE_TIMEOUT', 600))
+
+# How many users keep columnar copy of their history in memory of each process (NumPy required), 0 disables it
+COLUMNAR_CACHE_USERS = int(os.environ.get('COLUMNAR_CACHE_USERS', 64))
+# How long columnar copy is reused (seconds), bounds staleness when version bump is lost (e.g. local memory cache per process)
+COLUMNAR_CACHE_MAX_AGE = int(os.environ.get('COLUMNAR_CACHE_MAX_AGE', 300))
+
+# How long responses of requests with Idempotency-Key header are kept for retries (seconds)
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+# How long deleted workouts are remembered for delta sync (seconds), clients not synced for longer do full sync
+SYNC_TOMBSTONE_TTL = int(os.environ.get('SYNC_TOMBSTONE_TTL', 90 * 24 * 60 * 60))
+
+# Request instrumentation, Server-Timing header and JSON log line with query counts per request
+REQUEST_TIMING = os.environ.get('REQUEST_TIMING', 'False') == 'True'
+# How many slowest SQL statements are logged per request
+REQUEST_TIMING_SLOW_QUERIES = int(os.environ.get('REQUEST_TIMING_SLOW_QUERIES', 3))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'gymtracker.timing': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -170,6 +223,11 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    # orjson based JSON when installed, same output as DRF JSONRenderer
+    'DEFAULT_RENDERER_CLASSES': (
+        'backend.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 
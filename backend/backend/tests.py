@@ -0,0 +1,92 @@
+import gzip
+import json
+import time
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from unittest import mock, skipIf
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils.text import compress_string
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from .middleware import JSONCompressionMiddleware
+from .renderers import FastJSONRenderer, orjson
+
+
+@override_settings(REQUEST_TIMING=True)
+class RequestTimingTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='lifter', email='lifter@example.com', password='secret')
+        # Client created after settings override, middleware chain is built on its first request
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/workouts/')
+        self.assertEqual(response.status_code, 200, response.content)
+        metrics = dict(metric.split(';', 1) for metric in response['Server-Timing'].split(', '))
+        self.assertEqual(list(metrics), ['total', 'db', 'render', 'app'])
+        self.assertRegex(metrics['db'], r'^dur=[\d.]+;desc="[1-9]\d* queries"$')
+
+    def test_log_line(self):
+        with self.assertLogs('gymtracker.timing', 'INFO') as logs:
+            self.client.get('/api/workouts/')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['message'], 'GET /api/workouts/ 200')
+        self.assertGreater(line['queries'], 0)
+        self.assertLessEqual(len(line['slowest_queries']), 3)
+        self.assertLessEqual(line['db_ms'] + line['render_ms'], line['total_ms'])
+
+    # Compression wraps timing, its time is not counted as rendering
+    def test_compression_not_timed(self):
+        def slow_compress(*args, **kwargs):
+            time.sleep(0.3)
+            return compress_string(*args, **kwargs)
+
+        for index in range(30):
+            self.client.post('/api/workouts/', {'name': f'Workout {index}', 'start_time': '2026-01-05T10:00:00Z', 'exercises': []}, format='json')
+        with mock.patch('django.middleware.gzip.compress_string', slow_compress), self.assertLogs('gymtracker.timing', 'INFO') as logs:
+            response = self.client.get('/api/workouts/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('total;dur=', response['Server-Timing'])
+        self.assertLess(json.loads(logs.records[0].getMessage())['total_ms'], 300)
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['results']), 30)
+
+
+class JSONCompressionTests(TestCase):
+    def test_token_refresh_not_compressed(self):
+        user = get_user_model().objects.create_user(username='lifter', email='lifter@example.com', password='secret')
+        response = self.client.post(
+            '/api/users/auth/token/refresh/', {'refresh': str(RefreshToken.for_user(user))}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('access', response.json())
+
+    def test_response_with_cookie_not_compressed(self):
+        middleware = JSONCompressionMiddleware(lambda request: None)
+        request = RequestFactory().get('/api/workouts/', HTTP_ACCEPT_ENCODING='gzip')
+        for set_cookie in (False, True):
+            response = JsonResponse({'items': list(range(200))})
+            if set_cookie:
+                response.set_cookie('sessionid', 'secret')
+            response = middleware.process_response(request, response)
+            self.assertEqual(response.get('Content-Encoding'), None if set_cookie else 'gzip')
+
+
+@skipIf(orjson is None, 'orjson not installed')
+class FastJSONRendererTests(SimpleTestCase):
+    def test_same_output_as_drf(self):
+        data = {
+            'text': 'Wyciskanie \u2028 "leżąc" \u2029 \\ 💪 </script>',
+            'weight': Decimal('102.50'),
+            'start_time': datetime(2026, 1, 5, 10, 0, 0, 123456, tzinfo=timezone.utc),
+            'day': date(2026, 1, 5),
+            'message': gettext_lazy('User is inactive'),
+            'values': [1, 2.5, None, True, {'nested': []}],
+            7: 'integer key',
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(None), JSONRenderer().render(None))
@@ -1,5 +1,7 @@
 from django.contrib import admin
 from .models import Exercise
+from .search import update_search_vectors
+from .catalogue import bump_catalogue_version
 
 @admin.register(Exercise)
 class ExerciseAdmin(admin.ModelAdmin):
@@ -13,6 +15,21 @@ class ExerciseAdmin(admin.ModelAdmin):
         return qs.prefetch_related('primary_muscles')
 
 
+    # Keep search vectors and caches derived from catalogue (ETags, muscle index) in sync
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        update_search_vectors([form.instance.id])
+        bump_catalogue_version()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        bump_catalogue_version()
+
+    # Bulk "delete selected" action
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        bump_catalogue_version()
+
     def muscle_group_display(self, obj):
 
         muscles = [m.name for m in obj.primary_muscles.all()[:3]]
@@ -0,0 +1,24 @@
+# Catalogue version stamp, read from cache so conditional requests do not touch the database
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+from .models import CatalogueVersion
+
+CACHE_KEY = 'catalogue-version'
+CACHE_TIMEOUT = 60 # Processes with local memory cache see a bump after at most this many seconds
+
+# Returns (version, updated_at)
+def get_catalogue_version():
+    stamp = cache.get(CACHE_KEY)
+    if stamp is None:
+        row, _ = CatalogueVersion.objects.get_or_create(id=1)
+        stamp = (row.version, row.updated_at)
+        cache.set(CACHE_KEY, stamp, CACHE_TIMEOUT)
+    return stamp
+
+# Called after any change of exercises, muscles or equipment
+def bump_catalogue_version():
+    CatalogueVersion.objects.get_or_create(id=1)
+    CatalogueVersion.objects.filter(id=1).update(version=F('version') + 1, updated_at=timezone.now())
+    row = CatalogueVersion.objects.get(id=1)
+    cache.set(CACHE_KEY, (row.version, row.updated_at), CACHE_TIMEOUT)
@@ -1,28 +1,104 @@
+import json
+import sys
+import time
 import requests
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from exercises.models import Exercise, Muscle, Equipment
+from exercises.search import update_search_vectors
+from exercises.catalogue import bump_catalogue_version
+from workouts.services import refresh_exercise_rollups
+
+JSON_URL = "https://raw.githubusercontent.com/yuhonas/free-exercise-db/main/dist/exercises.json"
+BASE_IMAGE_URL = "https://raw.githubusercontent.com/yuhonas/free-exercise-db/refs/heads/main/exercises"
+DOWNLOAD_TIMEOUT = 30 # seconds
+
+# Exercise columns compared with existing rows
+EXERCISE_FIELDS = ['force', 'level', 'mechanic', 'category', 'instructions', 'image_urls']
 
 class Command(BaseCommand):
     help = 'Imports exercises from the yuhonas/free-exercise-db GitHub repository mapping to M2M structure'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='Read exercises JSON from local file ("-" for stdin) instead of GitHub')
+
     def handle(self, *args, **options):
-        JSON_URL = "https://raw.githubusercontent.com/yuhonas/free-exercise-db/main/dist/exercises.json"
-        BASE_IMAGE_URL = "https://raw.githubusercontent.com/yuhonas/free-exercise-db/refs/heads/main/exercises"
+        self.started = time.monotonic()
+        data = self._load(options['file'])
+        if data is None:
+            return
+
+        total = len(data)
+        self.stdout.write(f"Found {total} exercises. Starting import...")
+
+        exercises = self._parse(data)
+        self._phase("Parsed data")
+
+        with transaction.atomic():
+            muscle_ids = self._sync_names(
+                Muscle, {name for item in exercises.values() for name in item['primary'] | item['secondary']})
+            equipment_ids = self._sync_names(
+                Equipment, {name for item in exercises.values() for name in item['equipment']})
+            self._phase("Resolved muscles and equipment")
+
+            exercise_ids, created, updated = self._sync_exercises(exercises)
+            self._phase(f"Exercises: {created} created, {updated} updated")
+
+            relations_changed = 0
+            remapped_ids = set() # Exercises whose muscles changed
+            for relation, key, ids in (
+                (Exercise.primary_muscles.through, 'primary', muscle_ids),
+                (Exercise.secondary_muscles.through, 'secondary', muscle_ids),
+                (Exercise.equipment.through, 'equipment', equipment_ids),
+            ):
+                changed_ids = self._sync_relation(relation, exercises, exercise_ids, key, ids)
+                relations_changed += len(changed_ids)
+                if key != 'equipment':
+                    remapped_ids |= changed_ids
+            self._phase(f"Relations: {relations_changed} exercises changed")
+
+            # Catalogue changed, refresh search and everything derived from catalogue version
+            if created or updated or relations_changed:
+                update_search_vectors()
+                bump_catalogue_version()
+                self._phase("Updated search vectors")
+
+            # Per-muscle rollups were computed with old muscles of these exercises
+            if remapped_ids:
+                users = refresh_exercise_rollups(remapped_ids)
+                self._phase(f"Refreshed volume rollups of {users} users")
+
+        self.stdout.write(self.style.SUCCESS(f"Success! Imported/Updated {len(exercises)} exercises."))
 
-        self.stdout.write("Downloading exercises data from GitHub (yuhonas/free-exercise-db)...")
-        
+    def _phase(self, message):
+        self.stdout.write(f"[{time.monotonic() - self.started:.2f}s] {message}")
+
+    def _load(self, path):
         try:
-            response = requests.get(JSON_URL)
+            if path == '-':
+                self.stdout.write("Reading exercises data from stdin...")
+                return json.load(sys.stdin)
+            if path:
+                self.stdout.write(f"Reading exercises data from {path}...")
+                with open(path) as file:
+                    return json.load(file)
+
+            self.stdout.write("Downloading exercises data from GitHub (yuhonas/free-exercise-db)...")
+            response = requests.get(JSON_URL, timeout=DOWNLOAD_TIMEOUT)
             response.raise_for_status()
             data = response.json()
-        except Exception as e:
-            self.stderr.write(self.style.ERROR(f"Download error: {e}"))
-            return
+        except (OSError, ValueError, requests.RequestException) as e:
+            # Runs on every container start, offline start keeps catalogue imported before
+            if not path and Exercise.objects.exists():
+                self.stdout.write(self.style.WARNING(f"Could not download exercises data, keeping existing catalogue: {e}"))
+                return None
+            raise CommandError(f"Could not load exercises data: {e}")
+        self._phase("Downloaded data")
+        return data
 
-        total = len(data)
-        self.stdout.write(f"Found {total} exercises. Starting import...")
-        
-        count = 0
+    # Normalize source items into {name: {fields, primary, secondary, equipment}}
+    def _parse(self, data):
+        exercises = {}
         for item in data:
             name = item.get('name')
             if not name:
@@ -30,49 +106,79 @@ class Command(BaseCommand):
 
             # Sanitizing folder name for image URL construction
             folder_name = name.replace("(", "").replace(")", "").replace(" ", "_").replace("/", "_").replace(",","")
-            
-            images = [
-                f"{BASE_IMAGE_URL}/{folder_name}/0.jpg",
-                f"{BASE_IMAGE_URL}/{folder_name}/1.jpg"
-            ]
-
 
-            exercise, created = Exercise.objects.update_or_create(
-                name=name,
-                defaults={
+            equipment_name = item.get('equipment')
+            exercises[name] = {
+                'fields': {
                     'force': item.get('force'),
                     'level': item.get('level'),
                     'mechanic': item.get('mechanic'),
                     'category': item.get('category', 'strength'),
                     'instructions': item.get('instructions', []),
-                    'image_urls': images,
-                }
-            )
-
-
-            # Primary Muscles
-            p_muscles = item.get('primaryMuscles', [])
-            for m_name in p_muscles:
-                clean_name = m_name.strip().title()
-                muscle_obj, _ = Muscle.objects.get_or_create(name=clean_name)
-                exercise.primary_muscles.add(muscle_obj)
-
-            # Secondary Muscles
-            s_muscles = item.get('secondaryMuscles', [])
-            for m_name in s_muscles:
-                clean_name = m_name.strip().title()
-                muscle_obj, _ = Muscle.objects.get_or_create(name=clean_name)
-                exercise.secondary_muscles.add(muscle_obj)
-
-            # Equipment
-            equipment_name = item.get('equipment')
-            if equipment_name:
-                clean_name = equipment_name.strip().title()
-                eq_obj, _ = Equipment.objects.get_or_create(name=clean_name)
-                exercise.equipment.add(eq_obj)
+                    'image_urls': [
+                        f"{BASE_IMAGE_URL}/{folder_name}/0.jpg",
+                        f"{BASE_IMAGE_URL}/{folder_name}/1.jpg"
+                    ],
+                },
+                'primary': {m_name.strip().title() for m_name in item.get('primaryMuscles', [])},
+                'secondary': {m_name.strip().title() for m_name in item.get('secondaryMuscles', [])},
+                'equipment': {equipment_name.strip().title()} if equipment_name else set(),
+            }
+        return exercises
+
+    # Create missing rows of name-only model, returns {name: id}
+    def _sync_names(self, model, names):
+        ids = dict(model.objects.values_list('name', 'id'))
+        missing = [model(name=name) for name in names if name not in ids]
+        if missing:
+            model.objects.bulk_create(missing)
+            ids.update((obj.name, obj.id) for obj in missing)
+        return ids
+
+    # Returns ({name: id}, created count, updated count)
+    def _sync_exercises(self, exercises):
+        existing = {exercise.name: exercise for exercise in Exercise.objects.only('name', *EXERCISE_FIELDS)}
+
+        to_create = []
+        to_update = []
+        for name, item in exercises.items():
+            exercise = existing.get(name)
+            if exercise is None:
+                to_create.append(Exercise(name=name, **item['fields']))
+            elif any(getattr(exercise, field) != value for field, value in item['fields'].items()):
+                for field, value in item['fields'].items():
+                    setattr(exercise, field, value)
+                to_update.append(exercise)
+
+        Exercise.objects.bulk_create(to_create, batch_size=500)
+        Exercise.objects.bulk_update(to_update, EXERCISE_FIELDS, batch_size=500)
+
+        ids = {name: exercise.id for name, exercise in existing.items()}
+        ids.update((exercise.name, exercise.id) for exercise in to_create)
+        return ids, len(to_create), len(to_update)
 
-            count += 1
-            if count % 50 == 0:
-                self.stdout.write(f"Processed {count}/{total}...")
+    # Make through rows of imported exercises match source data, returns ids of exercises with changed rows
+    def _sync_relation(self, relation, exercises, exercise_ids, key, target_ids):
+        target_field = relation._meta.get_field(key if key == 'equipment' else 'muscle').attname
+        wanted = {
+            (exercise_ids[name], target_ids[target_name])
+            for name, item in exercises.items()
+            for target_name in item[key]
+        }
+        imported_ids = [exercise_ids[name] for name in exercises]
+        current = {
+            (exercise_id, target_id): id
+            for id, exercise_id, target_id in relation.objects.filter(exercise_id__in=imported_ids)
+            .values_list('id', 'exercise_id', target_field)
+        }
 
-        self.stdout.write(self.style.SUCCESS(f"Success! Imported/Updated {count} exercises."))
\ No newline at end of file
+        stale = [id for pair, id in current.items() if pair not in wanted]
+        missing = [
+            relation(exercise_id=exercise_id, **{target_field: target_id})
+            for exercise_id, target_id in wanted if (exercise_id, target_id) not in current
+        ]
+        if stale:
+            relation.objects.filter(id__in=stale).delete()
+        if missing:
+            relation.objects.bulk_create(missing, batch_size=1000)
+        return {pair[0] for pair in current if pair not in wanted} | {row.exercise_id for row in missing}
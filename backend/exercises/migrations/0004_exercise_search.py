@@ -0,0 +1,73 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:42
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.functions.text
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+from django.db.models import F, Func, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_search_vectors(apps, schema_editor):
+    Exercise = apps.get_model('exercises', 'Exercise')
+    Muscle = apps.get_model('exercises', 'Muscle')
+    Equipment = apps.get_model('exercises', 'Equipment')
+
+    def names(model, relation):
+        return Coalesce(Subquery(
+            model.objects.filter(**{relation: OuterRef('pk')}).order_by()
+            .values(relation).annotate(names=StringAgg('name', ' ')).values('names')
+        ), Value(''), output_field=models.TextField())
+
+    instructions = Func(F('instructions'), Value(' '), function='array_to_string', output_field=models.TextField())
+    Exercise.objects.update(search_vector=(
+        SearchVector('name', weight='A', config='english')
+        + SearchVector(names(Muscle, 'primary_exercises'), weight='B', config='english')
+        + SearchVector(names(Muscle, 'secondary_exercises'), weight='B', config='english')
+        + SearchVector(names(Equipment, 'exercise'), weight='C', config='english')
+        + SearchVector(instructions, weight='D', config='english')
+    ))
+
+
+# pg_trgm is optional, typo tolerant search is used only when database provides it
+def enable_trigram(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS exercise_name_trgm_idx "
+            "ON exercises_exercise USING gin (name gin_trgm_ops)"
+        )
+
+
+def disable_trigram(apps, schema_editor):
+    schema_editor.execute("DROP INDEX IF EXISTS exercise_name_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercises', '0003_remove_exercise_equipment_old_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exercise',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='exercise',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='exercise_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exercise',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='text_pattern_ops'), name='exercise_name_prefix_idx'),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+        migrations.RunPython(enable_trigram, disable_trigram),
+    ]
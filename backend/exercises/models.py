@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models.functions import Upper
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 
 
 class Muscle(models.Model):
@@ -10,6 +13,20 @@ class Equipment(models.Model):
     name = models.CharField(max_length=50, unique=True)
     def __str__(self): return self.name
 
+# Prefetches of relations rendered by exercise serializers, one query per relation, names only
+# prefix: lookup path to exercise when prefetching from related model, e.g. 'exercises__exercise__'
+def exercise_details_prefetches(prefix=''):
+    return [
+        models.Prefetch(f'{prefix}primary_muscles', queryset=Muscle.objects.only('name')),
+        models.Prefetch(f'{prefix}secondary_muscles', queryset=Muscle.objects.only('name')),
+        models.Prefetch(f'{prefix}equipment', queryset=Equipment.objects.only('name')),
+    ]
+
+class ExerciseQuerySet(models.QuerySet):
+    # Everything needed to render ExerciseSerializer / ExerciseListSerializer without N+1 queries
+    def with_details(self):
+        return self.prefetch_related(*exercise_details_prefetches())
+
 class Exercise(models.Model):
     # --- ENUMS ---
     class Mechanic(models.TextChoices):
@@ -56,5 +73,25 @@ class Exercise(models.Model):
     secondary_muscles = models.ManyToManyField(Muscle, related_name='secondary_exercises', blank=True)
     equipment = models.ManyToManyField(Equipment, blank=True)
 
+    objects = ExerciseQuerySet.as_manager()
+
+    # Weighted full-text vector of name, muscles, equipment and instructions (see search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='exercise_search_vector_idx'),
+            # Case insensitive name prefix lookups (name__istartswith) for autocomplete
+            models.Index(OpClass(Upper('name'), name='text_pattern_ops'), name='exercise_name_prefix_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+# Single row describing current state of catalogue, bumped by importer and admin
+# Used for ETags of catalogue responses and to rebuild caches derived from catalogue
+class CatalogueVersion(models.Model):
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f"Catalogue v{self.version}"
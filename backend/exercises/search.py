@@ -0,0 +1,98 @@
+# Full-text search over exercise catalogue
+# Every exercise stores a weighted search vector: name (A), muscles (B), equipment (C), instructions (D)
+# Typo tolerance uses pg_trgm, enabled by migration only if database provides it
+import re
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, Func, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+from .models import Exercise, Muscle, Equipment
+
+SEARCH_CONFIG = 'english'
+TRIGRAM_THRESHOLD = 0.3
+
+_trigram_available = None
+
+# Is pg_trgm installed in current database, checked once per process
+def trigram_available():
+    global _trigram_available
+    if _trigram_available is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_available = cursor.fetchone() is not None
+    return _trigram_available
+
+def _names(model, relation):
+    # Space separated names of related rows for exercise in outer query
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{relation: OuterRef('pk')})
+            .order_by()
+            .values(relation)
+            .annotate(names=StringAgg('name', ' '))
+            .values('names')
+        ),
+        Value(''),
+        output_field=TextField(),
+    )
+
+# Recompute search vectors in one UPDATE, for all exercises or only given ids
+def update_search_vectors(exercise_ids=None):
+    exercises = Exercise.objects.all()
+    if exercise_ids is not None:
+        exercises = exercises.filter(id__in=exercise_ids)
+    instructions = Func(F('instructions'), Value(' '), function='array_to_string', output_field=TextField())
+    exercises.update(search_vector=(
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(_names(Muscle, 'primary_exercises'), weight='B', config=SEARCH_CONFIG)
+        + SearchVector(_names(Muscle, 'secondary_exercises'), weight='B', config=SEARCH_CONFIG)
+        + SearchVector(_names(Equipment, 'exercise'), weight='C', config=SEARCH_CONFIG)
+        + SearchVector(instructions, weight='D', config=SEARCH_CONFIG)
+    ))
+
+# Each word of text becomes prefix term, so "benc pre" finds "Bench Press"
+def _prefix_query(text):
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return None
+    return SearchQuery(' & '.join(f"{word}:*" for word in words), search_type='raw', config=SEARCH_CONFIG)
+
+# Ranked search, falls back to trigram similarity of name when nothing matches (typos)
+def search_exercises(queryset, text):
+    query = _prefix_query(text)
+    if query is None:
+        return queryset
+
+    ranked = queryset.filter(search_vector=query)\
+        .annotate(rank=SearchRank(F('search_vector'), query))\
+        .order_by('-rank', 'name')
+    if not trigram_available() or ranked.exists():
+        return ranked
+
+    return queryset.annotate(similarity=TrigramWordSimilarity(text, 'name'))\
+        .filter(similarity__gte=TRIGRAM_THRESHOLD)\
+        .order_by('-similarity', 'name')
+
+# Names for exercise picker: name prefix matches first (btree prefix index), then word prefix matches
+def autocomplete_exercises(text, limit=10):
+    text = text.strip()
+    if not text:
+        return []
+
+    results = list(
+        Exercise.objects.filter(name__istartswith=text)
+        .order_by('name')
+        .values('id', 'name')[:limit]
+    )
+    query = _prefix_query(text)
+    if len(results) < limit and query is not None:
+        found = [item['id'] for item in results]
+        results += list(
+            Exercise.objects.filter(search_vector=query)
+            .exclude(id__in=found)
+            .annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank', 'name')
+            .values('id', 'name')[:limit - len(results)]
+        )
+    return results
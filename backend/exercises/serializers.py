@@ -20,7 +20,8 @@ class ExerciseSerializer(serializers.ModelSerializer):
     )
     class Meta:
         model = Exercise
-        fields = '__all__'
+        # Search vector is maintained by database, not part of API
+        exclude = ['search_vector']
 
 class ExerciseListSerializer(serializers.ModelSerializer):
     primary_muscles = serializers.SlugRelatedField(
@@ -1,3 +1,168 @@
+import io
+import json
+import tempfile
+from datetime import timedelta
+from unittest import mock
+import requests
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .catalogue import get_catalogue_version
+from .models import Equipment, Exercise, Muscle
 
-# Create your tests here.
+
+class ExerciseHistoryTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='lifter', email='lifter@example.com', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.exercise = Exercise.objects.create(name='Bench Press')
+        self.url = f'/api/exercises/{self.exercise.id}/history/'
+
+    def test_invalid_before_date(self):
+        for before in ('yesterday', '2024-02-30T00:00:00'):
+            response = self.client.get(self.url, {'before': before})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('before', response.json())
+
+    def test_before_id_requires_before(self):
+        response = self.client.get(self.url, {'before_id': 5})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('before_id', response.json())
+
+    def test_before_with_before_id(self):
+        response = self.client.get(self.url, {'before': '2024-02-28T00:00:00Z', 'before_id': 5})
+        self.assertEqual(response.status_code, 200, response.content)
+
+
+class ExerciseDetailTests(TestCase):
+    def test_search_vector_not_exposed(self):
+        user = get_user_model().objects.create_user(username='lifter', email='lifter@example.com', password='secret')
+        client = APIClient()
+        client.force_authenticate(user)
+        exercise = Exercise.objects.create(name='Bench Press')
+        response = client.get(f'/api/exercises/{exercise.id}/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['name'], 'Bench Press')
+        self.assertNotIn('search_vector', response.json())
+
+
+class ExerciseAdminTests(TestCase):
+    def test_bulk_delete_bumps_catalogue_version(self):
+        from django.contrib.admin.sites import site
+        from django.test import RequestFactory
+        Exercise.objects.create(name='Bench Press')
+        cache.clear()
+        version, _ = get_catalogue_version()
+        admin = site._registry[Exercise]
+        admin.delete_queryset(RequestFactory().post('/'), Exercise.objects.all())
+        self.assertFalse(Exercise.objects.exists())
+        self.assertGreater(get_catalogue_version()[0], version)
+
+
+# Rendering exercises costs the same number of queries whatever their count (no N+1 over muscles and equipment)
+class ExerciseQueryCountTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='lifter', email='lifter@example.com', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        chest, triceps = Muscle.objects.create(name='Chest'), Muscle.objects.create(name='Triceps')
+        barbell = Equipment.objects.create(name='Barbell')
+        for i in range(40):
+            exercise = Exercise.objects.create(name=f'Exercise {i:02}')
+            exercise.primary_muscles.add(chest)
+            exercise.secondary_muscles.add(triceps)
+            exercise.equipment.add(barbell)
+        # Creates version row, which is not part of steady state (cache outlives rolled back rows of other tests)
+        cache.clear()
+        get_catalogue_version()
+
+    # Count, page and one prefetch per relation
+    def test_list_page(self):
+        for page_size in (5, 40):
+            with self.assertNumQueries(5):
+                response = self.client.get('/api/exercises/', {'page_size': page_size})
+            self.assertEqual(len(response.json()['results']), page_size)
+            self.assertEqual(response.json()['results'][0]['primary_muscles'], ['Chest'])
+
+    # Catalogue version (cache cleared), exercises and one prefetch per relation
+    def test_snapshot(self):
+        for count in (40, 5):
+            Exercise.objects.filter(name__gte=f'Exercise {count:02}').delete()
+            cache.clear()
+            with self.assertNumQueries(5):
+                response = self.client.get('/api/exercises/snapshot/')
+            self.assertEqual(len(response.json()['exercises']), count)
+            self.assertEqual(response.json()['exercises'][0]['equipment'], ['Barbell'])
+
+
+@mock.patch('requests.get', side_effect=requests.ConnectionError('offline'))
+class ImportExercisesOfflineTests(TestCase):
+    def test_download_failure_keeps_existing_catalogue(self, get):
+        Exercise.objects.create(name='Bench Press')
+        call_command('import_exercises', stdout=io.StringIO())
+        self.assertEqual(Exercise.objects.count(), 1)
+
+    def test_download_failure_without_catalogue(self, get):
+        with self.assertRaises(CommandError):
+            call_command('import_exercises', stdout=io.StringIO())
+
+
+class ImportExercisesRollupTests(TestCase):
+    def import_catalogue(self, primary):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as file:
+            json.dump([{'name': 'Bench Press', 'level': 'beginner', 'primaryMuscles': [primary], 'equipment': 'barbell'}], file)
+            file.flush()
+            call_command('import_exercises', file=file.name, stdout=io.StringIO())
+
+    def test_muscle_change_refreshes_rollups(self):
+        from workouts.models import DailyVolume, Workout
+        from workouts.services import rebuild_daily_volume
+        cache.clear()
+        self.import_catalogue('chest')
+        user = get_user_model().objects.create_user(username='lifter', email='lifter@example.com', password='secret')
+        workout = Workout.objects.create(user=user, start_time='2026-01-05T10:00:00Z', total_volume=500)
+        workout.exercises.create(exercise=Exercise.objects.get(), session_volume=500)
+        rebuild_daily_volume(user)
+        self.assertEqual(set(DailyVolume.objects.values_list('muscle', flat=True)), {'', 'chest'})
+
+        self.import_catalogue('shoulders')
+        self.assertEqual(set(DailyVolume.objects.values_list('muscle', 'volume')), {('', 500), ('shoulders', 500)})
+
+
+class ExerciseProgressionTests(TestCase):
+    def setUp(self):
+        from workouts.models import Workout
+        self.user = get_user_model().objects.create_user(username='lifter', email='lifter@example.com', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.exercise = Exercise.objects.create(name='Bench Press')
+        self.url = f'/api/exercises/{self.exercise.id}/progression/'
+        # Weekly sessions, estimate grows by 2.5 kg a week
+        first = timezone.now() - timedelta(weeks=20)
+        for week in range(20):
+            workout = Workout.objects.create(user=self.user, start_time=first + timedelta(weeks=week))
+            workout.exercises.create(exercise=self.exercise, session_1rm=100 + 2.5 * week)
+
+    def test_linear_trend(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertEqual((data['sessions_count'], data['best_1rm'], len(data['points'])), (20, 147.5, 20))
+        self.assertEqual(data['trend'], {'slope_per_week': 2.5, 'start_value': 100.0, 'end_value': 147.5, 'r2': 1.0})
+
+    def test_downsampled_points(self):
+        for points, expected in (('5', 5), ('1', 3), ('1000', 20)):
+            with self.subTest(points=points):
+                data = self.client.get(self.url, {'points': points}).json()
+                self.assertEqual(len(data['points']), expected)
+                self.assertEqual((data['points'][0]['e1rm'], data['points'][-1]['e1rm']), (100.0, 147.5))
+
+    def test_single_session_has_no_trend(self):
+        from workouts.models import Workout
+        Workout.objects.filter(user=self.user).exclude(id=Workout.objects.filter(user=self.user).latest('start_time').id).delete()
+        data = self.client.get(self.url).json()
+        self.assertEqual((data['sessions_count'], data['trend'], len(data['points'])), (1, None, 1))
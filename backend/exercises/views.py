@@ -1,14 +1,33 @@
+import gzip
+import hashlib
 import django_filters
-from rest_framework import viewsets, filters
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework.renderers import JSONRenderer
+from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import F, ExpressionWrapper, FloatField
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from .models import Exercise
 from .serializers import ExerciseSerializer
+from .search import search_exercises, autocomplete_exercises
+from .catalogue import get_catalogue_version
 from workouts.serializers import WorkoutSetSerializer
+from collections import defaultdict
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.urls import replace_query_param
+
+HISTORY_DEFAULT_LIMIT = 10
+HISTORY_MAX_LIMIT = 100
+PROGRESSION_DEFAULT_POINTS = 100
+PROGRESSION_MAX_POINTS = 500
 
 # Pagination 20 items per page
 class StandardResultsSetPagination(PageNumberPagination):
@@ -19,17 +38,48 @@ class StandardResultsSetPagination(PageNumberPagination):
 # Filter class needed for muscle filtering
 class ExerciseFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(lookup_expr='icontains')
-    equipment = django_filters.CharFilter(field_name='equipment__name', lookup_expr='icontains')
-    
+    equipment = django_filters.CharFilter(method='filter_by_equipment')
+
     # Custom filter for primary muscle
     muscle = django_filters.CharFilter(method='filter_by_muscle')
 
+    # Ranked full-text search over name, muscles, equipment and instructions
+    search = django_filters.CharFilter(method='filter_search')
+
     class Meta:
         model = Exercise
         fields = ['level', 'category', 'mechanic', 'force'] # exact matches
 
+    # Exists subqueries instead of M2M joins, so exercises are not duplicated
+    def filter_by_equipment(self, queryset, name, value):
+        return queryset.filter(Exists(Exercise.equipment.through.objects.filter(
+            exercise_id=OuterRef('pk'), equipment__name__icontains=value)))
+
     def filter_by_muscle(self, queryset, name, value):
-        return queryset.filter(primary_muscles__name__icontains=value) # Filter primary_muscles array field
+        return queryset.filter(Exists(Exercise.primary_muscles.through.objects.filter(
+            exercise_id=OuterRef('pk'), muscle__name__icontains=value)))
+
+    def filter_search(self, queryset, name, value):
+        return search_exercises(queryset, value)
+
+# Catalogue responses change only with catalogue version, so version + URL identifies representation
+def catalogue_etag(request, *args, **kwargs):
+    version, _ = get_catalogue_version()
+    path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()[:16]
+    return f"{version}-{path_hash}"
+
+def catalogue_last_modified(request, *args, **kwargs):
+    return get_catalogue_version()[1]
+
+def _accepts_gzip(request):
+    return 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+# Snapshot is served gzipped or plain, each encoding has own strong ETag
+def snapshot_etag(request, *args, **kwargs):
+    version, _ = get_catalogue_version()
+    return f"snapshot-{version}{'-gz' if _accepts_gzip(request) else ''}"
+
+catalogue_conditional = method_decorator(condition(etag_func=catalogue_etag, last_modified_func=catalogue_last_modified))
 
 # Auto-generated CRUD endpoints for Exercise
 class ExerciseViewSet(viewsets.ReadOnlyModelViewSet): # ReadOnly
@@ -37,12 +87,16 @@ class ExerciseViewSet(viewsets.ReadOnlyModelViewSet): # ReadOnly
     pagination_class = StandardResultsSetPagination
     
     filter_backends = [
-        DjangoFilterBackend,   # ?level=beginner&category=strength
-        filters.SearchFilter,  # ?search=...
+        DjangoFilterBackend,   # ?level=beginner&category=strength&search=...
     ] 
 
     filterset_class = ExerciseFilter
-    search_fields = ['name']
+
+    def get_queryset(self):
+        # Muscles and equipment are rendered only by catalogue actions
+        if self.action in ('list', 'retrieve'):
+            return self.queryset.with_details()
+        return self.queryset.all()
     # If asked for list view, different serializer
     def get_serializer_class(self):
         if self.action == 'list':
@@ -51,81 +105,177 @@ class ExerciseViewSet(viewsets.ReadOnlyModelViewSet): # ReadOnly
         return ExerciseSerializer
 
         
+    # Conditional GET, 304 Not Modified when client copy matches catalogue version
+    @catalogue_conditional
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @catalogue_conditional
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    # Whole catalogue in one gzipped response, built once per catalogue version
+    # URL: /api/exercises/snapshot/
+    @action(detail=False, methods=['get'])
+    @method_decorator(condition(etag_func=snapshot_etag, last_modified_func=catalogue_last_modified))
+    def snapshot(self, request):
+        version, updated_at = get_catalogue_version()
+        cache_key = f"catalogue-snapshot:{version}"
+        body = cache.get(cache_key)
+        if body is None:
+            exercises = Exercise.objects.with_details().order_by('name')
+            body = gzip.compress(JSONRenderer().render({
+                'version': version,
+                'updated_at': updated_at,
+                'exercises': ExerciseSerializer(exercises, many=True).data,
+            }))
+            cache.set(cache_key, body, None)
+
+        if _accepts_gzip(request):
+            response = HttpResponse(body, content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(gzip.decompress(body), content_type='application/json')
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+    # Exercise names for picker
+    # URL: /api/exercises/autocomplete/?q=ben&limit=10
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer.'})
+        return Response(autocomplete_exercises(request.query_params.get('q', ''), limit=limit))
+
     @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
     def history(self, request, pk=None):
         """
-        Retrieves last 10 workouts with this exercise for the user
+        Retrieves last workouts with this exercise for the user, newest first
         URL: /api/exercises/{id}/history/
+        Params:
+            limit: number of sessions (default 10, max 100)
+            before, before_id: only sessions older than this position (use "next" link for following page)
+            compact: true to return only per-session summary (top set, volume, 1RM)
+            include_sets: include sets of each session (default true unless compact)
         """
-        from workouts.models import WorkoutExercise
-        
+        from workouts.models import WorkoutSet
+        from workouts.services import get_exercise_history
+
+        params = request.query_params
+        try:
+            limit = min(max(int(params.get('limit', HISTORY_DEFAULT_LIMIT)), 1), HISTORY_MAX_LIMIT)
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer.'})
+        before = None
+        if params.get('before'):
+            try:
+                # None for malformed strings, ValueError for well-formed but invalid dates (2024-02-30)
+                before = parse_datetime(params['before'])
+            except ValueError:
+                before = None
+            if before is None:
+                raise ValidationError({'before': 'Must be an ISO 8601 datetime.'})
+        before_id = params.get('before_id')
+        if before_id is not None and not before_id.isdigit():
+            raise ValidationError({'before_id': 'Must be an integer.'})
+        if before_id is not None and before is None:
+            raise ValidationError({'before_id': 'Requires before.'})
+        compact = params.get('compact') in ('1', 'true')
+        include_sets = params.get('include_sets', 'false' if compact else 'true') in ('1', 'true')
+
         exercise = self.get_object()
+        sessions = get_exercise_history(
+            request.user, exercise.id, limit=limit + 1, before=before,
+            before_id=int(before_id) if before_id else None)
+        has_next = len(sessions) > limit
+        sessions = sessions[:limit]
+
+        sets_by_session = defaultdict(list)
+        if include_sets:
+            sets = list(WorkoutSet.objects.filter(workout_exercise_id__in=[s['id'] for s in sessions]))
+            for one_set, set_data in zip(sets, WorkoutSetSerializer(sets, many=True).data):
+                sets_by_session[one_set.workout_exercise_id].append(set_data)
 
-        history_items = WorkoutExercise.objects.filter(
-            exercise=exercise, 
-            workout__user=request.user
-        ).select_related('workout').prefetch_related('sets').order_by('-workout__start_time')
-        
         data = []
-        for item in history_items:
-            sets = item.sets.all()
-            serialized_sets = WorkoutSetSerializer(sets, many=True).data
-            
-            session_1rm = 0
-            session_1rm = item.session_1rm
-
-            data.append({
-                'workout_id': item.workout.id,
-                'workout_name': item.workout.name,
-                'date': item.workout.start_time,
-                'session_1rm': session_1rm,
-                'sets': serialized_sets
-            })
+        for session in sessions:
+            item = {
+                'workout_id': session['workout_id'],
+                'workout_name': session['workout__name'],
+                'date': session['workout__start_time'],
+                'session_1rm': session['session_1rm'],
+                'session_volume': session['session_volume'],
+                'sets_count': session['sets_count'],
+                'top_set': {
+                    'weight': float(session['top_weight'] or 0),
+                    'reps': session['top_reps'] or 0,
+                },
+            }
+            if include_sets:
+                item['sets'] = sets_by_session[session['id']]
+            data.append(item)
 
-        return Response(data)
+        next_url = None
+        if has_next:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), 'before', sessions[-1]['workout__start_time'].isoformat())
+            next_url = replace_query_param(next_url, 'before_id', sessions[-1]['id'])
+        return Response({'next': next_url, 'results': data})
 
     @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
-    def records(self, request, pk=None):
-        # Retrieves max weight and best 1RM for this exercise for the user
-        from workouts.models import WorkoutSet, WorkoutExercise
-
-
-        max_weight_set = WorkoutSet.objects.filter(
-            workout_exercise__exercise_id=pk,
-            workout_exercise__workout__user=request.user
-        ).select_related('workout_exercise__workout').order_by('-weight').first()
+    def progression(self, request, pk=None):
+        """
+        Estimated 1RM of every session with this exercise, oldest first, with best so far and fitted trend
+        URL: /api/exercises/{id}/progression/
+        Params:
+            days: only sessions from last N days (default whole history)
+            points: maximum number of returned sessions (default 100, max 500)
+            downsampling: lttb (default, keeps shape of series) or week (best session of each week)
+        """
+        from workouts.services import get_exercise_progression, PROGRESSION_DOWNSAMPLING
 
-        best_1rm_exercise = WorkoutExercise.objects.filter(
-            exercise_id=pk,
-            workout__user=request.user
-        ).select_related('workout').order_by('-session_1rm').first()
+        params = request.query_params
+        days = None
+        if params.get('days'):
+            try:
+                days = int(params['days'])
+            except ValueError:
+                raise ValidationError({'days': 'Must be an integer.'})
+            if not 0 < days <= 3660:
+                raise ValidationError({'days': 'Must be between 1 and 3660.'})
+        try:
+            points = min(max(int(params.get('points', PROGRESSION_DEFAULT_POINTS)), 3), PROGRESSION_MAX_POINTS)
+        except ValueError:
+            raise ValidationError({'points': 'Must be an integer.'})
+        downsampling = params.get('downsampling', 'lttb')
+        if downsampling not in PROGRESSION_DOWNSAMPLING:
+            raise ValidationError({'downsampling': f"Must be one of: {', '.join(PROGRESSION_DOWNSAMPLING)}."})
 
-        if max_weight_set is None:
-            reps = 0
-            date = None
-            weight = 0
+        exercise = self.get_object()
+        return Response(get_exercise_progression(request.user, exercise.id, days, points, downsampling))
 
-        else:
-            reps = max_weight_set.reps
-            date = max_weight_set.workout_exercise.workout.start_time
-            weight = float(max_weight_set.weight)
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def records(self, request, pk=None):
+        # Retrieves max weight and best 1RM for this exercise for the user
+        from workouts.models import PersonalRecord
 
+        record = PersonalRecord.objects.filter(exercise_id=pk, user=request.user).first()
 
-        if best_1rm_exercise is None:
-            best_1rm_value = 0
-            best_1rm_date = None
-        else:
-            best_1rm_value = best_1rm_exercise.session_1rm
-            best_1rm_date = best_1rm_exercise.workout.start_time
+        if record is None:
+            return Response({
+                'max_weight': {'weight': 0, 'reps': 0, 'date': None},
+                'best_1rm': {'value': 0, 'date': None}
+            })
 
         return Response({
             'max_weight': {
-                'weight': weight,
-                'reps': reps,
-                'date': date    
+                'weight': float(record.max_weight),
+                'reps': record.max_weight_reps,
+                'date': record.max_weight_date
             },
             'best_1rm': {
-                'value': best_1rm_value,
-                'date': best_1rm_date
+                'value': record.best_1rm,
+                'date': record.best_1rm_date
             }
-        })
\ No newline at end of file
+        })
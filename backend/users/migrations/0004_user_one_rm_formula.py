@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 21:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_timezone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='one_rm_formula',
+            field=models.CharField(choices=[('epley', 'Epley'), ('brzycki', 'Brzycki'), ('lombardi', 'Lombardi'), ('rpe', 'Epley with RPE')], default='epley', max_length=20),
+        ),
+    ]
@@ -1,6 +1,16 @@
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
+# Formulas of estimated 1RM users can choose, each implemented in workouts/estimators.py
+FORMULA_CHOICES = [
+    ('epley', 'Epley'),
+    ('brzycki', 'Brzycki'),
+    ('lombardi', 'Lombardi'),
+    ('rpe', 'Epley with RPE'),
+]
+DEFAULT_FORMULA = 'epley'
+
 
 # Create your models here.
 class User(AbstractUser):
@@ -13,6 +23,17 @@ class User(AbstractUser):
     ]
     gender = models.CharField(max_length=1, choices=Gender_CHOICES, null=True, blank=True)
     body_weight = models.FloatField(null=True, blank=True)
+    # IANA timezone name, workout days in calendar and charts are counted in it
+    timezone = models.CharField(max_length=64, default='UTC')
+    # Formula of estimated 1RM for sets and records of the user
+    one_rm_formula = models.CharField(max_length=20, choices=FORMULA_CHOICES, default=DEFAULT_FORMULA)
+
+    # Timezone of user, unknown names fall back to UTC
+    def get_timezone(self):
+        try:
+            return ZoneInfo(self.timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            return ZoneInfo('UTC')
 
     # Define a string representation for the user  
     def __str__(self):
@@ -1,5 +1,8 @@
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.db import transaction
 from rest_framework import serializers
 from .models import User
+from .signals import settings_changed
 from dj_rest_auth.registration.serializers import RegisterSerializer
 
 # Serializer for the User model
@@ -15,6 +18,23 @@ class CustomRegisterSerializer(RegisterSerializer):
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User 
-        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'gender', 'body_weight']
+        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'gender', 'body_weight', 'timezone', 'one_rm_formula']
 
-        read_only_fields = ['id', 'email', 'username']
\ No newline at end of file
+        read_only_fields = ['id', 'email', 'username']
+
+    def validate_timezone(self, value):
+        try:
+            ZoneInfo(value)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise serializers.ValidationError("Unknown timezone.")
+        return value
+
+    def update(self, instance, validated_data):
+        old_values = {field: getattr(instance, field) for field in ('timezone', 'one_rm_formula')}
+        # Data derived from settings (estimates, records, rollups) changes together with them
+        with transaction.atomic():
+            user = super().update(instance, validated_data)
+            changed = {field for field, value in old_values.items() if getattr(user, field) != value}
+            if changed:
+                settings_changed.send(sender=User, user=user, changed=changed)
+        return user
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent by UserSerializer.update inside its transaction, after user settings were saved
+# Arguments: user, changed (names of changed fields), apps keeping data derived from settings receive it
+settings_changed = Signal()
@@ -1,3 +1,54 @@
+from datetime import date
+from unittest import mock
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from rest_framework.test import APIClient
+from exercises.models import Exercise
+from workouts.models import DailyVolume, PersonalRecord, WorkoutExercise, WorkoutSet
 
-# Create your tests here.
+
+class UserSettingsTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='lifter', email='lifter@example.com', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        exercise = Exercise.objects.create(name='Bench Press')
+        # 2024-01-01 19:00 in Los Angeles
+        response = self.client.post('/api/workouts/', {
+            'name': 'Workout',
+            'start_time': '2024-01-02T03:00:00Z',
+            'exercises': [{'exercise_id': exercise.id, 'order': 0, 'sets': [{'weight': 100, 'reps': 5, 'order': 0}]}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def daily_volume(self):
+        return dict(DailyVolume.objects.filter(user=self.user, muscle='').values_list('day', 'volume'))
+
+    def test_timezone_change_moves_daily_volume(self):
+        self.assertEqual(self.daily_volume(), {date(2024, 1, 2): 500.0})
+        response = self.client.patch('/api/users/auth/user/', {'timezone': 'America/Los_Angeles'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.daily_volume(), {date(2024, 1, 1): 500.0})
+
+    def test_timezone_and_formula_change_together(self):
+        response = self.client.patch(
+            '/api/users/auth/user/', {'timezone': 'America/Los_Angeles', 'one_rm_formula': 'brzycki'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.daily_volume(), {date(2024, 1, 1): 500.0})
+
+    def test_formula_change_recalculates_estimates(self):
+        volumes = list(DailyVolume.objects.values_list('id', 'day', 'muscle', 'volume'))
+        response = self.client.patch('/api/users/auth/user/', {'one_rm_formula': 'brzycki'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        # 100 kg for 5 reps, 100 * 36 / 32
+        self.assertEqual(WorkoutSet.objects.get().estimated_1rm, 112.5)
+        self.assertEqual(WorkoutExercise.objects.get().session_1rm, 112.5)
+        self.assertEqual(PersonalRecord.objects.get(user=self.user).best_1rm, 112.5)
+        # Rollups do not depend on formula
+        self.assertEqual(list(DailyVolume.objects.values_list('id', 'day', 'muscle', 'volume')), volumes)
+
+    def test_failed_recalculation_keeps_settings(self):
+        with mock.patch('workouts.signals.recalculate_user_estimates', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.client.patch('/api/users/auth/user/', {'one_rm_formula': 'brzycki'}, format='json')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.one_rm_formula, 'epley')
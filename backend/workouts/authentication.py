@@ -0,0 +1,14 @@
+# Stateless JWT authentication for endpoints served from cache
+# Token user is not loaded from database, only its active flag which is cached too
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from .cache import is_user_active
+
+class CachedUserAuthentication(JWTStatelessUserAuthentication):
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        # Same check JWTAuthentication does for deactivated and deleted users
+        if not is_user_active(int(user.id)):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
@@ -0,0 +1,71 @@
+# Per-user cache for computed statistics
+# Keys contain user version which is bumped on every change of user workouts,
+# so stale entries are never read and simply expire
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+
+COUNTER_KEYS = {True: 'stats-cache:hits', False: 'stats-cache:misses'}
+
+def _version_key(user_id):
+    return f"stats-version:{user_id}"
+
+def get_stats_version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Fresh token so entries from before eviction of version are not reused
+        version = time.time_ns()
+        cache.add(_version_key(user_id), version, None)
+        version = cache.get(_version_key(user_id), version)
+    return version
+
+def bump_stats_version(user_id):
+    cache.set(_version_key(user_id), time.time_ns(), None)
+
+def _active_key(user_id):
+    return f"user-active:{user_id}"
+
+# Whether user exists and is active, cached for stateless authentication
+def is_user_active(user_id):
+    active = cache.get(_active_key(user_id))
+    if active is None:
+        active = get_user_model().objects.filter(id=user_id, is_active=True).exists()
+        cache.set(_active_key(user_id), active, settings.STATS_CACHE_TIMEOUT)
+    return active
+
+# Called after user is saved or deleted
+def forget_user_active(user_id):
+    transaction.on_commit(lambda: cache.delete(_active_key(user_id)))
+
+# Mark all cached statistics of user as outdated
+# Bumped after commit, otherwise request reading before commit caches old data under new version
+def invalidate_user_stats(user_id):
+    transaction.on_commit(lambda: bump_stats_version(user_id))
+
+# Return cached value of compute() for user, computing it on miss
+# Returns tuple (data, hit)
+def get_cached_stats(user_id, name, compute):
+    key = f"stats:{name}:{user_id}:{get_stats_version(user_id)}"
+    data = cache.get(key)
+    hit = data is not None
+    if not hit:
+        data = compute()
+        cache.set(key, data, settings.STATS_CACHE_TIMEOUT)
+    _count(hit)
+    return data, hit
+
+def _count(hit):
+    try:
+        cache.incr(COUNTER_KEYS[hit])
+    except ValueError:
+        cache.set(COUNTER_KEYS[hit], 1, None)
+
+# Hit and miss counters shared by all processes using the cache
+def get_stats_cache_counters():
+    counters = cache.get_many(COUNTER_KEYS.values())
+    return {
+        'hits': counters.get(COUNTER_KEYS[True], 0),
+        'misses': counters.get(COUNTER_KEYS[False], 0),
+    }
@@ -0,0 +1,184 @@
+# Per-user columnar copy of training history for vectorized statistics
+# Sets are kept as NumPy arrays ordered by workout start time, so time windows are slices found
+# by binary search and statistics are reductions over them instead of ORM scans
+# Entries live in process-wide LRU over users and are checked against user stats version (see cache.py),
+# which is bumped by every workout write, so writes from any process invalidate them,
+# and are reloaded after COLUMNAR_CACHE_MAX_AGE seconds in any case
+# NumPy is optional, without it get_user_history returns None and services query the database
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from django.conf import settings
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from .cache import get_stats_version
+from .models import Workout, WorkoutExercise, WorkoutSet
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class UserHistory:
+    def __init__(self, version, workouts, sessions, sets):
+        """
+        workouts: (id, start_time, total_volume) rows ordered by start time
+        sessions: (workout_id, exercise_id, session_volume) rows in any order
+        sets: (workout_id, exercise_id, weight, reps) rows in any order
+        """
+        self.version = version
+        self.loaded_at = time.monotonic()
+        positions = {workout_id: position for position, (workout_id, _, _) in enumerate(workouts)}
+        self.workout_start = np.array([start.timestamp() for _, start, _ in workouts], dtype=np.float64)
+        # Stored totals, rounded like rollups of volume chart are
+        self.workout_volume = np.array([volume for _, _, volume in workouts], dtype=np.float64)
+
+        workout_ids, exercise_ids, volumes = zip(*sessions) if sessions else ((), (), ())
+        self.session_workout, order = _sorted_positions(positions, workout_ids)
+        self.session_exercise = np.array(exercise_ids, dtype=np.int32)[order]
+        self.session_volume = np.array(volumes, dtype=np.float64)[order]
+
+        workout_ids, exercise_ids, weights, reps = zip(*sets) if sets else ((), (), (), ())
+        self.set_workout, order = _sorted_positions(positions, workout_ids)
+        self.set_exercise = np.array(exercise_ids, dtype=np.int32)[order]
+        self.set_weight = np.array(weights, dtype=np.float64)[order]
+        self.set_reps = np.array(reps, dtype=np.int32)[order]
+        self.set_volume = self.set_weight * self.set_reps
+        self.exercise_ids = set(self.session_exercise.tolist())
+        self._days = {} # timezone name -> local day of every workout
+
+    @classmethod
+    def load(cls, user_id, version):
+        workouts = list(
+            Workout.objects.filter(user_id=user_id).order_by('start_time', 'id')
+            .values_list('id', 'start_time', 'total_volume')
+        )
+        sessions = list(
+            WorkoutExercise.objects.filter(workout__user_id=user_id).order_by()
+            .values_list('workout_id', 'exercise_id', 'session_volume')
+        )
+        sets = list(
+            WorkoutSet.objects.filter(workout_exercise__workout__user_id=user_id)
+            .order_by()
+            # Float weight from database, converting Decimals in Python is most of load time
+            .annotate(float_weight=Cast('weight', FloatField()))
+            .values_list('workout_exercise__workout_id', 'workout_exercise__exercise_id', 'float_weight', 'reps')
+        )
+        return cls(version, workouts, sessions, sets)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (
+            self.workout_start, self.workout_volume, self.session_workout, self.session_exercise, self.session_volume,
+            self.set_workout, self.set_exercise, self.set_weight, self.set_reps, self.set_volume,
+        ))
+
+    # Local day (datetime64[D]) of every workout in tz, computed once per timezone
+    def workout_days(self, tz):
+        days = self._days.get(str(tz))
+        if days is None:
+            days = np.array(
+                [datetime.fromtimestamp(start, tz).date() for start in self.workout_start.tolist()],
+                dtype='datetime64[D]',
+            )
+            self._days[str(tz)] = days
+        return days
+
+    # First workout started at or after timestamp (seconds since epoch)
+    def workouts_since(self, timestamp):
+        return int(np.searchsorted(self.workout_start, timestamp, side='left'))
+
+    # Slice of set arrays belonging to workouts first..last-1
+    def set_range(self, first, last):
+        return (
+            int(np.searchsorted(self.set_workout, first, side='left')),
+            int(np.searchsorted(self.set_workout, last, side='left')),
+        )
+
+    # Slice of session arrays belonging to workouts first..last-1
+    def session_range(self, first, last):
+        return (
+            int(np.searchsorted(self.session_workout, first, side='left')),
+            int(np.searchsorted(self.session_workout, last, side='left')),
+        )
+
+# Index of row workout in workout arrays, rows are sorted by it here instead of by database
+# Returns (sorted positions, order of rows)
+def _sorted_positions(positions, workout_ids):
+    row_workout = np.array([positions[id] for id in workout_ids], dtype=np.int32)
+    order = np.argsort(row_workout, kind='stable')
+    return row_workout[order], order
+
+# Exercise to body part weights and exercise to muscle membership as dense matrices
+# Rows are found by exercise id through lookup array, last row (all zeros) belongs to unknown exercises
+class MuscleMatrix:
+    def __init__(self, index, slugs):
+        self.index = index
+        self.slugs = list(slugs)
+        self.muscles = sorted({muscle for names in index['muscles'].values() for muscle in names})
+        self.muscle_columns = {muscle: column for column, muscle in enumerate(self.muscles)}
+        slug_columns = {slug: column for column, slug in enumerate(self.slugs)}
+
+        exercise_ids = sorted(index['exercise_ids'] | index['muscles'].keys())
+        self.size = len(exercise_ids) + 1
+        self.rows = np.full((exercise_ids[-1] if exercise_ids else 0) + 2, self.size - 1, dtype=np.int32)
+        self.rows[exercise_ids] = np.arange(len(exercise_ids), dtype=np.int32)
+        self.slug_weights = np.zeros((self.size, len(self.slugs)))
+        self.muscle_sets = np.zeros((self.size, len(self.muscles)))
+
+        for row, exercise_id in enumerate(exercise_ids):
+            for slug, weight in index['slug_weights'].get(exercise_id, {}).items():
+                self.slug_weights[row, slug_columns[slug]] = weight
+            for muscle in index['muscles'].get(exercise_id, ()):
+                self.muscle_sets[row, self.muscle_columns[muscle]] = 1.0
+
+    def exercise_rows(self, exercise_ids):
+        return self.rows[np.minimum(exercise_ids, len(self.rows) - 1)]
+
+    # Per-exercise sums of weights (count of sets by default), rows as in matrices
+    def sum_by_exercise(self, exercise_ids, weights=None):
+        return np.bincount(self.exercise_rows(exercise_ids), weights=weights, minlength=self.size)
+
+# First day of chart bucket of every day (datetime64[D])
+def bucket_starts(days, granularity):
+    if granularity == 'week':
+        # 1970-01-01 (day 0) was Thursday
+        return days - (days.astype(np.int64) + 3) % 7
+    if granularity == 'month':
+        return days.astype('datetime64[M]').astype('datetime64[D]')
+    return days
+
+# Sum of weights (count by default) for every distinct key, as {key: sum} with Python keys (dates for days)
+def sum_by_key(keys, weights=None):
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    sums = np.bincount(inverse, weights=weights, minlength=len(unique_keys))
+    return dict(zip(unique_keys.tolist(), sums.tolist()))
+
+_histories = OrderedDict() # user_id -> UserHistory, least recently used first
+_lock = threading.Lock()
+
+# Columnar history of user, loaded on first use and after every change of user workouts
+# load: False returns only copy already in memory, short windows are cheaper to query than whole history to load
+# Returns None when NumPy is not installed or cache is disabled (COLUMNAR_CACHE_USERS = 0)
+def get_user_history(user_id, load=True):
+    if np is None or settings.COLUMNAR_CACHE_USERS <= 0:
+        return None
+    version = get_stats_version(user_id)
+    with _lock:
+        history = _histories.get(user_id)
+        if (history is not None and history.version == version
+                and time.monotonic() - history.loaded_at < settings.COLUMNAR_CACHE_MAX_AGE):
+            _histories.move_to_end(user_id)
+            return history
+    if not load:
+        return None
+
+    # Loaded outside of lock, concurrent misses of one user may both load it
+    history = UserHistory.load(user_id, version)
+    with _lock:
+        _histories[user_id] = history
+        _histories.move_to_end(user_id)
+        while len(_histories) > settings.COLUMNAR_CACHE_USERS:
+            _histories.popitem(last=False)
+    return history
@@ -0,0 +1,72 @@
+# Deferred workout summary recomputation
+# Edits mark workout dirty, summary is recomputed once at the end of the edit transaction,
+# so several set changes in one request cost a single recompute of only touched sessions
+import threading
+from contextlib import contextmanager
+from django.db import transaction
+from .services import calculate_workout_summary, rebuild_personal_records
+
+_state = threading.local()
+
+# Recompute waiting for end of block, result holds summary once it ran
+class PendingSummary:
+    def __init__(self, workout):
+        self.workout = workout
+        self.workout_exercise_ids = set()
+        self.record_exercise_ids = set()
+        self.full = False
+        self.done = False
+        self.result = None
+
+    def run(self):
+        if self.done:
+            return
+        self.done = True
+        # Stats, records and rollups of workout change together
+        with transaction.atomic():
+            self.result = calculate_workout_summary(
+                self.workout, None if self.full else self.workout_exercise_ids)
+            if self.record_exercise_ids:
+                # Exercises which lost sessions of workout fall back to their next best sessions
+                rebuild_personal_records(self.workout.user, self.record_exercise_ids)
+
+# Edits inside this block are coalesced per workout and recomputed at block exit,
+# in the same transaction, so a failed recompute rolls the edits back instead of leaving stale stats
+@contextmanager
+def deferred_summaries():
+    if getattr(_state, 'pending', None) is not None:
+        # Nested block joins outer one
+        with transaction.atomic():
+            yield
+        return
+
+    _state.pending = {}
+    try:
+        with transaction.atomic():
+            yield
+            for summary in _state.pending.values():
+                summary.run()
+    finally:
+        _state.pending = None
+
+# Schedule summary recompute of workout
+# workout_exercise_ids: sessions whose sets changed, None recomputes whole workout
+# record_exercise_ids: exercises whose sessions were removed from workout, their records are rebuilt
+def mark_workout_dirty(workout, workout_exercise_ids=None, record_exercise_ids=()):
+    pending = getattr(_state, 'pending', None)
+    summary = pending.get(workout.id) if pending is not None else None
+    if summary is None:
+        summary = PendingSummary(workout)
+        if pending is not None:
+            pending[workout.id] = summary
+
+    if workout_exercise_ids is None:
+        summary.full = True
+    else:
+        summary.workout_exercise_ids.update(workout_exercise_ids)
+    summary.record_exercise_ids.update(record_exercise_ids)
+
+    if pending is None:
+        # Outside deferred block every call is recomputed right away
+        summary.run()
+    return summary
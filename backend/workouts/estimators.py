@@ -0,0 +1,79 @@
+# One-rep max estimators, selected per user (User.one_rm_formula)
+# Every formula exists as Python function, used for sets at write time, and as database expression
+# with the same result, used to backfill stored estimates when user switches formula
+# Mobile app mirrors these formulas in utils/calculations.ts for sets which are not saved yet
+from django.db.models import Case, When, Value, FloatField
+from django.db.models.functions import Cast, Coalesce, Least, Power
+from django.db.models.lookups import Exact, LessThanOrEqual
+from users.models import DEFAULT_FORMULA # Formulas users can choose are listed next to User model
+
+class Estimator:
+    def __init__(self, estimate, expression):
+        self.estimate = estimate # (weight, reps, rpe) -> 1RM, reps > 0, rpe None when not recorded
+        self.expression = expression # Same as estimate over float expressions
+
+ESTIMATORS = {}
+
+def register(name, estimate, expression):
+    ESTIMATORS[name] = Estimator(estimate, expression)
+
+# Epley, single rep is the 1RM itself
+register(
+    'epley',
+    lambda weight, reps, rpe: weight if reps == 1 else weight * (1 + reps / 30),
+    lambda weight, reps, rpe: Case(
+        When(Exact(reps, 1.0), then=weight),
+        default=weight * (1 + reps / 30),
+        output_field=FloatField(),
+    ),
+)
+
+# Brzycki, undefined from 37 reps on, so reps are capped at 36
+register(
+    'brzycki',
+    lambda weight, reps, rpe: weight * 36 / (37 - min(reps, 36)),
+    lambda weight, reps, rpe: weight * 36 / (37 - Least(reps, Value(36.0))),
+)
+
+register(
+    'lombardi',
+    lambda weight, reps, rpe: weight * reps ** 0.1,
+    lambda weight, reps, rpe: weight * Power(reps, Value(0.1)),
+)
+
+# Epley over reps to failure: reps done plus reps in reserve (10 - RPE), sets without RPE count as RPE 10
+def _rpe_estimate(weight, reps, rpe):
+    reps_to_failure = reps + 10 - (10 if rpe is None else rpe)
+    return weight if reps_to_failure <= 1 else weight * (1 + reps_to_failure / 30)
+
+def _rpe_expression(weight, reps, rpe):
+    reps_to_failure = reps + 10 - Coalesce(rpe, Value(10.0))
+    return Case(
+        When(LessThanOrEqual(reps_to_failure, 1.0), then=weight),
+        default=weight * (1 + reps_to_failure / 30),
+        output_field=FloatField(),
+    )
+
+register('rpe', _rpe_estimate, _rpe_expression)
+
+def get_estimator(formula):
+    return ESTIMATORS.get(formula) or ESTIMATORS[DEFAULT_FORMULA]
+
+# Estimated 1RM of one set, 0 for sets without reps
+def estimate_1rm(formula, weight, reps, rpe=None):
+    if not reps:
+        return 0.0
+    return get_estimator(formula).estimate(float(weight), reps, None if rpe is None else float(rpe))
+
+# Estimated 1RM of set as database expression, same result as estimate_1rm
+# prefix: path to set from queried model, e.g. 'sets__'
+def estimate_1rm_expression(formula, prefix=''):
+    return Case(
+        When(**{f'{prefix}reps': 0}, then=Value(0.0)),
+        default=get_estimator(formula).expression(
+            Cast(f'{prefix}weight', FloatField()),
+            Cast(f'{prefix}reps', FloatField()),
+            Cast(f'{prefix}rpe', FloatField()),
+        ),
+        output_field=FloatField(),
+    )
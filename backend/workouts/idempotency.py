@@ -0,0 +1,74 @@
+# Idempotency-Key support for write endpoints
+# First request with a key runs in one transaction with storing its response,
+# retries with the same key get the stored response back after one indexed lookup
+import hashlib
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import exceptions, status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+def _sha256(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def _replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return Response(
+            {'detail': f"{HEADER} was already used for a different request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+# Decorator of viewset handlers, requests without the header run as before
+# Concurrent retry waits on unique (user, key) index until first request commits, then gets its response
+# Failed requests (exceptions, 5xx) are rolled back together with their key, so they can be retried
+def idempotent(handler):
+    @wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        client_key = request.headers.get(HEADER)
+        if not client_key:
+            return handler(self, request, *args, **kwargs)
+        if len(client_key) > MAX_KEY_LENGTH:
+            raise exceptions.ValidationError({HEADER: f"Must be at most {MAX_KEY_LENGTH} characters."})
+
+        fingerprint = _sha256(request.method, request.get_full_path(), request.body)
+        with transaction.atomic():
+            # Existing row stays locked until commit, so two retries of expired key cannot both run handler
+            record, created = IdempotencyKey.objects.select_for_update().get_or_create(
+                user=request.user, key=_sha256(client_key), defaults={'fingerprint': fingerprint})
+            if not created and record.created_at < timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL):
+                # Expired key not pruned yet counts as new one
+                # (auto_now_add only fills created_at on insert, assigned value is saved by update)
+                record.fingerprint = fingerprint
+                record.status_code = None
+                record.response = None
+                record.created_at = timezone.now()
+                created = True
+            if not created:
+                return _replay(record, fingerprint)
+
+            response = handler(self, request, *args, **kwargs)
+            if response.status_code >= 500:
+                record.delete()
+                return response
+            record.status_code = response.status_code
+            record.response = response.data
+            record.save()
+        return response
+    return wrapper
+
+# Delete keys older than IDEMPOTENCY_KEY_TTL, returns number of deleted keys
+def prune_idempotency_keys():
+    expired = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=expired).delete()
+    return deleted
@@ -0,0 +1,206 @@
+import json
+import platform
+import subprocess
+import time
+from datetime import datetime
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from exercises.models import Exercise
+from workouts.cache import bump_stats_version
+from workouts.models import Workout, WorkoutExercise
+from workouts.services import recalculate_user_history
+from workouts.synthetic import generate_history
+
+EXERCISES_PER_WORKOUT = 5
+SETS_PER_EXERCISE = 4
+
+class _Rollback(Exception):
+    pass
+
+# Nearest-rank percentile of sorted values
+def _percentile(values, percent):
+    index = max(0, min(len(values) - 1, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Command(BaseCommand):
+    help = ('Measure latency percentiles and query counts of workouts API endpoints '
+            'on generated training history. Nothing is saved unless --keep is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5, help='Number of generated users')
+        parser.add_argument('--years', type=float, default=2, help='Years of history per user')
+        parser.add_argument('--per-week', type=int, default=3, help='Workouts per week')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per endpoint')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of generated data')
+        parser.add_argument('--output', help='Write results as JSON to this file')
+        parser.add_argument('--compare', help='Print p50 and query changes against earlier JSON results')
+        parser.add_argument('--keep', action='store_true', help='Commit generated users instead of rolling back')
+
+    def handle(self, *args, **options):
+        self.options = options
+        exercise_ids = list(Exercise.objects.order_by('id').values_list('id', flat=True))
+        if len(exercise_ids) < EXERCISES_PER_WORKOUT:
+            raise CommandError("Import exercises first (manage.py import_exercises).")
+
+        try:
+            with transaction.atomic():
+                results = self._run(exercise_ids)
+                if not options['keep']:
+                    raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(f"{'endpoint':<16} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'queries':>8}")
+        for name, result in results['endpoints'].items():
+            self.stdout.write(
+                f"{name:<16} {result['p50_ms']:>8} {result['p90_ms']:>8} {result['p99_ms']:>8} "
+                f"{result['max_ms']:>8} {result['queries_max']:>8}"
+            )
+        if options['compare']:
+            self._compare(options['compare'], results)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def _compare(self, path, results):
+        with open(path) as file:
+            baseline = json.load(file)
+        self.stdout.write(f"Compared with {baseline.get('commit') or path}:")
+        for name, result in results['endpoints'].items():
+            before = baseline['endpoints'].get(name)
+            if before is None:
+                continue
+            change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+            self.stdout.write(
+                f"{name:<16} p50 {before['p50_ms']} -> {result['p50_ms']} ms ({change:+.0f}%), "
+                f"queries {before['queries_max']} -> {result['queries_max']}"
+            )
+
+    def _run(self, exercise_ids):
+        options = self.options
+        workouts_count = int(options['years'] * 52 * options['per_week'])
+        started = time.monotonic()
+        users = []
+        for i in range(options['users']):
+            user = get_user_model().objects.create_user(
+                username=f"benchmark_{i}", email=f"benchmark_{i}@gymtracker.local")
+            generate_history(
+                user, exercise_ids, workouts_count * EXERCISES_PER_WORKOUT * SETS_PER_EXERCISE,
+                days=int(options['years'] * 365), exercises_per_workout=EXERCISES_PER_WORKOUT,
+                sets_per_exercise=SETS_PER_EXERCISE, seed=options['seed'] + i)
+            recalculate_user_history(user)
+            users.append(user)
+        self.stdout.write(f"Generated {len(users)} users with {workouts_count} workouts each "
+                          f"in {time.monotonic() - started:.1f}s")
+
+        self.clients = {}
+        for user in users:
+            client = APIClient()
+            client.force_authenticate(user)
+            self.clients[user.id] = client
+
+        endpoints = {
+            'create': self._create,
+            'update': self._update,
+            'list': lambda user: self._get(user, '/api/workouts/'),
+            'list-summary': lambda user: self._get(user, '/api/workouts/?summary=true'),
+            'detail': lambda user: self._get(user, f"/api/workouts/{self._latest_workout(user)}/"),
+            'weekly-stats': self._weekly_stats,
+            'volume-chart': lambda user: self._get(user, '/api/workouts/volume-chart/'),
+            'history': lambda user: self._get(user, f"/api/exercises/{self._trained_exercise(user)}/history/"),
+            'records': lambda user: self._get(user, f"/api/exercises/{self._trained_exercise(user)}/records/"),
+        }
+        self.exercise_ids = exercise_ids
+        results = {name: self._measure(users, request) for name, request in endpoints.items()}
+
+        return {
+            'commit': _git_commit(),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'options': {key: options[key] for key in ('users', 'years', 'per_week', 'requests', 'seed')},
+            'workouts_per_user': workouts_count,
+            'sets_per_user': workouts_count * EXERCISES_PER_WORKOUT * SETS_PER_EXERCISE,
+            'endpoints': results,
+        }
+
+    # Run request for users in turn, time setup of request is not measured
+    def _measure(self, users, request):
+        timings = []
+        queries = []
+        for i in range(self.options['requests']):
+            user = users[i % len(users)]
+            prepared = request(user)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = prepared()
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                raise CommandError(f"{response.status_code} from {response.request['PATH_INFO']}: {response.content[:200]}")
+            queries.append(len(captured))
+
+        timings.sort()
+        return {
+            'p50_ms': round(_percentile(timings, 50), 2),
+            'p90_ms': round(_percentile(timings, 90), 2),
+            'p99_ms': round(_percentile(timings, 99), 2),
+            'max_ms': round(timings[-1], 2),
+            'queries_median': sorted(queries)[len(queries) // 2],
+            'queries_max': max(queries),
+        }
+
+    def _get(self, user, path):
+        return lambda: self.clients[user.id].get(path)
+
+    # Stats cache is cleared first, so the computation is measured
+    # (bumped directly, benchmark transaction is never committed)
+    def _weekly_stats(self, user):
+        bump_stats_version(user.id)
+        return self._get(user, '/api/workouts/weekly-stats/')
+
+    def _latest_workout(self, user):
+        return Workout.objects.filter(user=user).latest('start_time').id
+
+    def _trained_exercise(self, user):
+        return WorkoutExercise.objects.filter(workout__user=user).values_list('exercise_id', flat=True).first()
+
+    def _workout_payload(self):
+        return {
+            'name': 'Benchmark',
+            'start_time': timezone.now().isoformat(),
+            'exercises': [
+                {
+                    'exercise_id': exercise_id,
+                    'order': i,
+                    'sets': [{'weight': 60 + j * 5, 'reps': 8, 'order': j} for j in range(SETS_PER_EXERCISE)],
+                }
+                for i, exercise_id in enumerate(self.exercise_ids[:EXERCISES_PER_WORKOUT])
+            ],
+        }
+
+    def _create(self, user):
+        return lambda: self.clients[user.id].post('/api/workouts/', self._workout_payload(), format='json')
+
+    # Every set of latest workout gets one more rep
+    def _update(self, user):
+        client = self.clients[user.id]
+        workout_id = self._latest_workout(user)
+        payload = client.get(f'/api/workouts/{workout_id}/').json()
+        for exercise in payload['exercises']:
+            exercise['exercise_id'] = exercise['exercise_details']['id']
+            for one_set in exercise['sets']:
+                one_set['reps'] += 1
+        return lambda: client.put(f'/api/workouts/{workout_id}/', payload, format='json')
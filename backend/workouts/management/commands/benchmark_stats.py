@@ -0,0 +1,89 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import override_settings
+from exercises.models import Exercise
+from workouts.models import Workout, WorkoutSet
+from workouts.services import (
+    get_weekly_stats, get_workouts_volume, calculate_workout_summary,
+    recalculate_user_history, aggregate_session_stats, get_muscle_stats, get_exercise_progression,
+)
+from workouts.columnar import UserHistory, get_user_history, np
+from workouts.synthetic import generate_history
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+class _Rollback(Exception):
+    pass
+
+def _sql_session_stats(user):
+    return {
+        id: (round(volume, 1), round(best_1rm, 1))
+        for id, volume, best_1rm in WorkoutSet.objects.filter(workout_exercise__workout__user=user)
+        .values('workout_exercise_id')
+        .annotate(**aggregate_session_stats())
+        .values_list('workout_exercise_id', 'sets_volume', 'sets_1rm')
+        .order_by()
+    }
+
+class Command(BaseCommand):
+    help = 'Measure latency of statistics services for users with 1k/10k/100k sets. Nothing is saved.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sizes', nargs='*', type=int, default=DEFAULT_SIZES, help='Sets per user')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of every measurement')
+
+    def handle(self, *args, **options):
+        exercise_ids = list(Exercise.objects.values_list('id', flat=True)[:50])
+        if len(exercise_ids) < 5:
+            raise CommandError("Import exercises first (manage.py import_exercises).")
+        self.repeat = options['repeat']
+
+        self.stdout.write(f"{'sets':>8} {'measurement':<30} {'median ms':>10} {'max ms':>10}")
+        for size in options['sizes']:
+            try:
+                # Generated history is rolled back at the end
+                with transaction.atomic():
+                    self._measure(size, exercise_ids)
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+    def _measure(self, size, exercise_ids):
+        user = get_user_model().objects.create_user(
+            username='benchmark_user', email='benchmark@gymtracker.local')
+        generate_history(user, exercise_ids, size)
+        recalculate_user_history(user)
+        workout = Workout.objects.filter(user=user).latest('start_time')
+
+        self._time(size, 'session stats', lambda: _sql_session_stats(user))
+
+        # Database queries and rollups, as without NumPy
+        with override_settings(COLUMNAR_CACHE_USERS=0):
+            self._time(size, 'weekly stats', lambda: get_weekly_stats(user))
+            self._time(size, 'volume chart (month)', lambda: get_workouts_volume(user))
+            self._time(size, 'volume chart (week)', lambda: get_workouts_volume(user, granularity='week'))
+            self._time(size, 'muscle stats (90 days)', lambda: get_muscle_stats(user, 90))
+        if np is not None:
+            self._time(size, 'columnar load', lambda: UserHistory.load(user.id, None))
+            get_user_history(user.id)
+            self._time(size, 'weekly stats (columnar)', lambda: get_weekly_stats(user))
+            self._time(size, 'volume chart month (columnar)', lambda: get_workouts_volume(user))
+            self._time(size, 'volume chart week (columnar)', lambda: get_workouts_volume(user, granularity='week'))
+            self._time(size, 'muscle stats (columnar)', lambda: get_muscle_stats(user, 90))
+        self._time(size, 'exercise progression', lambda: get_exercise_progression(user, exercise_ids[0]))
+        self._time(size, 'progression (weekly max)', lambda: get_exercise_progression(user, exercise_ids[0], downsampling='week'))
+        self._time(size, 'workout summary', lambda: calculate_workout_summary(workout))
+        self._time(size, 'recalculate history', lambda: recalculate_user_history(user, dry_run=True))
+
+    # Run compute repeat times, print median and max wall time, return last result
+    def _time(self, size, name, compute):
+        timings = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            result = compute()
+            timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(f"{size:>8} {name:<30} {statistics.median(timings):>10.2f} {max(timings):>10.2f}")
+        return result
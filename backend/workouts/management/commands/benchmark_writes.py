@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from exercises.models import Exercise
+from workouts.views import WorkoutViewSet
+
+# Workout sizes measured by default (exercises x sets)
+DEFAULT_SIZES = ['1x1', '3x3', '6x4', '10x5']
+
+class _Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'Count database round trips of workout create and update for different workout sizes. Nothing is saved.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sizes', nargs='*', default=DEFAULT_SIZES, help='Workout sizes as EXERCISESxSETS')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'size':>8} {'create':>8} {'update':>8}")
+        for size in options['sizes']:
+            exercises_count, sets_count = (int(x) for x in size.split('x'))
+            try:
+                # Everything runs in one transaction which is rolled back at the end
+                with transaction.atomic():
+                    create, update = self._measure(exercises_count, sets_count)
+                    raise _Rollback
+            except _Rollback:
+                pass
+            self.stdout.write(f"{size:>8} {create:>8} {update:>8}")
+
+    def _measure(self, exercises_count, sets_count):
+        user = get_user_model().objects.create_user(
+            username='benchmark_user', email='benchmark@gymtracker.local')
+        exercise_ids = list(Exercise.objects.values_list('id', flat=True)[:exercises_count])
+        for i in range(len(exercise_ids), exercises_count):
+            exercise_ids.append(Exercise.objects.create(name=f"Benchmark exercise {i}").id)
+
+        payload = {
+            'name': 'Benchmark',
+            'start_time': timezone.now().isoformat(),
+            'exercises': [
+                {
+                    'exercise_id': exercise_id,
+                    'order': i,
+                    'sets': [{'weight': 60 + j * 5, 'reps': 8, 'order': j} for j in range(sets_count)],
+                }
+                for i, exercise_id in enumerate(exercise_ids)
+            ],
+        }
+        factory = APIRequestFactory()
+
+        request = factory.post('/api/workouts/', payload, format='json')
+        force_authenticate(request, user=user)
+        with CaptureQueriesContext(connection) as create_queries:
+            response = WorkoutViewSet.as_view({'post': 'create'})(request)
+        workout_id = response.data['id']
+
+        # Edit every set of the stored workout in one request
+        detail = WorkoutViewSet.as_view({'get': 'retrieve'})
+        request = factory.get(f'/api/workouts/{workout_id}/')
+        force_authenticate(request, user=user)
+        payload = detail(request, pk=workout_id).data
+        for exercise in payload['exercises']:
+            exercise['exercise_id'] = exercise['exercise_details']['id']
+            for one_set in exercise['sets']:
+                one_set['reps'] += 1
+
+        request = factory.put(f'/api/workouts/{workout_id}/', payload, format='json')
+        force_authenticate(request, user=user)
+        with CaptureQueriesContext(connection) as update_queries:
+            WorkoutViewSet.as_view({'put': 'update'})(request, pk=workout_id)
+
+        return len(create_queries), len(update_queries)
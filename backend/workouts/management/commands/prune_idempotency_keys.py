@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from workouts.idempotency import prune_idempotency_keys
+
+class Command(BaseCommand):
+    help = 'Delete stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL.'
+
+    def handle(self, *args, **options):
+        deleted = prune_idempotency_keys()
+        self.stdout.write(self.style.SUCCESS(f"Done! Deleted {deleted} expired idempotency keys"))
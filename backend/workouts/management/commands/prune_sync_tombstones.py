@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from workouts.services import prune_sync_tombstones
+
+class Command(BaseCommand):
+    help = 'Delete deleted workout records kept for delta sync older than SYNC_TOMBSTONE_TTL.'
+
+    def handle(self, *args, **options):
+        deleted = prune_sync_tombstones()
+        self.stdout.write(self.style.SUCCESS(f"Done! Deleted {deleted} expired sync tombstones"))
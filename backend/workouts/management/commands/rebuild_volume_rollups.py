@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.contrib.auth import get_user_model
+from workouts.services import rebuild_daily_volume
+
+class Command(BaseCommand):
+    help = 'Rebuild daily volume rollups used by the volume chart from workout history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Rebuild only for user with given id')
+
+    def handle(self, *args, **options):
+        # Users with rollups but no workouts left get their stale rows dropped
+        users = get_user_model().objects.filter(
+            Q(workouts__isnull=False) | Q(daily_volumes__isnull=False)
+        ).distinct()
+        if options['user']:
+            users = users.filter(id=options['user'])
+
+        count = 0
+        for user in users:
+            rebuild_daily_volume(user)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Done! Rebuilt volume rollups for {count} users"))
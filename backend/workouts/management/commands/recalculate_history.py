@@ -1,24 +1,114 @@
-from django.core.management.base import BaseCommand
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.utils import timezone
 from workouts.models import Workout
-from workouts.services import calculate_workout_summary
-from django.apps import apps
+from workouts.services import recalculate_user_history
+
+DEFAULT_CHECKPOINT = settings.BASE_DIR / '.recalculate_history.json'
+
+# Runs in worker process, each worker opens its own database connection
+def _init_worker():
+    django.setup()
+
+def _recalculate_user(user_id, since, dry_run):
+    user = get_user_model().objects.get(id=user_id)
+    return user_id, recalculate_user_history(user, since=since, dry_run=dry_run)
 
 class Command(BaseCommand):
-    help = 'Recalculate workout summaries and personal records for all workouts.'
+    help = 'Recalculate set 1RM estimates, workout summaries, personal records and volume rollups, user by user.'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', help='Only given user id (can be repeated)')
+        parser.add_argument('--since', help='Only workouts starting on or after date YYYY-MM-DD')
+        parser.add_argument('--dry-run', action='store_true', help='Count changes without saving them')
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+        parser.add_argument('--checkpoint', default=str(DEFAULT_CHECKPOINT), help='File storing finished users')
+        parser.add_argument('--restart', action='store_true', help='Ignore existing checkpoint and start over')
 
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since_date = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("--since must be a date in format YYYY-MM-DD")
+            since = timezone.make_aware(datetime.combine(since_date, datetime.min.time()))
+        dry_run = options['dry_run']
 
-        # Get all workouts ordered by date
-        workouts = Workout.objects.all().order_by('start_time')
-        count = workouts.count()
-        
-        if count == 0:
+        # Workouts to process per user, used for progress and ETA
+        workouts = Workout.objects.all()
+        if options['user']:
+            workouts = workouts.filter(user_id__in=options['user'])
+        if since is not None:
+            workouts = workouts.filter(start_time__gte=since)
+        user_workouts = dict(
+            workouts.values('user_id').annotate(count=Count('id')).order_by('user_id').values_list('user_id', 'count')
+        )
+
+        checkpoint = Path(options['checkpoint'])
+        run_key = {'users': options['user'], 'since': options['since']}
+        done = set()
+        if not dry_run and not options['restart'] and checkpoint.exists():
+            state = json.loads(checkpoint.read_text())
+            if state.get('run') == run_key:
+                done = set(state['done'])
+                self.stdout.write(f"Resuming from checkpoint, {len(done)} users already done.")
+
+        pending = [user_id for user_id in user_workouts if user_id not in done]
+        total = sum(user_workouts[user_id] for user_id in pending)
+        if not pending:
+            self.stdout.write("Nothing to recalculate.")
             return
 
-        self.stdout.write(f"Found {count} workouts. Starting recalculation...")
+        self.stdout.write(f"Found {total} workouts of {len(pending)} users. Starting recalculation...")
+
+        started = time.monotonic()
+        processed = 0
+        changed = {'workouts_changed': 0, 'exercises_changed': 0, 'sets_changed': 0}
+
+        for user_id, result in self._run(pending, since, dry_run, options['workers']):
+            processed += result['workouts']
+            for key in changed:
+                changed[key] += result[key]
+            if not dry_run:
+                done.add(user_id)
+                checkpoint.write_text(json.dumps({'run': run_key, 'done': sorted(done)}))
+
+            elapsed = time.monotonic() - started
+            rate = processed / elapsed if elapsed else 0
+            eta = timedelta(seconds=int((total - processed) / rate)) if rate else '?'
+            self.stdout.write(f"{processed}/{total} workouts, {rate:.1f} workouts/s, ETA {eta}")
+
+        if not dry_run:
+            checkpoint.unlink(missing_ok=True)
+
+        prefix = "Dry run, would change" if dry_run else "Done! Changed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {changed['workouts_changed']} workouts, {changed['exercises_changed']} exercises "
+            f"and {changed['sets_changed']} set estimates "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
+
+    # Yield (user_id, result) as users finish
+    def _run(self, user_ids, since, dry_run, workers):
+        if workers <= 1:
+            for user_id in user_ids:
+                yield _recalculate_user(user_id, since, dry_run)
+            return
 
-        for workout in workouts:
-            calculate_workout_summary(workout)
-            
-        self.stdout.write(self.style.SUCCESS(f"Done! Recalculated {count} workouts"))
\ No newline at end of file
+        # Forked workers must not share parent connection
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            futures = [executor.submit(_recalculate_user, user_id, since, dry_run) for user_id in user_ids]
+            for future in as_completed(futures):
+                yield future.result()
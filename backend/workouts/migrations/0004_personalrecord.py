@@ -0,0 +1,77 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Fill records table from existing workout history
+def backfill_records(apps, schema_editor):
+    WorkoutExercise = apps.get_model('workouts', 'WorkoutExercise')
+    WorkoutSet = apps.get_model('workouts', 'WorkoutSet')
+    PersonalRecord = apps.get_model('workouts', 'PersonalRecord')
+
+    records = {}
+    sessions = WorkoutExercise.objects.select_related('workout')\
+        .order_by('-session_1rm', 'workout__start_time')
+    for session in sessions.iterator():
+        key = (session.workout.user_id, session.exercise_id)
+        record = records.get(key)
+        if record is None:
+            records[key] = PersonalRecord(
+                user_id=key[0],
+                exercise_id=key[1],
+                best_1rm=session.session_1rm,
+                best_1rm_date=session.workout.start_time,
+                best_1rm_exercise_id=session.id,
+            )
+        elif not record.previous_1rm:
+            record.previous_1rm = session.session_1rm
+
+    sets = WorkoutSet.objects.select_related('workout_exercise__workout')\
+        .order_by('-weight', '-reps', 'workout_exercise__workout__start_time')
+    seen = set()
+    for one_set in sets.iterator():
+        key = (one_set.workout_exercise.workout.user_id, one_set.workout_exercise.exercise_id)
+        if key in seen:
+            continue
+        seen.add(key)
+        record = records[key]
+        record.max_weight = one_set.weight
+        record.max_weight_reps = one_set.reps
+        record.max_weight_date = one_set.workout_exercise.workout.start_time
+        record.max_weight_exercise_id = one_set.workout_exercise_id
+
+    PersonalRecord.objects.bulk_create(records.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercises', '0003_remove_exercise_equipment_old_and_more'),
+        ('workouts', '0003_remove_workoutset_workouts_wo_one_rep_9e779d_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonalRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('best_1rm', models.FloatField(default=0.0)),
+                ('best_1rm_date', models.DateTimeField(blank=True, null=True)),
+                ('previous_1rm', models.FloatField(default=0.0)),
+                ('max_weight', models.DecimalField(decimal_places=2, default=0, max_digits=6)),
+                ('max_weight_reps', models.PositiveIntegerField(default=0)),
+                ('max_weight_date', models.DateTimeField(blank=True, null=True)),
+                ('best_1rm_exercise', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='workouts.workoutexercise')),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='personal_records', to='exercises.exercise')),
+                ('max_weight_exercise', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='workouts.workoutexercise')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='personal_records', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'exercise'), name='unique_user_exercise_record')],
+            },
+        ),
+        migrations.RunPython(backfill_records, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:35
+
+import django.db.models.deletion
+from django.conf import settings
+from collections import defaultdict
+from django.db import migrations, models
+
+
+# Fill rollups from existing workout history (days in UTC)
+def backfill_daily_volume(apps, schema_editor):
+    Workout = apps.get_model('workouts', 'Workout')
+    WorkoutExercise = apps.get_model('workouts', 'WorkoutExercise')
+    Exercise = apps.get_model('exercises', 'Exercise')
+    DailyVolume = apps.get_model('workouts', 'DailyVolume')
+
+    exercise_muscles = defaultdict(set)
+    for relation in (Exercise.primary_muscles.through, Exercise.secondary_muscles.through):
+        for exercise_id, name in relation.objects.values_list('exercise_id', 'muscle__name'):
+            exercise_muscles[exercise_id].add(name.lower().strip())
+
+    volumes = defaultdict(float)
+    workout_ids = defaultdict(set)
+    for workout in Workout.objects.values('id', 'user_id', 'start_time', 'total_volume').iterator():
+        key = (workout['user_id'], workout['start_time'].date(), '')
+        volumes[key] += workout['total_volume']
+        workout_ids[key].add(workout['id'])
+
+    sessions = WorkoutExercise.objects.values_list(
+        'workout_id', 'workout__user_id', 'workout__start_time', 'exercise_id', 'session_volume')
+    for workout_id, user_id, start_time, exercise_id, session_volume in sessions.iterator():
+        for muscle in exercise_muscles.get(exercise_id, ()):
+            key = (user_id, start_time.date(), muscle)
+            volumes[key] += session_volume
+            workout_ids[key].add(workout_id)
+
+    DailyVolume.objects.bulk_create([
+        DailyVolume(user_id=user_id, day=day, muscle=muscle, volume=round(volume, 1),
+                    workouts_count=len(workout_ids[(user_id, day, muscle)]))
+        for (user_id, day, muscle), volume in volumes.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0004_personalrecord'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyVolume',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('muscle', models.CharField(blank=True, default='', max_length=50)),
+                ('volume', models.FloatField(default=0.0)),
+                ('workouts_count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_volumes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'muscle', 'day'), name='unique_user_muscle_day')],
+            },
+        ),
+        migrations.RunPython(backfill_daily_volume, migrations.RunPython.noop),
+    ]
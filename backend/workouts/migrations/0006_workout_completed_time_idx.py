@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0005_dailyvolume'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='workout',
+            index=models.Index(condition=models.Q(('status', 'completed')), fields=['user', 'start_time'], include=('total_volume',), name='workout_completed_time_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:58
+
+import django.db.models.deletion
+import workouts.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0006_workout_completed_time_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedWorkout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('workout_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('sync_txid', models.BigIntegerField(db_default=workouts.models.CurrentTransactionId())),
+            ],
+        ),
+        migrations.AddField(
+            model_name='workout',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='workout',
+            name='sync_txid',
+            field=models.BigIntegerField(db_default=workouts.models.CurrentTransactionId()),
+        ),
+        migrations.AddIndex(
+            model_name='workout',
+            index=models.Index(fields=['user', 'sync_txid', 'id'], name='workout_sync_idx'),
+        ),
+        migrations.AddField(
+            model_name='deletedworkout',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deleted_workouts', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='deletedworkout',
+            index=models.Index(fields=['user', 'sync_txid'], name='workouts_de_user_id_da8ed4_idx'),
+        ),
+    ]
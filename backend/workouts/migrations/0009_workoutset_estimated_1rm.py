@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-18 21:12
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import Case, When, Value, FloatField
+from django.db.models.functions import Cast
+
+
+# Existing sets get Epley estimate, default formula of every user
+def backfill_estimated_1rm(apps, schema_editor):
+    WorkoutSet = apps.get_model('workouts', 'WorkoutSet')
+    weight = Cast('weight', FloatField())
+    WorkoutSet.objects.update(estimated_1rm=Case(
+        When(reps=0, then=Value(0.0)),
+        When(reps=1, then=weight),
+        default=weight * (1 + Cast('reps', FloatField()) / 30),
+        output_field=FloatField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0008_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workoutset',
+            name='estimated_1rm',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='workoutset',
+            name='rpe',
+            field=models.DecimalField(blank=True, decimal_places=1, max_digits=3, null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(10)]),
+        ),
+        migrations.AddIndex(
+            model_name='workoutset',
+            index=models.Index(fields=['workout_exercise', '-estimated_1rm'], name='set_session_1rm_idx'),
+        ),
+        migrations.RunPython(backfill_estimated_1rm, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,15 @@
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.validators import MinValueValidator, MaxValueValidator
 from exercises.models import Exercise  # Import exercise model
 
+# Id of transaction running the statement, used to read changes for delta sync in commit-safe order
+# Any transaction committing after a snapshot was taken has id at or above the snapshot xmin
+class CurrentTransactionId(models.Func):
+    template = 'pg_current_xact_id()::text::bigint'
+    output_field = models.BigIntegerField()
+
 # One training session
 class Workout(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='workouts') # Training belongs to a user
@@ -10,12 +18,30 @@ class Workout(models.Model):
     status = models.CharField(max_length=20, default='completed')  # e.g., completed, planned
     notes = models.TextField(blank=True, null=True)
     total_volume  = models.FloatField(default=0)  # Total volume lifted in the workout
+    # Changed on every edit of workout or its exercises and sets
+    updated_at = models.DateTimeField(auto_now=True)
+    # Transaction of last edit, drives delta sync
+    sync_txid = models.BigIntegerField(db_default=CurrentTransactionId())
 
     class Meta:
         indexes = [
             models.Index(fields=['user', '-start_time']),
+            models.Index(fields=['user', 'sync_txid', 'id'], name='workout_sync_idx'),
+            # Calendar and stats of finished workouts, covers total_volume for index-only scans
+            models.Index(
+                fields=['user', 'start_time'],
+                include=['total_volume'],
+                condition=models.Q(status='completed'),
+                name='workout_completed_time_idx',
+            ),
         ]
 
+    def save(self, *args, **kwargs):
+        self.sync_txid = CurrentTransactionId()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = [*kwargs['update_fields'], 'sync_txid']
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.name} ({self.start_time.date()})"
 
@@ -38,9 +64,97 @@ class WorkoutSet(models.Model):
     weight = models.DecimalField(max_digits=6, decimal_places=2, default=0) # Weight of the set
     reps = models.PositiveIntegerField()
     order = models.PositiveIntegerField(default=0)
+    # Rate of perceived exertion (1-10), used by RPE based 1RM formula
+    rpe = models.DecimalField(
+        max_digits=3, decimal_places=1, null=True, blank=True,
+        validators=[MinValueValidator(1), MaxValueValidator(10)])
+    # Estimated 1RM by formula of the user at write time (see estimators.py)
+    estimated_1rm = models.FloatField(default=0.0)
 
     class Meta:
         ordering = ['order']
         indexes = [
             models.Index(fields=['weight']),
+            # Best estimated set of session is first index entry
+            models.Index(fields=['workout_exercise', '-estimated_1rm'], name='set_session_1rm_idx'),
+        ]
+
+
+# Best results of a user for one exercise, kept up to date by calculate_workout_summary
+class PersonalRecord(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='personal_records')
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE, related_name='personal_records')
+
+    # Best estimated 1RM and the session it comes from
+    best_1rm = models.FloatField(default=0.0)
+    best_1rm_date = models.DateTimeField(null=True, blank=True)
+    best_1rm_exercise = models.ForeignKey(WorkoutExercise, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    previous_1rm = models.FloatField(default=0.0) # Record which was beaten by best_1rm
+
+    # Heaviest set and the session it comes from
+    max_weight = models.DecimalField(max_digits=6, decimal_places=2, default=0)
+    max_weight_reps = models.PositiveIntegerField(default=0)
+    max_weight_date = models.DateTimeField(null=True, blank=True)
+    max_weight_exercise = models.ForeignKey(WorkoutExercise, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'exercise'], name='unique_user_exercise_record'),
         ]
+
+    def __str__(self):
+        return f"{self.user} - {self.exercise.name}: {self.best_1rm}"
+
+
+# Volume trained by user on one day, per muscle (empty muscle means whole workouts)
+# Kept up to date by calculate_workout_summary, rebuilt with rebuild_volume_rollups command
+class DailyVolume(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_volumes')
+    day = models.DateField()
+    muscle = models.CharField(max_length=50, blank=True, default='') # Lowercase muscle name
+    volume = models.FloatField(default=0.0)
+    workouts_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'muscle', 'day'], name='unique_user_muscle_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.day} {self.muscle or 'all'}: {self.volume}"
+
+
+# Deleted workout kept for delta sync, so clients learn to drop their copy
+# Kept for SYNC_TOMBSTONE_TTL and removed by prune_sync_tombstones command
+class DeletedWorkout(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='deleted_workouts')
+    workout_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    sync_txid = models.BigIntegerField(db_default=CurrentTransactionId())
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'sync_txid']),
+        ]
+
+    def __str__(self):
+        return f"{self.user} deleted workout {self.workout_id}"
+
+
+# Stored response of write request sent with Idempotency-Key header, retries get it back
+# Keys expire after IDEMPOTENCY_KEY_TTL and are removed by prune_idempotency_keys command
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=64) # SHA-256 of client key
+    fingerprint = models.CharField(max_length=64) # SHA-256 of method, path and body
+    status_code = models.PositiveSmallIntegerField(null=True) # Empty while request is in progress
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_user_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.key[:12]}: {self.status_code}"
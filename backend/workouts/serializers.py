@@ -1,12 +1,40 @@
+from collections import defaultdict
+from django.db import transaction
 from rest_framework import serializers
 from .models import Workout, WorkoutExercise, WorkoutSet
-from exercises.serializers import ExerciseListSerializer 
-class WorkoutSetSerializer(serializers.ModelSerializer):
+from .estimators import DEFAULT_FORMULA, estimate_1rm
+from exercises.models import Exercise
+from exercises.serializers import ExerciseListSerializer
+
+# Set fields written by clients, estimated_1rm is computed from them
+SET_FIELDS = ('weight', 'reps', 'rpe', 'order')
+
+# Sets get estimated 1RM by formula of the user writing them (owner of the workout)
+class EstimateSetsMixin:
+    def _estimate(self, weight, reps, rpe):
+        request = self.context.get('request')
+        formula = request.user.one_rm_formula if request else DEFAULT_FORMULA
+        return estimate_1rm(formula, weight, reps, rpe)
+
+class WorkoutSetSerializer(EstimateSetsMixin, serializers.ModelSerializer):
     # Field calculated (read-only)
 
     class Meta:
         model = WorkoutSet
-        fields = ['id', 'weight', 'reps', 'order']
+        fields = ['id', 'weight', 'reps', 'rpe', 'estimated_1rm', 'order']
+        read_only_fields = ['estimated_1rm']
+
+    def create(self, validated_data):
+        validated_data['estimated_1rm'] = self._estimate(
+            validated_data.get('weight', 0), validated_data['reps'], validated_data.get('rpe'))
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        validated_data['estimated_1rm'] = self._estimate(
+            validated_data.get('weight', instance.weight),
+            validated_data.get('reps', instance.reps),
+            validated_data.get('rpe', instance.rpe))
+        return super().update(instance, validated_data)
 
 class WorkoutExerciseSerializer(serializers.ModelSerializer):
     sets = WorkoutSetSerializer(many=True)
@@ -20,37 +48,267 @@ class WorkoutExerciseSerializer(serializers.ModelSerializer):
         model = WorkoutExercise
         fields = ['id', 'exercise_id', 'exercise_details', 'order', 'sets', 'session_1rm', 'session_volume']
 
+# Nested versions used inside WorkoutSerializer, id is writable so update can match existing rows
+class NestedWorkoutSetSerializer(WorkoutSetSerializer):
+    id = serializers.IntegerField(required=False)
+
+class NestedWorkoutExerciseSerializer(WorkoutExerciseSerializer):
+    id = serializers.IntegerField(required=False)
+    sets = NestedWorkoutSetSerializer(many=True)
+
 
 class WorkoutListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Workout
         fields = ['id', 'name', 'start_time', 'status', 'total_volume']
 
-class WorkoutSerializer(serializers.ModelSerializer):
-    exercises = WorkoutExerciseSerializer(many=True)
-    
+# List row with counts annotated by queryset
+class WorkoutListSummarySerializer(WorkoutListSerializer):
+    exercises_count = serializers.IntegerField(read_only=True)
+    sets_count = serializers.IntegerField(read_only=True)
+
+    class Meta(WorkoutListSerializer.Meta):
+        fields = WorkoutListSerializer.Meta.fields + ['exercises_count', 'sets_count']
+
+class WorkoutSerializer(EstimateSetsMixin, serializers.ModelSerializer):
+    exercises = NestedWorkoutExerciseSerializer(many=True)
+
     class Meta:
         model = Workout
         fields = ['id', 'name', 'start_time', 'status', 'notes','total_volume','exercises']
+
+    # Exercise ids whose personal records may be held by removed or changed sessions
+    affected_exercise_ids = ()
+
     def create(self, validated_data):
         # Create overwriting to handle nested creation
         exercises_data = validated_data.pop('exercises')
-        # Create Workout
-        workout = Workout.objects.create(**validated_data)
 
+        with transaction.atomic():
+            # Create Workout
+            workout = Workout(**validated_data)
+            workout_exercises, sets = self._build_exercises(workout, exercises_data)
+            workout.save()
+
+            # One insert for all exercises and one for all sets
+            WorkoutExercise.objects.bulk_create(workout_exercises)
+            WorkoutSet.objects.bulk_create(sets)
+
+        return workout
+
+    def update(self, instance, validated_data):
+        exercises_data = validated_data.pop('exercises', None)
+
+        with transaction.atomic():
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            if exercises_data is not None:
+                self._sync_exercises(instance, exercises_data)
+            instance.save()
+
+        return instance
+
+    # Build unsaved exercises and sets from payload
+    # Session stats and total volume are computed by calculate_workout_summary, which views run after save
+    def _build_exercises(self, workout, exercises_data):
+        workout_exercises = []
+        sets = []
         for ex_data in exercises_data:
             sets_data = ex_data.pop('sets')
-            exercise_id = ex_data.pop('exercise_id')
-            
-            # Add exercise to workout (WorkoutExercise)
-            workout_exercise = WorkoutExercise.objects.create(
-                workout=workout, 
-                exercise_id=exercise_id,
-                **ex_data
-            )
-
-            # Adding sets
+            ex_data.pop('id', None)
+            workout_exercise = WorkoutExercise(workout=workout, **ex_data)
+            self._set_estimates(sets_data)
+            workout_exercises.append(workout_exercise)
+
             for set_data in sets_data:
-                WorkoutSet.objects.create(workout_exercise=workout_exercise, **set_data)
+                set_data.pop('id', None)
+                sets.append(WorkoutSet(workout_exercise=workout_exercise, **set_data))
+        return workout_exercises, sets
+
+    # Estimates are saved with sets
+    def _set_estimates(self, sets_data):
+        for set_data in sets_data:
+            set_data['estimated_1rm'] = self._estimate(set_data.get('weight', 0), set_data['reps'], set_data.get('rpe'))
+
+    @staticmethod
+    def _require(data, keys, name):
+        missing = [key for key in keys if key not in data]
+        if missing:
+            raise serializers.ValidationError({'exercises': f"{name} requires {', '.join(missing)}."})
+
+    # Match payload against existing exercises and sets by id, then write differences in bulk
+    # Partial update may leave out exercise_id and sets of existing exercises and any field of existing sets
+    def _sync_exercises(self, workout, exercises_data):
+        existing = {we.id: we for we in workout.exercises.all()}
+        affected = set()
+
+        new_exercises_data = []
+        updated_exercises = []
+        new_sets = []
+        updated_sets = []
+        removed_set_ids = []
+
+        for ex_data in exercises_data:
+            workout_exercise = existing.pop(ex_data.get('id'), None)
+            if workout_exercise is None:
+                if ex_data.get('id') is not None:
+                    raise serializers.ValidationError(
+                        {'exercises': f"Exercise {ex_data['id']} does not belong to this workout."})
+                self._require(ex_data, ('exercise_id', 'sets'), "New exercise")
+                for set_data in ex_data['sets']:
+                    self._require(set_data, ('reps',), "New set")
+                new_exercises_data.append(ex_data)
+                continue
+
+            # Values missing in partial update are kept
+            exercise_id = ex_data.get('exercise_id', workout_exercise.exercise_id)
+            if workout_exercise.exercise_id != exercise_id:
+                affected.add(workout_exercise.exercise_id)
+            workout_exercise.exercise_id = exercise_id
+            workout_exercise.order = ex_data.get('order', workout_exercise.order)
+            updated_exercises.append(workout_exercise)
+            if 'sets' not in ex_data:
+                # Sets and session stats stay as they are
+                continue
+
+            existing_sets = {s.id: s for s in workout_exercise.sets.all()}
+            sets_data = [] # (existing set or None, values to write)
+            for set_data in ex_data['sets']:
+                set_id = set_data.pop('id', None)
+                if set_id is None:
+                    self._require(set_data, ('reps',), "New set")
+                    sets_data.append((None, set_data))
+                    continue
+                one_set = existing_sets.pop(set_id, None)
+                if one_set is None:
+                    raise serializers.ValidationError(
+                        {'exercises': f"Set {set_id} does not belong to exercise {workout_exercise.id}."})
+                sets_data.append((one_set, {field: getattr(one_set, field) for field in SET_FIELDS} | set_data))
+
+            self._set_estimates([set_data for _, set_data in sets_data])
+            for one_set, set_data in sets_data:
+                if one_set is None:
+                    new_sets.append(WorkoutSet(workout_exercise=workout_exercise, **set_data))
+                    continue
+                for attr, value in set_data.items():
+                    setattr(one_set, attr, value)
+                updated_sets.append(one_set)
+            removed_set_ids.extend(existing_sets)
+
+        # Exercises left in existing were removed from payload
+        affected.update(we.exercise_id for we in existing.values())
+        if existing:
+            WorkoutExercise.objects.filter(id__in=existing).delete()
+        if removed_set_ids:
+            WorkoutSet.objects.filter(id__in=removed_set_ids).delete()
+
+        created_exercises, created_sets = self._build_exercises(workout, new_exercises_data)
+        if created_exercises:
+            WorkoutExercise.objects.bulk_create(created_exercises)
+        if updated_exercises:
+            WorkoutExercise.objects.bulk_update(updated_exercises, ['exercise_id', 'order'])
+        if new_sets or created_sets:
+            WorkoutSet.objects.bulk_create(new_sets + created_sets)
+        if updated_sets:
+            WorkoutSet.objects.bulk_update(updated_sets, ['weight', 'reps', 'rpe', 'estimated_1rm', 'order'])
+
+        self.affected_exercise_ids = affected
+
+# Compact representation, exercise only by id, details are side-loaded once per response
+class CompactWorkoutExerciseSerializer(WorkoutExerciseSerializer):
+    exercise_id = serializers.IntegerField(read_only=True)
+
+    class Meta(WorkoutExerciseSerializer.Meta):
+        fields = ['id', 'exercise_id', 'order', 'sets', 'session_1rm', 'session_volume']
+
+class CompactWorkoutSerializer(WorkoutSerializer):
+    exercises = CompactWorkoutExerciseSerializer(many=True, read_only=True)
+
+# Deduplicated details of exercises used in workouts, keyed by exercise id
+def side_load_exercises(workouts):
+    exercise_ids = {we.exercise_id for workout in workouts for we in workout.exercises.all()}
+    exercises = Exercise.objects.with_details().filter(id__in=exercise_ids)
+    return {exercise['id']: exercise for exercise in ExerciseListSerializer(exercises, many=True).data}
+
+# One operation of batch set edit
+# create needs workout_exercise_id and reps, update and delete need set id
+class SetOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['create', 'update', 'delete'])
+    id = serializers.IntegerField(required=False)
+    workout_exercise_id = serializers.IntegerField(required=False)
+    weight = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=0, required=False)
+    reps = serializers.IntegerField(min_value=0, required=False)
+    rpe = serializers.DecimalField(max_digits=3, decimal_places=1, min_value=1, max_value=10, required=False, allow_null=True)
+    order = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, data):
+        if data['op'] == 'create':
+            if 'workout_exercise_id' not in data or 'reps' not in data:
+                raise serializers.ValidationError("create requires workout_exercise_id and reps.")
+        elif 'id' not in data:
+            raise serializers.ValidationError(f"{data['op']} requires id.")
+        return data
+
+class BatchSetsSerializer(EstimateSetsMixin, serializers.Serializer):
+    operations = SetOperationSerializer(many=True, allow_empty=False)
+
+    def validate_operations(self, operations):
+        ids = [op['id'] for op in operations if op['op'] != 'create']
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Each set can appear only in one operation.")
+        return operations
+
+    # Apply operations to workout passed to save(), all writes in bulk
+    # Returns ids of touched sessions and ids of created sets in order of create operations
+    def create(self, validated_data):
+        workout = validated_data['workout']
+        operations = validated_data['operations']
+
+        session_ids = set(workout.exercises.values_list('id', flat=True))
+        sets = {
+            one_set.id: one_set
+            for one_set in WorkoutSet.objects.filter(
+                workout_exercise__workout=workout,
+                id__in=[op['id'] for op in operations if op['op'] != 'create'])
+        }
+
+        new_sets = []
+        updated_sets = defaultdict(list) # changed fields -> sets, one bulk update per field set
+        removed_ids = []
+        touched = set()
+        for op in operations:
+            if op['op'] == 'create':
+                if op['workout_exercise_id'] not in session_ids:
+                    raise serializers.ValidationError(
+                        {'operations': f"Exercise {op['workout_exercise_id']} does not belong to this workout."})
+                new_sets.append(WorkoutSet(
+                    workout_exercise_id=op['workout_exercise_id'],
+                    estimated_1rm=self._estimate(op.get('weight', 0), op['reps'], op.get('rpe')),
+                    **{field: op[field] for field in SET_FIELDS if field in op}))
+                touched.add(op['workout_exercise_id'])
+                continue
+
+            one_set = sets.get(op['id'])
+            if one_set is None:
+                raise serializers.ValidationError({'operations': f"Set {op['id']} does not belong to this workout."})
+            touched.add(one_set.workout_exercise_id)
+            if op['op'] == 'delete':
+                removed_ids.append(one_set.id)
+                continue
+            fields = [field for field in SET_FIELDS if field in op]
+            for field in fields:
+                setattr(one_set, field, op[field])
+            if {'weight', 'reps', 'rpe'} & set(fields):
+                one_set.estimated_1rm = self._estimate(one_set.weight, one_set.reps, one_set.rpe)
+                fields.append('estimated_1rm')
+            if fields:
+                updated_sets[tuple(fields)].append(one_set)
+
+        if removed_ids:
+            WorkoutSet.objects.filter(id__in=removed_ids).delete()
+        for fields, changed_sets in updated_sets.items():
+            WorkoutSet.objects.bulk_update(changed_sets, fields)
+        if new_sets:
+            WorkoutSet.objects.bulk_create(new_sets)
 
-        return workout
\ No newline at end of file
+        return {'workout_exercise_ids': touched, 'created': [one_set.id for one_set in new_sets]}
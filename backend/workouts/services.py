@@ -1,10 +1,19 @@
 # Helper module for generating user workout statistics
 from django.utils import timezone
-from datetime import timedelta
-from .models import Workout, WorkoutSet
+from datetime import datetime, timedelta
 from collections import defaultdict
-from django.db.models import Q, Sum, F, Count
-from .models import Workout, WorkoutSet, WorkoutExercise
+from django.conf import settings
+from django.db import connection, transaction
+from django.contrib.auth import get_user_model
+from django.db.models import Q, Sum, F, Max, Count, OuterRef, Subquery, FloatField, Window, RowRange
+from django.db.models.functions import TruncDate, TruncDay, TruncWeek, TruncMonth, Cast, Coalesce, Extract, RowNumber
+from django.contrib.postgres.aggregates import RegrSlope, RegrIntercept, RegrR2
+from exercises.models import Exercise
+from exercises.catalogue import get_catalogue_version
+from .models import Workout, WorkoutSet, WorkoutExercise, PersonalRecord, DailyVolume, DeletedWorkout, CurrentTransactionId
+from .cache import invalidate_user_stats
+from .columnar import get_user_history, MuscleMatrix, bucket_starts, sum_by_key, np
+from .estimators import estimate_1rm_expression
 
 def get_heat_intensity(sets_count):
     if sets_count <= 0: return 1 
@@ -36,207 +45,861 @@ MUSCLE_MAPPING = {
 
 STATIC_BODY_PARTS = ["head", "hands", "feet", "ankles"]
 
+# All slugs returned in heatmap, untrained muscles also have a value
+ALL_SUPPORTED_MUSCLES = set(STATIC_BODY_PARTS) # Always default color
+for slug_list in MUSCLE_MAPPING.values():
+    ALL_SUPPORTED_MUSCLES.update(slug_list)
+
+# Process-wide index of exercise muscles, built lazily from the catalogue
+# Rebuilt when catalogue version changes (see exercises.catalogue)
+PRIMARY_WEIGHT = 1.0
+SECONDARY_WEIGHT = 0.5
+
+_exercise_index = {'version': None, 'exercise_ids': set(), 'muscles': {}, 'slug_weights': {}}
+
+def _build_exercise_index(version):
+    muscles = defaultdict(set) # exercise_id -> lowercase muscle names
+    slug_weights = defaultdict(lambda: defaultdict(float)) # exercise_id -> {slug: weight}
+    relations = (
+        (Exercise.primary_muscles.through, PRIMARY_WEIGHT),
+        (Exercise.secondary_muscles.through, SECONDARY_WEIGHT),
+    )
+    for relation, weight in relations:
+        for exercise_id, name in relation.objects.values_list('exercise_id', 'muscle__name'):
+            clean_name = name.lower().strip()
+            muscles[exercise_id].add(clean_name)
+            for slug in MUSCLE_MAPPING.get(clean_name.replace(' ', '_'), ()):
+                slug_weights[exercise_id][slug] += weight
+
+    return {
+        'version': version,
+        'exercise_ids': set(Exercise.objects.values_list('id', flat=True)),
+        'muscles': dict(muscles),
+        'slug_weights': {exercise_id: dict(weights) for exercise_id, weights in slug_weights.items()},
+    }
+
+# exercise_ids: exercises which will be looked up, unknown ones (added after build) trigger rebuild
+def get_exercise_index(exercise_ids=()):
+    global _exercise_index
+    version, _ = get_catalogue_version()
+    if _exercise_index['version'] != version or not _exercise_index['exercise_ids'].issuperset(exercise_ids):
+        _exercise_index = _build_exercise_index(version)
+    return _exercise_index
+
+# Windows up to this many days use columnar history only when it is already loaded
+COLUMNAR_LOAD_DAYS = 90
+
+# Dense matrices of exercise index for columnar statistics, rebuilt together with the index
+_muscle_matrix = None
+
+def get_muscle_matrix(exercise_ids=()):
+    global _muscle_matrix
+    index = get_exercise_index(exercise_ids)
+    if _muscle_matrix is None or _muscle_matrix.index is not index:
+        _muscle_matrix = MuscleMatrix(index, sorted(ALL_SUPPORTED_MUSCLES))
+    return _muscle_matrix
+
+# Heatmap entries for every supported slug, intensity: slug -> weighted sets count
+def _body_parts(intensity):
+    return [
+        {
+            "slug": slug,
+            "intensity": get_heat_intensity(intensity.get(slug, 0)) # Map sets count to intensivity
+        }
+        for slug in ALL_SUPPORTED_MUSCLES
+    ]
+
 # Get weekly stats for user including body part intensity
+# user: User instance or id
 def get_weekly_stats(user):
     
     before = timezone.now() - timedelta(days=7) # Earliest we track
+    history = get_user_history(getattr(user, 'id', user), load=False)
+    if history is not None:
+        # Vectorized over columnar history: sets of the week are tail slice of set arrays
+        first_workout = history.workouts_since(before.timestamp())
+        first_set, last_set = history.set_range(first_workout, len(history.workout_start))
+        matrix = get_muscle_matrix(history.exercise_ids)
+        sets_count = matrix.sum_by_exercise(history.set_exercise[first_set:last_set])
+        return {
+            "workouts_count": len(history.workout_start) - first_workout,
+            "total_volume": round(float(history.set_volume[first_set:last_set].sum()), 1),
+            "body_parts": _body_parts(dict(zip(matrix.slugs, (sets_count @ matrix.slug_weights).tolist()))),
+        }
+
     workouts_count = Workout.objects.filter(
         user=user,
         start_time__gte = before
     ).count()
 
-    # Select * from WorkoutSet where workout.user = user and workout.start_time >= before 
-    sets = WorkoutSet.objects.filter(
+    # Sets count and volume per exercise in one grouped query
+    exercises = WorkoutSet.objects.filter(
         workout_exercise__workout__user=user,
         workout_exercise__workout__start_time__gte=before
-    ).select_related('workout_exercise__exercise') \
-     .prefetch_related(
-         'workout_exercise__exercise__primary_muscles',
-         'workout_exercise__exercise__secondary_muscles'
-     ) # 
+    ).values_list('workout_exercise__exercise_id').annotate(
+        sets_count=Count('id'),
+        volume=Sum(F('weight') * F('reps'))
+    ).order_by()
 
-    muscle_sets = defaultdict(float)
+    exercises = list(exercises)
+    slug_weights = get_exercise_index(exercise_id for exercise_id, _, _ in exercises)['slug_weights']
+    intensity = defaultdict(float)
     volume = 0.0
 
+    # Each set adds exercise weights to its body parts
+    for exercise_id, sets_count, exercise_volume in exercises:
+        volume += float(exercise_volume or 0)
+        for slug, weight in slug_weights.get(exercise_id, {}).items():
+            intensity[slug] += weight * sets_count
 
-    # Foreach set we count volume and track mussles we used
-    for one_set in sets:
-        exercise = one_set.workout_exercise.exercise
-        weight = float(one_set.weight)
-        reps = one_set.reps
-        volume += weight * reps
-        
-        # Count sets for each muscle type
-        for muscle in exercise.primary_muscles.all():
-            clean_name = muscle.name.lower().strip()
-            muscle_sets[clean_name] += 1.0
-
+    return {
+        "workouts_count": workouts_count,
+        "total_volume": round(volume, 1),
+        "body_parts": _body_parts(intensity)  # {Slug, intensivity}
+    }
 
-        for muscle in exercise.secondary_muscles.all():
-            clean_name = muscle.name.lower().strip()
-            muscle_sets[clean_name] += 0.5
+# Sets count and volume per muscle over last `days` days, for windows like 30 or 90 days
+# Set counts for every muscle of exercise (primary and secondary), as in volume chart muscle filter
+def get_muscle_stats(user, days=30):
+    before = timezone.now() - timedelta(days=days)
+    history = get_user_history(user.id, load=days > COLUMNAR_LOAD_DAYS)
+    if history is not None:
+        first_workout = history.workouts_since(before.timestamp())
+        first_set, last_set = history.set_range(first_workout, len(history.workout_start))
+        exercises = history.set_exercise[first_set:last_set]
+        matrix = get_muscle_matrix(history.exercise_ids)
+        muscle_sets = matrix.sum_by_exercise(exercises) @ matrix.muscle_sets
+        muscle_volume = matrix.sum_by_exercise(exercises, history.set_volume[first_set:last_set]) @ matrix.muscle_sets
+        workouts_count = len(history.workout_start) - first_workout
+        sets_count = last_set - first_set
+        total_volume = float(history.set_volume[first_set:last_set].sum())
+        muscles = {
+            muscle: (int(muscle_sets[column]), float(muscle_volume[column]))
+            for muscle, column in matrix.muscle_columns.items() if muscle_sets[column]
+        }
+    else:
+        workouts_count = Workout.objects.filter(user=user, start_time__gte=before).count()
+        exercises = list(
+            WorkoutSet.objects.filter(
+                workout_exercise__workout__user=user,
+                workout_exercise__workout__start_time__gte=before
+            ).values_list('workout_exercise__exercise_id').annotate(
+                sets_count=Count('id'),
+                volume=Sum(F('weight') * F('reps'))
+            ).order_by()
+        )
+        exercise_muscles = get_exercise_index(exercise_id for exercise_id, _, _ in exercises)['muscles']
+        sets_count = 0
+        total_volume = 0.0
+        muscles = defaultdict(lambda: (0, 0.0))
+        for exercise_id, exercise_sets, exercise_volume in exercises:
+            sets_count += exercise_sets
+            total_volume += float(exercise_volume or 0)
+            for muscle in exercise_muscles.get(exercise_id, ()):
+                muscle_sets, muscle_volume = muscles[muscle]
+                muscles[muscle] = (muscle_sets + exercise_sets, muscle_volume + float(exercise_volume or 0))
 
-    intensity = defaultdict(float)
+    return {
+        "days": days,
+        "workouts_count": workouts_count,
+        "sets_count": sets_count,
+        "total_volume": round(total_volume, 1),
+        "muscles": [
+            {"muscle": muscle, "sets_count": muscle_sets, "volume": round(muscle_volume, 1)}
+            for muscle, (muscle_sets, muscle_volume) in sorted(muscles.items(), key=lambda item: (-item[1][1], item[0]))
+        ],
+    }
 
-    for db_muscle, count in muscle_sets.items():
-        target_slugs = MUSCLE_MAPPING.get(db_muscle) # Muscles from db mapped into corresponding slug
-        if target_slugs:
-            for slug in target_slugs: # asigning value
-                intensity[slug] += count
+# Day of moment in user timezone, workout days of rollups and calendar are counted this way
+def local_day(user, moment):
+    return timezone.localdate(moment, user.get_timezone())
 
-    body_data_list = []
+# Aware datetimes [start, end) covering whole days first_day..last_day in tz (default current timezone)
+# Filtering raw start_time by this range keeps (user, start_time) indexes usable, unlike __date lookups
+def day_range(first_day, last_day, tz=None):
+    tz = tz or timezone.get_current_timezone()
+    return (
+        datetime.combine(first_day, datetime.min.time(), tzinfo=tz),
+        datetime.combine(last_day + timedelta(days=1), datetime.min.time(), tzinfo=tz),
+    )
 
-    # Generate all muscles so untrained muscles also will have value
-    all_supported_muscles =  set(STATIC_BODY_PARTS) # Always default color
-    for slug_list in MUSCLE_MAPPING.values():
-        for slug in slug_list:
-            all_supported_muscles.add(slug)
-    
-    for slug in all_supported_muscles:
-        val = intensity.get(slug, 0)
-        body_data_list.append({
-            "slug": slug,
-            "intensity": get_heat_intensity(val) # Map sets count to intensivity
-        })
+# Rebuild daily volume rollups of user for given days from workout history
+def refresh_daily_volume(user, days):
+    days = set(days)
+    if not days:
+        return
+    user_tz = user.get_timezone()
+    range_start, range_end = day_range(min(days), max(days), user_tz)
 
-    return {
-        "workouts_count": workouts_count,
-        "total_volume": round(volume, 1),
-        "body_parts": body_data_list  # {Slug, intensivity}
+    # Day of every workout computed by database in user timezone
+    workouts = {
+        workout['id']: (workout['day'], workout['total_volume'])
+        for workout in Workout.objects.filter(
+            user=user, start_time__gte=range_start, start_time__lt=range_end
+        ).annotate(day=TruncDate('start_time', tzinfo=user_tz)).values('id', 'day', 'total_volume')
     }
+    workouts = {id: value for id, value in workouts.items() if value[0] in days}
+    sessions = list(
+        WorkoutExercise.objects.filter(workout_id__in=workouts)
+        .values_list('workout_id', 'exercise_id', 'session_volume')
+    )
+    exercise_muscles = get_exercise_index(exercise_id for _, exercise_id, _ in sessions)['muscles']
+
+    volumes = defaultdict(float)
+    workout_ids = defaultdict(set)
+    for workout_id, (day, total_volume) in workouts.items():
+        volumes[(day, '')] += total_volume
+        workout_ids[(day, '')].add(workout_id)
+    for workout_id, exercise_id, session_volume in sessions:
+        day = workouts[workout_id][0]
+        for muscle in exercise_muscles.get(exercise_id, ()):
+            volumes[(day, muscle)] += session_volume
+            workout_ids[(day, muscle)].add(workout_id)
+
+    with transaction.atomic():
+        DailyVolume.objects.filter(user=user, day__in=days).delete()
+        DailyVolume.objects.bulk_create([
+            DailyVolume(
+                user=user,
+                day=day,
+                muscle=muscle,
+                volume=round(volume, 1),
+                workouts_count=len(workout_ids[(day, muscle)])
+            )
+            for (day, muscle), volume in volumes.items()
+        ])
+
+# Rebuild all daily rollups of user, e.g. after timezone change
+def rebuild_daily_volume(user):
+    days = set(
+        Workout.objects.filter(user=user)
+        .annotate(day=TruncDate('start_time', tzinfo=user.get_timezone()))
+        .values_list('day', flat=True)
+        .distinct()
+    )
+    # Drop rollups of days without workouts left
+    DailyVolume.objects.filter(user=user).exclude(day__in=days).delete()
+    refresh_daily_volume(user, days)
+
+# Refresh rollups of days on which given exercises were trained, e.g. after their muscles changed
+def refresh_exercise_rollups(exercise_ids):
+    users = get_user_model().objects.filter(workouts__exercises__exercise_id__in=exercise_ids).distinct()
+    for user in users:
+        days = set(
+            Workout.objects.filter(user=user, exercises__exercise_id__in=exercise_ids)
+            .annotate(day=TruncDate('start_time', tzinfo=user.get_timezone()))
+            .values_list('day', flat=True)
+        )
+        refresh_daily_volume(user, days)
+    return len(users)
+
+# Chart buckets: truncate function, label format and step to next bucket
+# Rollup days are already in user timezone, so buckets are truncated dates
+def _next_month(day):
+    if day.month == 12:
+        return day.replace(year=day.year + 1, month=1)
+    return day.replace(month=day.month + 1)
+
+CHART_GRANULARITY = {
+    'day': (TruncDay, '%d %b', lambda day: day + timedelta(days=1)),
+    'week': (TruncWeek, '%d %b', lambda day: day + timedelta(days=7)),
+    'month': (TruncMonth, '%b', _next_month),
+}
+
+def _bucket_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+# Volume per bucket start and workouts count of days first_day..last_day from columnar history
+# Same numbers as daily rollups: stored session volumes rounded per day, muscle counts sessions of exercises
+# involving it (even without sets), all muscles count every workout
+def _columnar_volume(history, tz, muscle, first_day, last_day, granularity):
+    days = history.workout_days(tz) # Local days grow with start time, so window is a slice
+    first_workout = int(np.searchsorted(days, np.datetime64(first_day), side='left'))
+    last_workout = int(np.searchsorted(days, np.datetime64(last_day), side='right'))
+    workout_days = days[first_workout:last_workout]
+
+    if muscle:
+        matrix = get_muscle_matrix(history.exercise_ids)
+        column = matrix.muscle_columns.get(muscle.lower().strip())
+        if column is None:
+            return {}, 0
+        first_session, last_session = history.session_range(first_workout, last_workout)
+        exercises = history.session_exercise[first_session:last_session]
+        trained = matrix.muscle_sets[matrix.exercise_rows(exercises), column] > 0
+        session_workout = history.session_workout[first_session:last_session][trained] - first_workout
+        # Reduce sessions to workouts first, there are several times less of them to bucket
+        workouts = last_workout - first_workout
+        workout_volume = np.bincount(
+            session_workout, weights=history.session_volume[first_session:last_session][trained], minlength=workouts)
+        included = np.bincount(session_workout, minlength=workouts) > 0
+        workout_volume = workout_volume[included]
+        workout_days = workout_days[included]
+    else:
+        workout_volume = history.workout_volume[first_workout:last_workout]
+
+    day_volume = sum_by_key(workout_days, workout_volume)
+    bucket_volume = sum_by_key(
+        bucket_starts(np.array(list(day_volume), dtype='datetime64[D]'), granularity),
+        [round(volume, 1) for volume in day_volume.values()])
+    return bucket_volume, len(workout_days)
 
 # Get volume of workouts for user over time (grouped monthly) for generating volume chart
-def get_workouts_volume(user, muscle = None, days = 365):
+def get_workouts_volume(user, muscle = None, days = 365, granularity = 'month'):
     """
     muscle: muscle name to filter by or None for all muscles
     days: number of days in the past to include in the data
+    granularity: size of chart bucket, one of day, week, month
     """
+    trunc, label_format, next_bucket = CHART_GRANULARITY[granularity]
 
-    today = timezone.now().date()
+    today = timezone.localdate(timezone=user.get_timezone())
     start_time = today - timedelta(days=days)
-    monthly_volume = defaultdict(float)
-    unique_workouts = set() # To count overall amount of workouts in period
-
-    if not muscle:
-        workouts = Workout.objects.filter(
-            user=user,
-            start_time__date__gte=start_time,
-            start_time__date__lte=today
-        ).values('id', 'start_time', 'total_volume')
-        
-        for workout in workouts:
-            workout_date = workout['start_time'].date()
-            first_of_month = workout_date.replace(day=1)
-            
-            # Accumulate total volume per month
-            monthly_volume[first_of_month] += workout['total_volume']
-            unique_workouts.add(workout['id'])
 
+    history = get_user_history(user.id, load=days > COLUMNAR_LOAD_DAYS)
+    if history is not None:
+        bucket_volume, total_workouts = _columnar_volume(history, user.get_timezone(), muscle, start_time, today, granularity)
     else:
-        # Filter sets by muscle
-        workout_exercise = WorkoutExercise.objects.filter(
-            workout__user = user,
-            workout__start_time__date__gte=start_time,
-            workout__start_time__date__lte=today,
-        )
-
-        workout_exercise = workout_exercise.filter(
-            Q(exercise__primary_muscles__name__icontains=muscle) |
-            Q(exercise__secondary_muscles__name__icontains=muscle)
-        ).distinct()
-        
-        workout_exercise = workout_exercise.values(
-            'workout__id',
-            'workout__start_time',
-            'session_volume'
+        # Read pre-aggregated daily rollups, one row per bucket
+        buckets = DailyVolume.objects.filter(
+            user=user,
+            muscle=muscle.lower().strip() if muscle else '',
+            day__gte=start_time,
+            day__lte=today,
+        ).annotate(bucket=trunc('day')).values('bucket').annotate(
+            volume=Sum('volume'),
+            workouts=Sum('workouts_count'),
         )
+        bucket_volume = {}
+        total_workouts = 0
+        for bucket in buckets:
+            bucket_volume[bucket['bucket']] = bucket['volume']
+            total_workouts += bucket['workouts']
 
-        for exercise in workout_exercise:
-            date = exercise['workout__start_time'].date()
-            first_of_month = date.replace(day=1)
-            monthly_volume[first_of_month] += exercise['session_volume']
-            unique_workouts.add(exercise['workout__id'])
     chart_data = []
-
-
-    current = start_time.replace(day=1)
-    while current <= today: # For each month add data point
-        volume = monthly_volume.get(current, 0)
+    current = _bucket_start(start_time, granularity)
+    while current <= today: # For each bucket add data point
+        volume = bucket_volume.get(current, 0)
         chart_data.append({
         "value": round(volume, 1),
-        "label": current.strftime('%b'), # Day and month
+        "label": current.strftime(label_format),
         "date": current.strftime('%Y-%m-%d')
         })
-        if current.month == 12:
-            current = current.replace(year=current.year + 1, month=1)
-        else:
-            current = current.replace(month=current.month + 1)
+        current = next_bucket(current)
 
     return {
     "chart": chart_data,
     "summary": {
-        "total_workouts": len(unique_workouts), 
-        "total_volume": round(sum(monthly_volume.values()), 1)
+        "total_workouts": total_workouts,
+        "total_volume": round(sum(bucket_volume.values()), 1)
+        }
+    }
+
+# Completed workouts count and volume per day for calendar, days without workouts are left out
+def get_calendar(user, first_day, last_day):
+    user_tz = user.get_timezone()
+    range_start, range_end = day_range(first_day, last_day, user_tz)
+    days = Workout.objects.filter(
+        user=user,
+        status='completed',
+        start_time__gte=range_start,
+        start_time__lt=range_end,
+    ).annotate(
+        day=TruncDate('start_time', tzinfo=user_tz)
+    ).values('day').annotate(
+        workouts_count=Count('id'),
+        volume=Sum('total_volume'),
+    ).order_by('day')
+
+    return [
+        {
+            "date": day['day'].isoformat(),
+            "workouts_count": day['workouts_count'],
+            "total_volume": round(day['volume'], 1),
         }
+        for day in days
+    ]
+
+# Fields of PersonalRecord updated by calculate_workout_summary
+RECORD_FIELDS = [
+    'best_1rm', 'best_1rm_date', 'best_1rm_exercise', 'previous_1rm',
+    'max_weight', 'max_weight_reps', 'max_weight_date', 'max_weight_exercise',
+]
+
+# Session volume and best estimated 1RM of every set group, computed by database
+# prefix: path to set from queried model, e.g. 'sets__'
+# formula: compute estimates by this formula instead of reading ones stored on sets
+def aggregate_session_stats(prefix='', formula=None):
+    estimate = estimate_1rm_expression(formula, prefix) if formula else F(f'{prefix}estimated_1rm')
+    return {
+        'sets_volume': Coalesce(Sum(Cast(F(f'{prefix}weight') * F(f'{prefix}reps'), FloatField())), 0.0),
+        'sets_1rm': Coalesce(Max(estimate), 0.0),
+    }
+
+# Store estimates of user sets by current formula of the user, e.g. after switching formula
+# since: only sets of workouts starting at or after this datetime
+# Returns number of sets whose estimate changed (or would change with dry_run)
+def backfill_1rm_estimates(user, since=None, dry_run=False):
+    sets = WorkoutSet.objects.filter(workout_exercise__workout__user=user)
+    if since is not None:
+        sets = sets.filter(workout_exercise__workout__start_time__gte=since)
+    estimate = estimate_1rm_expression(user.one_rm_formula)
+    stale = sets.annotate(new_estimate=estimate).exclude(estimated_1rm=F('new_estimate'))
+    return stale.count() if dry_run else stale.update(estimated_1rm=estimate)
+
+# Rebuild records of user for given exercises from the whole history, same number of queries for any number of exercises
+# Used when the session holding a record was deleted or its result got lower
+def rebuild_personal_records(user, exercise_ids):
+    exercise_ids = set(exercise_ids)
+    if not exercise_ids:
+        return
+    sessions = WorkoutExercise.objects.filter(workout__user=user, exercise_id__in=exercise_ids)
+
+    # Two best sessions of every exercise, record holder and runner-up
+    best_sessions = defaultdict(list)
+    for session in (
+        sessions.annotate(rank=Window(
+            RowNumber(),
+            partition_by=F('exercise_id'),
+            order_by=[F('session_1rm').desc(), F('workout__start_time').asc(), F('id').asc()],
+        ))
+        .filter(rank__lte=2)
+        .order_by('exercise_id', 'rank')
+        .values('id', 'exercise_id', 'session_1rm', 'workout__start_time')
+    ):
+        best_sessions[session['exercise_id']].append(session)
+
+    # Heaviest set of every exercise
+    heaviest_sets = {
+        heaviest['workout_exercise__exercise_id']: heaviest
+        for heaviest in WorkoutSet.objects.filter(workout_exercise__in=sessions)
+        .order_by('workout_exercise__exercise_id', '-weight', '-reps', 'workout_exercise__workout__start_time')
+        .distinct('workout_exercise__exercise_id')
+        .values('workout_exercise_id', 'workout_exercise__exercise_id', 'weight', 'reps', 'workout_exercise__workout__start_time')
     }
 
-# Calculate 1rm based on weight and reps using Epley formula
-def calculate_1rm(weight, reps):
-    if reps == 0: return 0
-    if reps == 1: return weight
-    return weight * (1 + (reps / 30))
+    records = {
+        record.exercise_id: record
+        for record in PersonalRecord.objects.filter(user=user, exercise_id__in=exercise_ids)
+    }
+    created_records = []
+    changed_records = []
+    for exercise_id in exercise_ids:
+        record = records.get(exercise_id)
+        best = best_sessions.get(exercise_id)
+        if not best:
+            continue # No history left for this exercise, deleted below
+        if record is None:
+            record = PersonalRecord(user=user, exercise_id=exercise_id)
+            created_records.append(record)
+        else:
+            changed_records.append(record)
+
+        record.best_1rm = best[0]['session_1rm']
+        record.best_1rm_date = best[0]['workout__start_time']
+        record.best_1rm_exercise_id = best[0]['id']
+        record.previous_1rm = best[1]['session_1rm'] if len(best) > 1 else 0.0
+
+        heaviest = heaviest_sets.get(exercise_id)
+        if heaviest is not None:
+            record.max_weight = heaviest['weight']
+            record.max_weight_reps = heaviest['reps']
+            record.max_weight_date = heaviest['workout_exercise__workout__start_time']
+            record.max_weight_exercise_id = heaviest['workout_exercise_id']
+        else:
+            record.max_weight = 0
+            record.max_weight_reps = 0
+            record.max_weight_date = None
+            record.max_weight_exercise_id = None
+
+    PersonalRecord.objects.filter(user=user, exercise_id__in=exercise_ids - best_sessions.keys()).delete()
+    if changed_records:
+        PersonalRecord.objects.bulk_update(changed_records, RECORD_FIELDS)
+    if created_records:
+        # Record created meanwhile by concurrent summary is overwritten, this one is built from whole history
+        PersonalRecord.objects.bulk_create(
+            created_records, update_conflicts=True, unique_fields=['user', 'exercise'], update_fields=RECORD_FIELDS)
 
 # Generate workout summary including total volume and new personal records
 # Supposed to be run only after workout is completed or edited
-def calculate_workout_summary(workout):
+# workout_exercise_ids: recompute only these sessions, volume of the others is read as stored
+def calculate_workout_summary(workout, workout_exercise_ids=None):
 
     # Get all sets in the workout
-    exercises = WorkoutExercise.objects.filter(
-        workout=workout
-    ).select_related('exercise').prefetch_related('sets')
+    exercises = WorkoutExercise.objects.filter(workout=workout)
     total_volume = 0.0
-    
-    new_records = []
+    if workout_exercise_ids is not None:
+        total_volume = exercises.exclude(id__in=workout_exercise_ids)\
+            .aggregate(total=Sum('session_volume'))['total'] or 0.0
+        exercises = exercises.filter(id__in=workout_exercise_ids)
+    # Stats and top set of every session in one grouped query
+    top_set = WorkoutSet.objects.filter(workout_exercise=OuterRef('pk')).order_by('-weight', '-reps')
+    exercises = list(
+        exercises.select_related('exercise')
+        .annotate(
+            **aggregate_session_stats('sets__'),
+            top_weight=Subquery(top_set.values('weight')[:1]),
+            top_reps=Subquery(top_set.values('reps')[:1]),
+        )
+    )
+
+    # Current records for exercises in this workout (single indexed lookup)
+    records = {
+        record.exercise_id: record
+        for record in PersonalRecord.objects.filter(
+            user_id=workout.user_id,
+            exercise_id__in=[one_exercise.exercise_id for one_exercise in exercises])
+    }
+
+    changed_exercises = []
+    created_records = []
+    to_rebuild = set()
 
     for one_exercise in exercises:
-        session_volume = 0.0
-        session_1rm = 0.0
-        for one_set in one_exercise.sets.all():
-            weight = float(one_set.weight)
-            reps = one_set.reps
-            session_volume += weight * reps
-            set_1rm = calculate_1rm(weight, reps)
-            if set_1rm > session_1rm:
-                session_1rm = set_1rm
-        
+        session_volume = round(one_exercise.sets_volume, 1)
+        session_1rm = round(one_exercise.sets_1rm, 1)
+
         total_volume += session_volume
-        one_exercise.session_volume = round(session_volume, 1)
-        one_exercise.session_1rm = round(session_1rm, 1)
-        one_exercise.save(update_fields=['session_volume', 'session_1rm'])
-
-        global_best = (
-            WorkoutExercise.objects.filter(
-                workout__user=workout.user,
-                exercise=one_exercise.exercise)
-                .exclude(id=one_exercise.id)  # Exclude current exercise
-                .order_by('-session_1rm')
-                .first()
+        if one_exercise.session_volume != session_volume or one_exercise.session_1rm != session_1rm:
+            one_exercise.session_volume = session_volume
+            one_exercise.session_1rm = session_1rm
+            changed_exercises.append(one_exercise)
+
+        record = records.get(one_exercise.exercise_id)
+        if record is None:
+            record = PersonalRecord(user_id=workout.user_id, exercise_id=one_exercise.exercise_id)
+            records[one_exercise.exercise_id] = record
+            created_records.append(record)
+
+        # 1RM record
+        holds_1rm = record.best_1rm_exercise_id == one_exercise.id
+        if holds_1rm and session_1rm < record.best_1rm:
+            # Record got lower, some other session may hold it now
+            to_rebuild.add(one_exercise.exercise_id)
+        elif holds_1rm or session_1rm > record.best_1rm:
+            record.best_1rm = session_1rm
+            record.best_1rm_date = workout.start_time
+            record.best_1rm_exercise = one_exercise
+
+        # Max weight record
+        holds_weight = record.max_weight_exercise_id == one_exercise.id
+        has_sets = one_exercise.top_weight is not None
+        top = (one_exercise.top_weight, one_exercise.top_reps) if has_sets else (0, 0)
+        if holds_weight and top < (record.max_weight, record.max_weight_reps):
+            to_rebuild.add(one_exercise.exercise_id)
+        elif has_sets and (holds_weight or top > (record.max_weight, record.max_weight_reps)):
+            record.max_weight = one_exercise.top_weight
+            record.max_weight_reps = one_exercise.top_reps
+            record.max_weight_date = workout.start_time
+            record.max_weight_exercise = one_exercise
+
+    if changed_exercises:
+        WorkoutExercise.objects.bulk_update(changed_exercises, ['session_volume', 'session_1rm'])
+
+    # Runner-up is the best session except the holder, read from saved sessions in one grouped query,
+    # so edits and deletes of other sessions than the holder are reflected too
+    records = {exercise_id: record for exercise_id, record in records.items() if exercise_id not in to_rebuild}
+    runner_ups = dict(
+        WorkoutExercise.objects.filter(workout__user_id=workout.user_id, exercise_id__in=records)
+        .exclude(id__in=[record.best_1rm_exercise_id for record in records.values() if record.best_1rm_exercise_id])
+        .values('exercise_id')
+        .annotate(best=Max('session_1rm'))
+        .values_list('exercise_id', 'best')
+        .order_by()
+    )
+    for record in records.values():
+        record.previous_1rm = runner_ups.get(record.exercise_id, 0.0)
+
+    created_records = [record for record in created_records if record.exercise_id in records]
+    changed_records = [record for record in records.values() if record.pk]
+    if changed_records:
+        PersonalRecord.objects.bulk_update(changed_records, RECORD_FIELDS)
+    if created_records:
+        PersonalRecord.objects.bulk_create(created_records, ignore_conflicts=True)
+        # Concurrent summary may have created record first, ours was then skipped and both are merged by rebuild
+        stored = PersonalRecord.objects.filter(
+            user_id=workout.user_id, exercise_id__in=[record.exercise_id for record in created_records]
+        ).values_list('exercise_id', 'best_1rm_exercise_id', 'max_weight_exercise_id')
+        to_rebuild.update(
+            exercise_id for exercise_id, best_1rm_exercise_id, max_weight_exercise_id in stored
+            if (best_1rm_exercise_id, max_weight_exercise_id)
+            != (records[exercise_id].best_1rm_exercise_id, records[exercise_id].max_weight_exercise_id)
+        )
+    if to_rebuild:
+        rebuild_personal_records(workout.user, to_rebuild)
+        records.update(
+            (record.exercise_id, record)
+            for record in PersonalRecord.objects.filter(user_id=workout.user_id, exercise_id__in=to_rebuild)
         )
-        best_global = global_best.session_1rm if global_best else 0.0
-
-        if session_1rm > best_global:
-            new_records.append({
-                "exercise_id": one_exercise.exercise.id,
-                "exercise_name": one_exercise.exercise.name,
-                "old_1rm": round(global_best.session_1rm, 1) if global_best else 0,
-                "new_1rm": round(session_1rm, 1)
-            })
-    if workout.total_volume != total_volume:
-        workout.total_volume = round(total_volume, 1)
-        workout.save(update_fields=['total_volume'])
+
+    # Sessions holding the record with result above runner-up
+    new_records = [
+        {
+            "exercise_id": one_exercise.exercise.id,
+            "exercise_name": one_exercise.exercise.name,
+            "old_1rm": round(records[one_exercise.exercise_id].previous_1rm, 1),
+            "new_1rm": one_exercise.session_1rm,
+        }
+        for one_exercise in exercises
+        if one_exercise.exercise_id in records
+        and records[one_exercise.exercise_id].best_1rm_exercise_id == one_exercise.id
+        and one_exercise.session_1rm > records[one_exercise.exercise_id].previous_1rm
+    ]
+
+    # Saved on every summary, also marks workout as changed for delta sync
+    workout.total_volume = round(total_volume, 1)
+    workout.save(update_fields=['total_volume', 'updated_at'])
+    refresh_daily_volume(workout.user, [local_day(workout.user, workout.start_time)])
+    invalidate_user_stats(workout.user_id)
 
     return {
         "id": workout.id,
         "total_volume": round(total_volume, 1),
         "new_records": new_records
-    }
\ No newline at end of file
+    }
+
+# Recalculate set estimates, session stats, workout totals, records and rollups of one user in batches
+# since: only workouts starting at or after this datetime, None for whole history
+# Returns counts of processed and changed rows
+def recalculate_user_history(user, since=None, dry_run=False):
+    workouts = Workout.objects.filter(user=user)
+    if since is not None:
+        workouts = workouts.filter(start_time__gte=since)
+    sessions = list(
+        WorkoutExercise.objects.filter(workout__in=workouts)
+        .values_list('id', 'workout_id', 'exercise_id', 'session_volume', 'session_1rm')
+    )
+    # Stats of every session grouped by database, sessions without sets are missing
+    # 1RM is estimated by current formula of user, stored estimates are backfilled below
+    session_stats = {
+        workout_exercise_id: (round(volume, 1), round(best_1rm, 1))
+        for workout_exercise_id, volume, best_1rm in
+        WorkoutSet.objects.filter(workout_exercise__workout__in=workouts)
+        .values('workout_exercise_id')
+        .annotate(**aggregate_session_stats(formula=user.one_rm_formula))
+        .values_list('workout_exercise_id', 'sets_volume', 'sets_1rm')
+        .order_by()
+    }
+    workouts = {
+        workout['id']: workout
+        for workout in workouts.values('id', 'start_time', 'total_volume')
+    }
+
+    changed_exercises = []
+    touched_workouts = set()
+    totals = defaultdict(float)
+    for id, workout_id, exercise_id, old_volume, old_1rm in sessions:
+        session_volume, session_1rm = session_stats.get(id, (0.0, 0.0))
+        totals[workout_id] += session_volume
+        if (session_volume, session_1rm) != (old_volume, old_1rm):
+            changed_exercises.append(
+                WorkoutExercise(id=id, session_volume=session_volume, session_1rm=session_1rm))
+            touched_workouts.add(workout_id)
+
+    # Workouts with changed sessions are marked as updated for delta sync too
+    now = timezone.now()
+    changed_workouts = [
+        Workout(id=workout_id, total_volume=round(totals[workout_id], 1), updated_at=now, sync_txid=CurrentTransactionId())
+        for workout_id, workout in workouts.items()
+        if workout['total_volume'] != round(totals[workout_id], 1) or workout_id in touched_workouts
+    ]
+
+    if dry_run:
+        sets_changed = backfill_1rm_estimates(user, since, dry_run=True)
+    else:
+        with transaction.atomic():
+            sets_changed = backfill_1rm_estimates(user, since)
+            WorkoutExercise.objects.bulk_update(changed_exercises, ['session_volume', 'session_1rm'], batch_size=1000)
+            Workout.objects.bulk_update(changed_workouts, ['total_volume', 'updated_at', 'sync_txid'], batch_size=1000)
+            rebuild_personal_records(user, {exercise_id for _, _, exercise_id, _, _ in sessions})
+            refresh_daily_volume(user, {local_day(user, w['start_time']) for w in workouts.values()})
+        invalidate_user_stats(user.id)
+
+    return {
+        "workouts": len(workouts),
+        "workouts_changed": len(changed_workouts),
+        "exercises_changed": len(changed_exercises),
+        "sets_changed": sets_changed,
+    }
+
+# Move stored estimates of user to current formula: set estimates, session 1RMs and records
+# Volumes and daily rollups do not depend on formula, unlike recalculate_user_history they are left as they are
+# Returns number of sessions whose 1RM changed
+def recalculate_user_estimates(user):
+    with transaction.atomic():
+        backfill_1rm_estimates(user)
+        session_1rms = dict(
+            WorkoutSet.objects.filter(workout_exercise__workout__user=user)
+            .values('workout_exercise_id')
+            .annotate(best=Max('estimated_1rm'))
+            .values_list('workout_exercise_id', 'best')
+            .order_by()
+        )
+        changed_exercises = []
+        changed_workout_ids = set()
+        exercise_ids = set()
+        sessions = WorkoutExercise.objects.filter(workout__user=user).values_list('id', 'workout_id', 'exercise_id', 'session_1rm')
+        for id, workout_id, exercise_id, old_1rm in sessions:
+            exercise_ids.add(exercise_id)
+            session_1rm = round(session_1rms.get(id, 0.0), 1)
+            if session_1rm != old_1rm:
+                changed_exercises.append(WorkoutExercise(id=id, session_1rm=session_1rm))
+                changed_workout_ids.add(workout_id)
+
+        WorkoutExercise.objects.bulk_update(changed_exercises, ['session_1rm'], batch_size=1000)
+        # Session 1RMs are part of synced workouts
+        Workout.objects.filter(id__in=changed_workout_ids).update(
+            updated_at=timezone.now(), sync_txid=CurrentTransactionId())
+        rebuild_personal_records(user, exercise_ids)
+    invalidate_user_stats(user.id)
+    return len(changed_exercises)
+
+# Sessions of one exercise for user, newest first, with top set computed by database
+# before, before_id: only sessions older than this (start time, id) position (keyset pagination)
+def get_exercise_history(user, exercise_id, limit=10, before=None, before_id=None):
+    sessions = WorkoutExercise.objects.filter(workout__user=user, exercise_id=exercise_id)
+    if before is not None and before_id is not None:
+        sessions = sessions.filter(
+            Q(workout__start_time__lt=before) | Q(workout__start_time=before, id__lt=before_id))
+    elif before is not None:
+        sessions = sessions.filter(workout__start_time__lt=before)
+
+    top_set = WorkoutSet.objects.filter(workout_exercise=OuterRef('pk')).order_by('-weight', '-reps')
+    return list(
+        sessions.order_by('-workout__start_time', '-id')
+        .annotate(
+            top_weight=Subquery(top_set.values('weight')[:1]),
+            top_reps=Subquery(top_set.values('reps')[:1]),
+            sets_count=Count('sets'),
+        )
+        .values(
+            'id', 'workout_id', 'workout__name', 'workout__start_time',
+            'session_1rm', 'session_volume', 'top_weight', 'top_reps', 'sets_count',
+        )[:limit]
+    )
+
+# Largest-Triangle-Three-Buckets: keep `threshold` points of series which preserve its visual shape
+# points: list of (x, y, item), ordered by x; threshold: at least 3, first and last point are always kept
+def downsample_lttb(points, threshold):
+    if len(points) <= threshold:
+        return [item for _, _, item in points]
+    if threshold < 3:
+        # No room for buckets between ends of series
+        return [item for _, _, item in (points[0], points[-1])][:threshold]
+    bucket_size = (len(points) - 2) / (threshold - 2)
+    selected = [points[0]]
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        # Average of next bucket (last point for the last bucket) is third vertex of triangle
+        next_points = points[end:min(int((bucket + 2) * bucket_size) + 1, len(points) - 1)] or [points[-1]]
+        average_x = sum(point[0] for point in next_points) / len(next_points)
+        average_y = sum(point[1] for point in next_points) / len(next_points)
+        previous_x, previous_y, _ = selected[-1]
+        selected.append(max(
+            points[start:end],
+            key=lambda point: abs(
+                (previous_x - average_x) * (point[1] - previous_y) - (previous_x - point[0]) * (average_y - previous_y)
+            ),
+        ))
+    selected.append(points[-1])
+    return [item for _, _, item in selected]
+
+SECONDS_PER_WEEK = 7 * 24 * 60 * 60
+PROGRESSION_DOWNSAMPLING = ('lttb', 'week')
+
+# Estimated 1RM progression of one exercise: stored session_1rm of every session, best so far and linear trend
+# One query, rolling best and least squares fit are window aggregates computed by database
+# days: only sessions from last N days (None for whole history)
+# points: maximum number of returned points, series is downsampled by
+#   'lttb' (keeps shape of series) or 'week' (best session of every week in user timezone, then lttb if still too many)
+def get_exercise_progression(user, exercise_id, days=None, points=100, downsampling='lttb'):
+    sessions = WorkoutExercise.objects.filter(workout__user=user, exercise_id=exercise_id, session_1rm__gt=0)
+    if days is not None:
+        sessions = sessions.filter(workout__start_time__gte=timezone.now() - timedelta(days=days))
+
+    weeks = Cast(Extract('workout__start_time', 'epoch'), FloatField()) / SECONDS_PER_WEEK
+    sessions = list(
+        sessions.annotate(
+            date=F('workout__start_time'),
+            rolling_best=Window(Max('session_1rm'), order_by=[F('workout__start_time'), F('id')], frame=RowRange(None, 0)),
+            slope=Window(RegrSlope('session_1rm', weeks)),
+            intercept=Window(RegrIntercept('session_1rm', weeks)),
+            r2=Window(RegrR2('session_1rm', weeks)),
+        )
+        .order_by('workout__start_time', 'id')
+        .values('workout_id', 'date', 'session_1rm', 'rolling_best', 'slope', 'intercept', 'r2')
+    )
+
+    trend = None
+    if sessions and sessions[0]['slope'] is not None:
+        slope, intercept = sessions[0]['slope'], sessions[0]['intercept']
+        trend = {
+            "slope_per_week": round(slope, 3),
+            # Ends of fitted line, for drawing it over the series
+            "start_value": round(intercept + slope * sessions[0]['date'].timestamp() / SECONDS_PER_WEEK, 1),
+            "end_value": round(intercept + slope * sessions[-1]['date'].timestamp() / SECONDS_PER_WEEK, 1),
+            "r2": round(sessions[0]['r2'], 3) if sessions[0]['r2'] is not None else None,
+        }
+
+    series = sessions
+    if downsampling == 'week':
+        # Sessions are ordered, so weeks come in order and the best session replaces earlier ones of its week
+        best_of_week = {}
+        for session in sessions:
+            week = local_day(user, session['date'])
+            week -= timedelta(days=week.weekday())
+            if week not in best_of_week or session['session_1rm'] > best_of_week[week]['session_1rm']:
+                best_of_week[week] = session
+        series = list(best_of_week.values())
+    series = downsample_lttb([(session['date'].timestamp(), session['session_1rm'], session) for session in series], points)
+
+    return {
+        "exercise_id": exercise_id,
+        "sessions_count": len(sessions),
+        "best_1rm": sessions[-1]['rolling_best'] if sessions else 0.0,
+        "trend": trend,
+        "points": [
+            {
+                "workout_id": session['workout_id'],
+                "date": session['date'],
+                "e1rm": session['session_1rm'],
+                "rolling_best": session['rolling_best'],
+            }
+            for session in series
+        ],
+    }
+
+# Oldest transaction still running, writes not visible yet will all get transaction ids at or above it
+def get_sync_floor():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+        return cursor.fetchone()[0]
+
+# Delta sync: workouts written after (after_txid, after_id) position, in order of writing transaction
+# deleted_since: also return ids of workouts deleted by transactions from this one on, None skips them
+# Returns (workouts, deleted workout ids, has_more)
+def get_workout_changes(user, after_txid=0, after_id=0, limit=100, deleted_since=None):
+    workouts = list(
+        Workout.objects.filter(user=user)
+        .filter(Q(sync_txid__gt=after_txid) | Q(sync_txid=after_txid, id__gt=after_id))
+        .order_by('sync_txid', 'id')
+        .prefetch_related('exercises__sets')[:limit + 1]
+    )
+    deleted_ids = []
+    if deleted_since is not None:
+        deleted_ids = list(
+            DeletedWorkout.objects.filter(user=user, sync_txid__gte=deleted_since)
+            .values_list('workout_id', flat=True)
+        )
+    return workouts[:limit], deleted_ids, len(workouts) > limit
+
+# Delete tombstones older than SYNC_TOMBSTONE_TTL, returns number of deleted ones
+# Clients with older sync tokens are asked for full sync
+def prune_sync_tombstones():
+    expired = timezone.now() - timedelta(seconds=settings.SYNC_TOMBSTONE_TTL)
+    deleted, _ = DeletedWorkout.objects.filter(deleted_at__lt=expired).delete()
+    return deleted
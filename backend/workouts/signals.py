@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from users.signals import settings_changed
+from .cache import forget_user_active
+from .services import rebuild_daily_volume, recalculate_user_estimates
+
+# Active flag cached for stateless authentication follows changes of user
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):
+    forget_user_active(instance.id)
+
+@receiver(settings_changed)
+def user_settings_changed(sender, user, changed, **kwargs):
+    # Stored set estimates, session 1RMs and records follow the new formula
+    if 'one_rm_formula' in changed:
+        recalculate_user_estimates(user)
+    # Daily rollups are bucketed in user timezone
+    if 'timezone' in changed:
+        rebuild_daily_volume(user)
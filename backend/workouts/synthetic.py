@@ -0,0 +1,43 @@
+# Synthetic training history used by benchmark commands
+import random
+from datetime import timedelta
+from django.utils import timezone
+from .models import Workout, WorkoutExercise, WorkoutSet
+
+# Create workouts of user spread over last days until sets_count sets exist
+# Session stats are left empty, run recalculate_user_history afterwards
+# Returns list of created workout ids
+def generate_history(user, exercise_ids, sets_count, days=730, exercises_per_workout=5, sets_per_exercise=4, seed=0):
+    rng = random.Random(seed)
+    sets_per_workout = exercises_per_workout * sets_per_exercise
+    workouts_count = max(1, -(-sets_count // sets_per_workout))
+    now = timezone.now()
+    step = timedelta(days=days) / workouts_count
+
+    workouts = [
+        Workout(user=user, name=f"Workout {i}", start_time=now - step * (workouts_count - i), status='completed')
+        for i in range(workouts_count)
+    ]
+    Workout.objects.bulk_create(workouts, batch_size=1000)
+
+    workout_exercises = []
+    for workout in workouts:
+        for order, exercise_id in enumerate(rng.sample(exercise_ids, min(exercises_per_workout, len(exercise_ids)))):
+            workout_exercises.append(WorkoutExercise(workout=workout, exercise_id=exercise_id, order=order))
+    WorkoutExercise.objects.bulk_create(workout_exercises, batch_size=1000)
+
+    sets = []
+    for workout_exercise in workout_exercises:
+        base = rng.randrange(20, 160, 5)
+        for order in range(sets_per_exercise):
+            if len(sets) == sets_count:
+                break
+            sets.append(WorkoutSet(
+                workout_exercise=workout_exercise,
+                weight=base + rng.choice((-5, 0, 0, 5, 10)),
+                reps=rng.randint(1, 12),
+                order=order,
+            ))
+    WorkoutSet.objects.bulk_create(sets, batch_size=5000)
+
+    return [workout.id for workout in workouts]
@@ -1,3 +1,696 @@
-from django.test import TestCase
+import io
+import threading
+from decimal import Decimal
+from datetime import timedelta
+from unittest import mock, skipIf
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from exercises.models import Exercise, Muscle
+from . import columnar
+from .columnar import get_user_history, np
+from .deferred import deferred_summaries, mark_workout_dirty
+from .estimators import ESTIMATORS, estimate_1rm
+from .models import DailyVolume, DeletedWorkout, IdempotencyKey, PersonalRecord, Workout, WorkoutExercise, WorkoutSet
+from .services import (
+    aggregate_session_stats, calculate_workout_summary, downsample_lttb, get_muscle_stats, get_weekly_stats,
+    get_workouts_volume, rebuild_daily_volume, rebuild_personal_records, recalculate_user_history,
+)
+from .synthetic import generate_history
 
-# Create your tests here.
+# User with two exercises (bench press: chest + triceps, squat: quadriceps) and API client logged in as them
+class WorkoutTestMixin:
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='lifter', email='lifter@example.com', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.bench = Exercise.objects.create(name='Bench Press')
+        self.bench.primary_muscles.add(Muscle.objects.create(name='Chest'))
+        self.bench.secondary_muscles.add(Muscle.objects.create(name='Triceps'))
+        self.squat = Exercise.objects.create(name='Squat')
+        self.squat.primary_muscles.add(Muscle.objects.create(name='Quadriceps'))
+
+    # Create workout through API, sessions: list of (exercise, [(weight, reps), ...])
+    def create_workout(self, sessions, start_time='2026-01-05T10:00:00Z'):
+        response = self.client.post('/api/workouts/', {
+            'name': 'Workout',
+            'start_time': start_time,
+            'exercises': [
+                {
+                    'exercise_id': exercise.id,
+                    'order': order,
+                    'sets': [{'weight': weight, 'reps': reps, 'order': i} for i, (weight, reps) in enumerate(sets)],
+                }
+                for order, (exercise, sets) in enumerate(sessions)
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Workout.objects.get(id=response.json()['id'])
+
+
+class WorkoutTestCase(WorkoutTestMixin, TestCase):
+    pass
+
+
+class PersonalRecordTests(WorkoutTestCase):
+    def record(self):
+        return PersonalRecord.objects.get(user=self.user, exercise=self.bench)
+
+    def bench_set(self, workout):
+        return WorkoutSet.objects.get(workout_exercise__workout=workout, workout_exercise__exercise=self.bench)
+
+    def edit_set(self, one_set, weight):
+        response = self.client.patch(f'/api/workout-sets/{one_set.id}/', {'weight': weight}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_new_record(self):
+        response = self.client.post('/api/workouts/', {
+            'name': 'Workout', 'start_time': '2026-01-05T10:00:00Z',
+            'exercises': [{'exercise_id': self.bench.id, 'order': 0, 'sets': [{'weight': 100, 'reps': 5}]}],
+        }, format='json')
+        self.assertEqual(response.json()['new_records'], [
+            {'exercise_id': self.bench.id, 'exercise_name': 'Bench Press', 'old_1rm': 0.0, 'new_1rm': 116.7},
+        ])
+        second = self.create_workout([(self.bench, [(110, 5)])], start_time='2026-01-06T10:00:00Z')
+        record = self.record()
+        self.assertEqual((record.best_1rm, record.previous_1rm), (128.3, 116.7))
+        self.assertEqual(record.best_1rm_exercise.workout, second)
+        self.assertEqual((record.max_weight, record.max_weight_reps), (110, 5))
+
+    def test_lowered_holder_falls_back_to_next_best(self):
+        first = self.create_workout([(self.bench, [(100, 5)])])
+        second = self.create_workout([(self.bench, [(110, 5)])], start_time='2026-01-06T10:00:00Z')
+        self.edit_set(self.bench_set(second), 90)
+        record = self.record()
+        self.assertEqual((record.best_1rm, record.previous_1rm), (116.7, 105.0))
+        self.assertEqual(record.best_1rm_exercise.workout, first)
+        self.assertEqual(record.max_weight, 100)
+
+    def test_deleted_holder(self):
+        first = self.create_workout([(self.bench, [(100, 5)])])
+        second = self.create_workout([(self.bench, [(110, 5)])], start_time='2026-01-06T10:00:00Z')
+        self.assertEqual(self.client.delete(f'/api/workouts/{second.id}/').status_code, 204)
+        record = self.record()
+        self.assertEqual((record.best_1rm, record.previous_1rm), (116.7, 0.0))
+        self.assertEqual(record.best_1rm_exercise.workout, first)
+        self.assertEqual(record.max_weight_exercise.workout, first)
+        self.assertEqual(self.client.delete(f'/api/workouts/{first.id}/').status_code, 204)
+        self.assertFalse(PersonalRecord.objects.exists())
+
+    def test_edited_runner_up(self):
+        first = self.create_workout([(self.bench, [(100, 5)])])
+        self.create_workout([(self.bench, [(110, 5)])], start_time='2026-01-06T10:00:00Z')
+        self.edit_set(self.bench_set(first), 80)
+        self.assertEqual((self.record().best_1rm, self.record().previous_1rm), (128.3, 93.3))
+        self.edit_set(self.bench_set(first), 120)
+        self.assertEqual((self.record().best_1rm, self.record().previous_1rm), (140.0, 128.3))
+
+    def test_record_created_by_concurrent_summary(self):
+        self.create_workout([(self.bench, [(110, 5)])])
+        workout = Workout.objects.create(user=self.user, start_time='2026-01-06T10:00:00Z')
+        workout.refresh_from_db()
+        session = WorkoutExercise.objects.create(workout=workout, exercise=self.bench)
+        WorkoutSet.objects.create(workout_exercise=session, weight=100, reps=5, estimated_1rm=estimate_1rm('epley', 100, 5))
+        # Summary reads records before the other one inserted its record
+        filter_records = PersonalRecord.objects.filter
+        reads = iter([lambda **kwargs: PersonalRecord.objects.none()])
+        with mock.patch.object(PersonalRecord.objects, 'filter', side_effect=lambda **kwargs: next(reads, filter_records)(**kwargs)):
+            calculate_workout_summary(workout)
+        record = self.record()
+        self.assertEqual((record.best_1rm, record.previous_1rm), (128.3, 116.7))
+        self.assertEqual(record.max_weight, 110)
+
+    def test_rebuild_several_exercises(self):
+        self.create_workout([(self.bench, [(100, 5)]), (self.squat, [(140, 3), (150, 1)])])
+        self.create_workout([(self.bench, [(90, 10)])], start_time='2026-01-06T10:00:00Z')
+        PersonalRecord.objects.update(best_1rm=0, previous_1rm=0, max_weight=0)
+        # Best sessions, heaviest sets, records and one update, whatever the number of exercises
+        with self.assertNumQueries(4):
+            rebuild_personal_records(self.user, [self.bench.id, self.squat.id])
+        bench, squat = self.record(), PersonalRecord.objects.get(exercise=self.squat)
+        self.assertEqual((bench.best_1rm, bench.previous_1rm, bench.max_weight), (120.0, 116.7, 100))
+        self.assertEqual((squat.best_1rm, squat.previous_1rm, squat.max_weight, squat.max_weight_reps), (154.0, 0.0, 150, 1))
+
+
+class WorkoutCreateTests(WorkoutTestCase):
+    def test_session_stats_computed_once_by_summary(self):
+        workout = self.create_workout([(self.bench, [(100, 5), (80, 8)]), (self.squat, [(120, 5)])])
+        sessions = {session.exercise_id: session for session in workout.exercises.all()}
+        self.assertEqual((sessions[self.bench.id].session_volume, sessions[self.bench.id].session_1rm), (1140.0, 116.7))
+        self.assertEqual((sessions[self.squat.id].session_volume, sessions[self.squat.id].session_1rm), (600.0, 140.0))
+        self.assertEqual(workout.total_volume, 1740.0)
+
+    # Exercises and sets are inserted in bulk, so payload size does not change number of queries
+    def test_create_queries_do_not_grow_with_payload(self):
+        # Records and catalogue index exist after first workout
+        self.create_workout([(self.bench, [(100, 5)]), (self.squat, [(120, 5)])])
+        counts = []
+        for sessions in ([(self.bench, [(90, 5)]), (self.squat, [(100, 5)])], [(self.bench, [(90, 5)] * 5), (self.squat, [(100, 5)] * 5)] * 2):
+            with CaptureQueriesContext(connection) as queries:
+                self.create_workout(sessions)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class WorkoutDeleteTests(WorkoutTestCase):
+    def test_failed_delete_is_rolled_back(self):
+        workout = self.create_workout([(self.bench, [(100, 5)])])
+        with mock.patch('workouts.views.refresh_daily_volume', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.client.delete(f'/api/workouts/{workout.id}/')
+        self.assertTrue(Workout.objects.filter(id=workout.id).exists())
+        self.assertFalse(DeletedWorkout.objects.exists())
+        self.assertEqual(PersonalRecord.objects.get().best_1rm_exercise.workout, workout)
+
+
+class RebuildVolumeRollupsTests(WorkoutTestCase):
+    def test_drops_rollups_of_user_without_workouts(self):
+        workout = self.create_workout([(self.bench, [(100, 5)])])
+        Workout.objects.filter(id=workout.id).delete()
+        call_command('rebuild_volume_rollups', stdout=io.StringIO())
+        self.assertFalse(DailyVolume.objects.exists())
+
+
+class WorkoutListTests(WorkoutTestCase):
+    def list_ids(self, params):
+        response = self.client.get('/api/workouts/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [workout['id'] for workout in response.json()['results']], response.json()['next']
+
+    # Newest first, workouts with equal start time ordered by id across page boundaries
+    def test_cursor_pages(self):
+        same_time = [Workout.objects.create(user=self.user, start_time='2026-01-05T10:00:00Z').id for _ in range(3)]
+        older = Workout.objects.create(user=self.user, start_time='2026-01-04T10:00:00Z').id
+        newer = Workout.objects.create(user=self.user, start_time='2026-01-06T10:00:00Z').id
+        ids, next_url = self.list_ids({'page_size': 2})
+        pages = [ids]
+        while next_url:
+            response = self.client.get(next_url)
+            pages.append([workout['id'] for workout in response.json()['results']])
+            next_url = response.json()['next']
+        self.assertEqual(pages, [[newer, same_time[2]], [same_time[1], same_time[0]], [older]])
+
+    # Dates are days in user timezone: 23:30 UTC on 5th is 6th in Warsaw
+    def test_date_range_in_user_timezone(self):
+        self.user.timezone = 'Europe/Warsaw'
+        self.user.save()
+        late = Workout.objects.create(user=self.user, start_time='2026-01-05T23:30:00Z').id
+        early = Workout.objects.create(user=self.user, start_time='2026-01-05T22:30:00Z').id
+        self.assertEqual(self.list_ids({'from_date': '2026-01-06'})[0], [late])
+        self.assertEqual(self.list_ids({'to_date': '2026-01-05'})[0], [early])
+        self.assertEqual(self.list_ids({'from_date': '2026-01-05', 'to_date': '2026-01-06'})[0], [late, early])
+
+
+class CalendarTests(WorkoutTestCase):
+    def get_calendar(self, params):
+        response = self.client.get('/api/workouts/calendar/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_range_rolls_over_year(self):
+        for month, months, last_day in (('2025-12', 2, '2026-01-31'), ('2025-11', 3, '2026-01-31'),
+                                        ('2025-12', 1, '2025-12-31'), ('2025-01', 12, '2025-12-31'),
+                                        ('2024-02', 1, '2024-02-29')):
+            with self.subTest(month=month, months=months):
+                calendar = self.get_calendar({'month': month, 'months': months})
+                self.assertEqual((calendar['from'], calendar['to']), (f'{month}-01', last_day))
+
+    # Days are local to user, range edges follow user timezone too
+    def test_days_across_year_end(self):
+        self.user.timezone = 'Europe/Warsaw'
+        self.user.save()
+        for start_time in ('2025-11-30T23:30:00Z', '2025-12-31T23:30:00Z', '2026-01-31T23:30:00Z'):
+            Workout.objects.create(user=self.user, start_time=start_time, total_volume=100)
+        calendar = self.get_calendar({'month': '2025-12', 'months': 2})
+        self.assertEqual(
+            [(day['date'], day['workouts_count'], day['total_volume']) for day in calendar['days']],
+            [('2025-12-01', 1, 100), ('2026-01-01', 1, 100)])
+
+    def test_invalid_params(self):
+        for params in ({'month': '2025-13'}, {'months': 0}, {'months': 13}, {'months': 'two'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/workouts/calendar/', params).status_code, 400)
+
+
+class DownsampleTests(SimpleTestCase):
+    def series(self, values):
+        return [(float(x), float(y), x) for x, y in enumerate(values)]
+
+    def test_short_series_unchanged(self):
+        for values in ([], [5], [5, 7], [5, 7, 6]):
+            for threshold in (3, 100):
+                with self.subTest(values=values, threshold=threshold):
+                    self.assertEqual(downsample_lttb(self.series(values), threshold), list(range(len(values))))
+
+    def test_keeps_ends_and_peaks(self):
+        values = [10, 11, 10, 12, 40, 12, 11, 13, 12, 0, 12, 14]
+        self.assertEqual(downsample_lttb(self.series(values), 3), [0, 4, 11])
+        selected = downsample_lttb(self.series(values), 5)
+        self.assertEqual(len(selected), 5)
+        self.assertEqual((selected[0], selected[-1]), (0, 11))
+        self.assertTrue({4, 9} <= set(selected))
+
+    def test_threshold_below_three(self):
+        values = [10, 20, 30, 40]
+        self.assertEqual(downsample_lttb(self.series(values), 2), [0, 3])
+        self.assertEqual(downsample_lttb(self.series(values), 1), [0])
+
+
+class PartialWorkoutUpdateTests(WorkoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.workout = self.create_workout([(self.bench, [(100, 5), (80, 8)])])
+        self.session = WorkoutExercise.objects.get(workout=self.workout)
+        self.first_set = self.session.sets.get(order=0)
+
+    def patch(self, exercises):
+        return self.client.patch(f'/api/workouts/{self.workout.id}/', {'exercises': exercises}, format='json')
+
+    def test_exercise_without_sets_keeps_them(self):
+        response = self.patch([{'id': self.session.id, 'order': 2}])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.order, 2)
+        self.assertEqual(self.session.exercise_id, self.bench.id)
+        self.assertEqual(self.session.sets.count(), 2)
+        self.assertEqual(self.session.session_volume, 1140)
+
+    def test_set_without_reps_keeps_stored_values(self):
+        response = self.patch([{'id': self.session.id, 'sets': [{'id': self.first_set.id, 'weight': 110}]}])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.first_set.refresh_from_db()
+        self.assertEqual((self.first_set.weight, self.first_set.reps), (110, 5))
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.session_volume, 550)
+
+    def test_new_exercise_requires_exercise_id_and_sets(self):
+        response = self.patch([{'id': self.session.id}, {'order': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('exercise_id, sets', str(response.json()))
+
+    def test_new_set_requires_reps(self):
+        response = self.patch([{'id': self.session.id, 'sets': [{'weight': 50}]}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_set_of_other_exercise_is_rejected(self):
+        other = self.create_workout([(self.squat, [(120, 5)])])
+        other_set = WorkoutSet.objects.get(workout_exercise__workout=other)
+        response = self.patch([{'id': self.session.id, 'sets': [{'id': other_set.id, 'reps': 1}]}])
+        self.assertEqual(response.status_code, 400)
+        other_set.refresh_from_db()
+        self.assertEqual(other_set.reps, 5)
+        self.assertEqual(self.session.sets.count(), 2)
+
+
+class BatchSetsTests(WorkoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.workout = self.create_workout([(self.bench, [(100, 5), (100, 5), (100, 5)])])
+        self.session = self.workout.exercises.get()
+        self.sets = list(self.session.sets.order_by('order'))
+        self.url = f'/api/workouts/{self.workout.id}/sets/batch/'
+
+    def test_mixed_operations(self):
+        operations = [
+            {'op': 'create', 'workout_exercise_id': self.session.id, 'weight': 60, 'reps': 10, 'order': 3},
+            {'op': 'update', 'id': self.sets[0].id, 'reps': 8},
+            {'op': 'update', 'id': self.sets[1].id, 'order': 5},
+            {'op': 'delete', 'id': self.sets[2].id},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['total_volume'], 800 + 500 + 600)
+        self.assertEqual(
+            list(self.session.sets.order_by('order').values_list('id', 'reps', 'order')),
+            [(self.sets[0].id, 8, 0), (response.json()['created'][0], 10, 3), (self.sets[1].id, 5, 5)])
+        self.assertEqual(WorkoutSet.objects.get(id=self.sets[0].id).estimated_1rm, estimate_1rm('epley', 100, 8))
+
+        # Each set writes only its own changed fields
+        updates = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('UPDATE "workouts_workoutset"')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(sum('"weight"' in sql for sql in updates), 0)
+        self.assertEqual(sum('"estimated_1rm"' in sql for sql in updates), 1)
+
+    def test_foreign_sets_rejected(self):
+        other = get_user_model().objects.create_user(username='other', email='other@example.com', password='secret')
+        other_workout = Workout.objects.create(user=other, start_time='2026-01-05T10:00:00Z')
+        other_set = other_workout.exercises.create(exercise=self.bench).sets.create(weight=50, reps=5)
+        own_workout = self.create_workout([(self.squat, [(100, 5)])])
+        own_set = WorkoutSet.objects.get(workout_exercise__workout=own_workout)
+        for foreign_id in (other_set.id, own_set.id):
+            with self.subTest(set_id=foreign_id):
+                operations = [
+                    {'op': 'update', 'id': self.sets[0].id, 'reps': 8},
+                    {'op': 'delete', 'id': foreign_id},
+                ]
+                response = self.client.post(self.url, {'operations': operations}, format='json')
+                self.assertEqual(response.status_code, 400, response.content)
+                self.assertEqual(WorkoutSet.objects.get(id=self.sets[0].id).reps, 5)
+                self.assertTrue(WorkoutSet.objects.filter(id=foreign_id).exists())
+
+
+class DeferredSummaryTests(WorkoutTestCase):
+    def test_edits_in_block_share_one_summary(self):
+        workout = self.create_workout([(self.bench, [(100, 5), (100, 5), (100, 5)])])
+        session = workout.exercises.get()
+        with mock.patch('workouts.deferred.calculate_workout_summary', wraps=calculate_workout_summary) as summary:
+            with deferred_summaries():
+                for reps, one_set in enumerate(session.sets.all(), start=6):
+                    one_set.reps = reps
+                    one_set.save()
+                    mark_workout_dirty(workout, [session.id])
+        self.assertEqual(summary.call_count, 1)
+        self.assertEqual(Workout.objects.get(id=workout.id).total_volume, 2100)
+
+    # Summary runs before commit, failed one does not leave committed edit with stale stats
+    def test_failed_summary_rolls_back_edit(self):
+        workout = self.create_workout([(self.bench, [(100, 5)])])
+        one_set = WorkoutSet.objects.get()
+        with mock.patch('workouts.deferred.calculate_workout_summary', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.client.patch(f'/api/workout-sets/{one_set.id}/', {'reps': 10}, format='json')
+        self.assertEqual(WorkoutSet.objects.get().reps, 5)
+        self.assertEqual(Workout.objects.get(id=workout.id).total_volume, 500)
+
+    def test_exercise_change_rebuilds_old_records_in_summary(self):
+        workout = self.create_workout([(self.bench, [(100, 5)])])
+        session = workout.exercises.get()
+        with mock.patch('workouts.deferred.rebuild_personal_records', wraps=rebuild_personal_records) as rebuild:
+            response = self.client.patch(f'/api/workout-exercises/{session.id}/', {'exercise_id': self.squat.id}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        rebuild.assert_called_once_with(self.user, {self.bench.id})
+        self.assertEqual(list(PersonalRecord.objects.values_list('exercise_id', flat=True)), [self.squat.id])
+
+
+# Sync positions are transaction ids, so every write has to commit on its own
+@mock.patch('workouts.views.SYNC_PAGE_SIZE', 2)
+class SyncTests(WorkoutTestMixin, TransactionTestCase):
+    def sync(self, token=None):
+        response = self.client.get('/api/workouts/sync/', {'since': token} if token else {})
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        return [workout['id'] for workout in data['workouts']], data['deleted'], data['has_more'], data['token']
+
+    def full_sync(self, token=None):
+        workouts, deleted, has_more, token = self.sync(token)
+        while has_more:
+            page, page_deleted, has_more, token = self.sync(token)
+            self.assertEqual(page_deleted, [])
+            workouts += page
+        return workouts, deleted, token
+
+    def test_token_round_trip(self):
+        first, second, third = (self.create_workout([(self.bench, [(100, 5)])]) for _ in range(3))
+        self.assertEqual(self.sync()[:3], ([first.id, second.id], [], True))
+        workouts, deleted, token = self.full_sync()
+        self.assertEqual((workouts, deleted), ([first.id, second.id, third.id], []))
+        self.assertEqual(self.full_sync(token)[:2], ([], []))
+
+        one_set = WorkoutSet.objects.get(workout_exercise__workout=second)
+        self.client.patch(f'/api/workout-sets/{one_set.id}/', {'reps': 7}, format='json')
+        self.client.delete(f'/api/workouts/{first.id}/')
+        workouts, deleted, token = self.full_sync(token)
+        self.assertEqual((workouts, deleted), ([second.id], [first.id]))
+        self.assertEqual(self.full_sync(token)[:2], ([], []))
+
+    # Deletions come with first page only, later pages of the same sync do not repeat them
+    def test_deletions_sent_once(self):
+        _, _, token = self.full_sync()
+        workouts = [self.create_workout([(self.bench, [(100, 5)])]) for _ in range(5)]
+        for workout in workouts[:2]:
+            self.client.delete(f'/api/workouts/{workout.id}/')
+        synced, deleted, _ = self.full_sync(token)
+        self.assertEqual(synced, [workout.id for workout in workouts[2:]])
+        self.assertEqual(sorted(deleted), [workout.id for workout in workouts[:2]])
+
+    # Edit committed after sync read history, by transaction started before it, comes with next sync
+    def test_late_commit_not_missed(self):
+        workout = self.create_workout([(self.bench, [(100, 5)])])
+        _, _, token = self.full_sync()
+        written, release = threading.Event(), threading.Event()
+
+        def slow_edit():
+            try:
+                with transaction.atomic():
+                    Workout.objects.get(id=workout.id).save()
+                    written.set()
+                    release.wait(10)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=slow_edit)
+        thread.start()
+        written.wait(10)
+        synced, _, token_during_edit = self.full_sync(token)
+        self.assertEqual(synced, [])
+        release.set()
+        thread.join()
+        self.assertEqual(self.full_sync(token_during_edit)[0], [workout.id])
+
+    def test_invalid_and_expired_tokens(self):
+        _, _, token = self.full_sync()
+        for invalid in ('abc', '1-2', '1-2-x-4'):
+            self.assertEqual(self.client.get('/api/workouts/sync/', {'since': invalid}).status_code, 400)
+        with override_settings(SYNC_TOMBSTONE_TTL=-1):
+            response = self.client.get('/api/workouts/sync/', {'since': token})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('expired', response.json()['since'])
+
+    def test_prune_tombstones(self):
+        workouts = [self.create_workout([(self.bench, [(100, 5)])]) for _ in range(2)]
+        for workout in workouts:
+            self.client.delete(f'/api/workouts/{workout.id}/')
+        DeletedWorkout.objects.filter(workout_id=workouts[0].id).update(deleted_at=timezone.now() - timedelta(days=365))
+        call_command('prune_sync_tombstones', stdout=io.StringIO())
+        self.assertEqual(list(DeletedWorkout.objects.values_list('workout_id', flat=True)), [workouts[1].id])
+
+
+# Rendering workouts costs the same number of queries whatever the number of exercises and sets (no N+1)
+class WorkoutQueryCountTests(WorkoutTestCase):
+    def small_and_large(self):
+        small = self.create_workout([(self.bench, [(100, 5)])])
+        large = self.create_workout(
+            [(exercise, [(100, 5)] * 5) for exercise in (self.bench, self.squat, self.bench, self.squat)],
+            start_time='2026-01-06T10:00:00Z',
+        )
+        return small, large
+
+    # Workout, exercises, sets, exercise catalogue rows, muscles and equipment (one query per relation)
+    def test_workout_detail(self):
+        for workout in self.small_and_large():
+            with self.assertNumQueries(7):
+                response = self.client.get(f'/api/workouts/{workout.id}/')
+            self.assertEqual(len(response.json()['exercises']), workout.exercises.count())
+            self.assertEqual(response.json()['exercises'][0]['exercise_details']['primary_muscles'], ['Chest'])
+
+    # Exercises with workout and exercise joined, sets, muscles and equipment
+    def test_workout_exercise_list(self):
+        small, large = self.small_and_large()
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/workout-exercises/')
+        self.assertEqual(len(response.json()), 5)
+        WorkoutExercise.objects.filter(workout=large).delete()
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/workout-exercises/')
+        self.assertEqual(len(response.json()), 1)
+
+    def test_workout_exercise_detail(self):
+        for workout in self.small_and_large():
+            session = workout.exercises.first()
+            with self.assertNumQueries(5):
+                response = self.client.get(f'/api/workout-exercises/{session.id}/')
+            self.assertEqual(len(response.json()['sets']), session.sets.count())
+
+
+# Volume and best estimated 1RM of one session computed in Python, reference for database aggregates
+# sets: iterable of (weight, reps, estimated_1rm)
+def calculate_session_stats(sets):
+    session_volume = 0.0
+    session_1rm = 0.0
+    for weight, reps, estimated_1rm in sets:
+        session_volume += float(weight) * reps
+        session_1rm = max(session_1rm, estimated_1rm)
+    return round(session_volume, 1), round(session_1rm, 1)
+
+# Database aggregates of session stats match Python reference
+class SessionStatsTests(WorkoutTestCase):
+    SETS = [
+        [(Decimal('100'), 5, None), (Decimal('102.5'), 1, Decimal('9')), (Decimal('60'), 12, Decimal('7.5'))],
+        [(Decimal('80'), 40, None), (Decimal('0'), 10, None), (Decimal('20'), 0, None)],
+    ]
+
+    def setUp(self):
+        super().setUp()
+        workout = Workout.objects.create(user=self.user, start_time='2026-01-05T10:00:00Z')
+        for order, (exercise, sets) in enumerate(zip((self.bench, self.squat), self.SETS)):
+            session = WorkoutExercise.objects.create(workout=workout, exercise=exercise, order=order)
+            WorkoutSet.objects.bulk_create(
+                WorkoutSet(workout_exercise=session, weight=weight, reps=reps, rpe=rpe, order=i,
+                           estimated_1rm=estimate_1rm('epley', weight, reps, rpe))
+                for i, (weight, reps, rpe) in enumerate(sets)
+            )
+
+    def database_stats(self, formula=None):
+        return {
+            exercise_id: (round(volume, 1), round(best_1rm, 1))
+            for exercise_id, volume, best_1rm in WorkoutSet.objects
+            .values('workout_exercise__exercise_id')
+            .annotate(**aggregate_session_stats(formula=formula))
+            .values_list('workout_exercise__exercise_id', 'sets_volume', 'sets_1rm')
+            .order_by()
+        }
+
+    def python_stats(self, formula):
+        return {
+            exercise.id: calculate_session_stats(
+                (weight, reps, estimate_1rm(formula, weight, reps, rpe)) for weight, reps, rpe in sets)
+            for exercise, sets in zip((self.bench, self.squat), self.SETS)
+        }
+
+    def test_stored_estimates(self):
+        self.assertEqual(self.database_stats(), self.python_stats('epley'))
+
+    def test_formula_expressions(self):
+        for formula in ESTIMATORS:
+            with self.subTest(formula=formula):
+                self.assertEqual(self.database_stats(formula), self.python_stats(formula))
+
+    # Every formula a user can choose has an estimator, unknown ones would silently fall back to Epley
+    def test_choices_have_estimators(self):
+        from users.models import FORMULA_CHOICES
+        self.assertEqual({name for name, _ in FORMULA_CHOICES}, set(ESTIMATORS))
+
+
+class IdempotencyKeyTests(WorkoutTestCase):
+    def post(self, name):
+        return self.client.post(
+            '/api/workouts/', {'name': name, 'start_time': '2026-01-05T10:00:00Z', 'exercises': []},
+            format='json', headers={'Idempotency-Key': 'retry-1'})
+
+    def test_expired_key_runs_request_again(self):
+        first = self.post('First')
+        self.assertEqual(first.status_code, 201, first.content)
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=30))
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.post('Second')
+        self.assertEqual(second.status_code, 201, second.content)
+        self.assertNotIn('Idempotent-Replayed', second.headers)
+        self.assertNotEqual(second.json()['id'], first.json()['id'])
+        self.assertTrue(any('FOR UPDATE' in query['sql'] for query in queries))
+
+        record = IdempotencyKey.objects.get()
+        self.assertGreater(record.created_at, timezone.now() - timedelta(minutes=1))
+        self.assertEqual(record.response['id'], second.json()['id'])
+        self.assertEqual(self.post('Second').headers['Idempotent-Replayed'], 'true')
+
+
+# Weekly stats authenticate with token only, user row is not loaded
+class WeeklyStatsCacheTests(WorkoutTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def get_stats(self):
+        response = self.client.get('/api/workouts/weekly-stats/')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def test_hit_after_miss(self):
+        self.assertEqual(self.get_stats()['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_stats()['X-Cache'], 'HIT')
+
+    def test_write_bumps_version(self):
+        self.get_stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_workout([(self.bench, [(100, 5)])], start_time=timezone.now().isoformat())
+        response = self.get_stats()
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['workouts_count'], 1)
+
+    # Token user id is a string, columnar history is keyed by integer id like on other endpoints
+    @skipIf(np is None, 'NumPy not installed')
+    def test_history_keyed_by_user_id(self):
+        self.get_stats()
+        self.assertIs(get_user_history(self.user.id), get_user_history(self.user.id))
+        self.assertNotIn(str(self.user.id), columnar._histories)
+
+    def test_inactive_user_rejected(self):
+        self.get_stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get('/api/workouts/weekly-stats/').status_code, 401)
+
+
+# Statistics from columnar history match database queries
+@skipIf(np is None, 'NumPy is not installed')
+class ColumnarStatsTests(WorkoutTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        generate_history(self.user, [self.bench.id, self.squat.id], 400, days=120, exercises_per_workout=2)
+        # Fractional weights (rollups sum rounded session volumes) and session without sets
+        for days_ago in (1, 3, 40):
+            self.create_workout(
+                [(self.bench, [(22.75, 3), (17.35, 7), (0.45, 11)]), (self.squat, [])],
+                start_time=(timezone.now() - timedelta(days=days_ago)).isoformat())
+        recalculate_user_history(self.user)
+        # Local days differ from UTC ones for evening workouts
+        self.user.timezone = 'America/New_York'
+        self.user.save()
+        rebuild_daily_volume(self.user)
+
+    def assertSameStats(self, compute):
+        columnar = compute()
+        with override_settings(COLUMNAR_CACHE_USERS=0):
+            self.assertEqual(columnar, compute())
+
+    def test_parity_with_database(self):
+        def weekly_stats():
+            stats = get_weekly_stats(self.user)
+            return stats | {'body_parts': sorted(stats['body_parts'], key=lambda part: part['slug'])}
+
+        self.assertIsNotNone(get_user_history(self.user.id))
+        self.assertSameStats(weekly_stats)
+        for days in (30, 90):
+            self.assertSameStats(lambda: get_muscle_stats(self.user, days))
+        for granularity in ('day', 'week', 'month'):
+            for muscle in (None, 'chest', 'Quadriceps', 'nothing'):
+                with self.subTest(granularity=granularity, muscle=muscle):
+                    self.assertSameStats(lambda: get_workouts_volume(self.user, muscle, 100, granularity))
+
+    def test_short_windows_do_not_load(self):
+        get_weekly_stats(self.user)
+        get_muscle_stats(self.user, 30)
+        get_workouts_volume(self.user, None, 30, 'day')
+        self.assertIsNone(get_user_history(self.user.id, load=False))
+        get_workouts_volume(self.user, None, 365, 'month')
+        self.assertIsNotNone(get_user_history(self.user.id, load=False))
+
+    def test_reloaded_after_commit_of_write(self):
+        history = get_user_history(self.user.id)
+        one_set = WorkoutSet.objects.filter(workout_exercise__workout__user=self.user).first()
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.patch(f'/api/workout-sets/{one_set.id}/', {'reps': 20}, format='json')
+            self.assertEqual(response.status_code, 200, response.content)
+        # Not bumped before commit, request reading in between would cache old data under new version
+        self.assertIs(get_user_history(self.user.id), history)
+        for callback in callbacks:
+            callback()
+        self.assertIsNot(get_user_history(self.user.id), history)
+
+    def test_reloaded_after_max_age(self):
+        history = get_user_history(self.user.id)
+        self.assertIs(get_user_history(self.user.id), history)
+        with override_settings(COLUMNAR_CACHE_MAX_AGE=0):
+            self.assertIsNot(get_user_history(self.user.id), history)
@@ -1,40 +1,113 @@
 from rest_framework import viewsets, permissions, exceptions
-from .models import Workout, WorkoutSet, WorkoutExercise
-from .serializers import WorkoutSerializer, WorkoutSetSerializer, WorkoutExerciseSerializer, WorkoutListSerializer
+from .models import Workout, WorkoutSet, WorkoutExercise, DeletedWorkout
+from exercises.models import exercise_details_prefetches
+from .serializers import WorkoutSerializer, WorkoutSetSerializer, WorkoutExerciseSerializer, WorkoutListSerializer, WorkoutListSummarySerializer, BatchSetsSerializer, CompactWorkoutSerializer, side_load_exercises
 from django_filters import rest_framework as filters
-from .services import get_weekly_stats, get_workouts_volume, calculate_workout_summary
+from django.conf import settings
+from django.utils import timezone
+from datetime import datetime, timedelta
+from .services import get_weekly_stats, get_workouts_volume, get_muscle_stats, get_calendar, get_workout_changes, get_sync_floor, calculate_workout_summary, rebuild_personal_records, refresh_daily_volume, day_range, local_day, CHART_GRANULARITY
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
+from django.db import transaction
+from django.db.models import Count
 from rest_framework.response import Response
+from .authentication import CachedUserAuthentication
+from .cache import get_cached_stats, invalidate_user_stats
+from .deferred import deferred_summaries, mark_workout_dirty
+from .idempotency import idempotent
 import time
 class WorkoutFilter(filters.FilterSet):
     # date = filters.DateFilter(field_name='start_time', lookup_expr='date')
-    # Data range filters
-    from_date = filters.DateFilter(field_name='start_time', lookup_expr='date__gte')
-    to_date = filters.DateFilter(field_name='start_time', lookup_expr='date__lte')
+    # Data range filters in user timezone, compared with raw start_time so (user, start_time) index is used
+    from_date = filters.DateFilter(method='filter_from_date')
+    to_date = filters.DateFilter(method='filter_to_date')
 
     class Meta:
         model = Workout
         fields = []
 
+    def filter_from_date(self, queryset, name, value):
+        return queryset.filter(start_time__gte=day_range(value, value, self.request.user.get_timezone())[0])
+
+    def filter_to_date(self, queryset, name, value):
+        return queryset.filter(start_time__lt=day_range(value, value, self.request.user.get_timezone())[1])
+
+# Delta sync tokens "<floor>-<txid>-<id>-<issued>"
+# txid, id: position of last workout sent, workouts are sent in order of transaction which wrote them
+# floor: oldest transaction running when sync started, next sync starts from it so changes committed late are not missed
+# issued: unix time floor was taken, older tokens than SYNC_TOMBSTONE_TTL may miss pruned deletions
+SYNC_PAGE_SIZE = 100
+
+def encode_sync_token(floor, txid, id, issued):
+    return f"{floor}-{txid}-{id}-{issued}"
+
+def decode_sync_token(token):
+    floor, txid, id, issued = map(int, token.split('-'))
+    return floor, txid, id, issued
+
+# Cursor pagination over (user, -start_time) index, stable while new workouts are added
+class WorkoutCursorPagination(CursorPagination):
+    ordering = ('-start_time', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
 # Auto-generated CRUD endpoints for Workout
 class WorkoutViewSet(viewsets.ModelViewSet):
     serializer_class = WorkoutSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = WorkoutCursorPagination
 
     filter_backends = [filters.DjangoFilterBackend]
     filterset_class = WorkoutFilter
 
+    # ?summary=true adds exercise and set counts to list rows
+    def _with_summary(self):
+        return self.request.query_params.get('summary') in ('1', 'true')
+
+    # ?compact=true sends exercises by id with their details side-loaded once
+    def _compact(self):
+        return self.request.query_params.get('compact') in ('1', 'true')
+
     def get_serializer_class(self):
         if self.action == 'list':
-            return WorkoutListSerializer
+            return WorkoutListSummarySerializer if self._with_summary() else WorkoutListSerializer
         return WorkoutSerializer
 
     def get_queryset(self):
-        return Workout.objects.filter(user=self.request.user)\
-            .prefetch_related('exercises__sets', 'exercises__exercise')\
-            .order_by('-start_time')
+        queryset = Workout.objects.filter(user=self.request.user).order_by('-start_time')
+
+        if self.action == 'list':
+            # Only columns shown in list, counts computed by database
+            queryset = queryset.only(*WorkoutListSerializer.Meta.fields)
+            if self._with_summary():
+                queryset = queryset.annotate(
+                    exercises_count=Count('exercises', distinct=True),
+                    sets_count=Count('exercises__sets'),
+                )
+            return queryset
+        if self.action == 'retrieve' and self._compact():
+            # Exercise details are side-loaded, sets are enough here
+            return queryset.prefetch_related('exercises__sets')
+        if self.action in ('retrieve', 'update', 'partial_update'):
+            return queryset.prefetch_related(
+                'exercises__sets', 'exercises__exercise',
+                *exercise_details_prefetches('exercises__exercise__'))
+        return queryset
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self._compact():
+            return super().retrieve(request, *args, **kwargs)
+        workout = self.get_object()
+        return Response({
+            'workout': CompactWorkoutSerializer(workout).data,
+            'exercises': side_load_exercises([workout]),
+        })
 
+    # Offline clients retry finished workout with the same Idempotency-Key
+    @idempotent
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -45,33 +118,193 @@ class WorkoutViewSet(viewsets.ModelViewSet):
         return Response(summary_data, status=status.HTTP_201_CREATED)
 
     def update(self, request, *args, **kwargs):
-        response = super().update(request, *args, **kwargs)
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        old_day = local_day(request.user, instance.start_time)
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        with deferred_summaries():
+            workout = serializer.save()
+            # Recalculate summary data after update
+            pending = mark_workout_dirty(workout, record_exercise_ids=serializer.affected_exercise_ids)
+            if local_day(request.user, workout.start_time) != old_day:
+                refresh_daily_volume(workout.user, [old_day])
+        return Response(pending.result)
+
+    def perform_destroy(self, instance):
+        exercise_ids = list(instance.exercises.values_list('exercise_id', flat=True))
+        # Tombstone, records and rollups change together with the delete
+        with transaction.atomic():
+            DeletedWorkout.objects.create(user=instance.user, workout_id=instance.id)
+            instance.delete()
+            # Records held by deleted workout fall back to next best sessions
+            rebuild_personal_records(instance.user, exercise_ids)
+            refresh_daily_volume(instance.user, [local_day(instance.user, instance.start_time)])
+            invalidate_user_stats(instance.user_id)
+
+    # Apply queued set edits of one workout atomically, with one summary recompute
+    # Body: {"operations": [{"op": "create" | "update" | "delete", ...}]}
+    @action(detail=True, methods=['post'], url_path='sets/batch')
+    @idempotent
+    def batch_sets(self, request, pk=None):
         workout = self.get_object()
-        # Recalculate summary data after update
-        summary_data = calculate_workout_summary(workout)
-        return Response(summary_data)
+        serializer = BatchSetsSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
 
-    # Get monthly stats for user
-    @action(detail=False, methods=['get'], url_path='weekly-stats')
+        with deferred_summaries():
+            result = serializer.save(workout=workout)
+            pending = mark_workout_dirty(workout, result['workout_exercise_ids'])
+
+        exercises = WorkoutExercise.objects.filter(id__in=result['workout_exercise_ids'])\
+            .values('id', 'exercise_id', 'session_volume', 'session_1rm')
+        return Response({
+            **pending.result,
+            'created': result['created'],
+            'exercises': list(exercises),
+        })
+
+    # Get weekly stats for user, served from per-user cache
+    # Stateless JWT auth so cache hits do not touch the database
+    @action(detail=False, methods=['get'], url_path='weekly-stats',
+            authentication_classes=[CachedUserAuthentication])
     def weekly_stats(self, request):
-        data = get_weekly_stats(request.user)
-        return Response(data)
+        user_id = int(request.user.id) # Token user id is a string
+        data, hit = get_cached_stats(user_id, 'weekly', lambda: get_weekly_stats(user_id))
+        return Response(data, headers={'X-Cache': 'HIT' if hit else 'MISS'})
+
+    # Sets count and volume per muscle over last ?days=N days (default 30, e.g. 90 for training block)
+    @action(detail=False, methods=['get'], url_path='muscle-stats')
+    def muscle_stats(self, request):
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            raise exceptions.ValidationError({'days': 'Must be an integer.'})
+        if not 0 < days <= 3660:
+            raise exceptions.ValidationError({'days': 'Must be between 1 and 3660.'})
+        return Response(get_muscle_stats(request.user, days))
     
 
+    # Workouts changed since previous sync, in compact form with exercises side-loaded
+    # ?since=<token from previous response>, without it whole history is sent page by page
+    # has_more means client should call again right away with returned token
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        floor, issued = get_sync_floor(), int(time.time())
+        after_txid, after_id, deleted_since = 0, 0, None
+        if request.query_params.get('since'):
+            try:
+                token_floor, after_txid, after_id, token_issued = decode_sync_token(request.query_params['since'])
+            except ValueError:
+                raise exceptions.ValidationError({'since': 'Invalid sync token.'})
+            if after_id:
+                # Next page of the same sync
+                floor, issued = token_floor, token_issued
+            elif issued - token_issued > settings.SYNC_TOMBSTONE_TTL:
+                raise exceptions.ValidationError({'since': 'Sync token expired, sync again without it.'})
+            else:
+                # Deletions are sent once, with first page
+                deleted_since = after_txid
+
+        workouts, deleted, has_more = get_workout_changes(
+            request.user, after_txid, after_id, SYNC_PAGE_SIZE, deleted_since)
+        if has_more:
+            token = encode_sync_token(floor, workouts[-1].sync_txid, workouts[-1].id, issued)
+        else:
+            token = encode_sync_token(floor, floor, 0, issued)
+
+        return Response({
+            'token': token,
+            'has_more': has_more,
+            'workouts': CompactWorkoutSerializer(workouts, many=True).data,
+            'exercises': side_load_exercises(workouts),
+            'deleted': deleted,
+        })
+
+    # Completed workouts per day for calendar
+    # ?month=YYYY-MM (default current month), ?months=N months from it (1-12)
+    @action(detail=False, methods=['get'])
+    def calendar(self, request):
+        try:
+            month = request.query_params.get('month')
+            first_day = datetime.strptime(month, '%Y-%m').date() if month else timezone.localdate(timezone=request.user.get_timezone()).replace(day=1)
+        except ValueError:
+            raise exceptions.ValidationError({'month': 'Must be in format YYYY-MM.'})
+        try:
+            months = int(request.query_params.get('months', 1))
+        except ValueError:
+            raise exceptions.ValidationError({'months': 'Must be an integer.'})
+        if not 0 < months <= 12:
+            raise exceptions.ValidationError({'months': 'Must be between 1 and 12.'})
+
+        next_month = first_day.month - 1 + months
+        last_day = first_day.replace(year=first_day.year + next_month // 12, month=next_month % 12 + 1) - timedelta(days=1)
+        return Response({
+            'from': first_day.isoformat(),
+            'to': last_day.isoformat(),
+            'days': get_calendar(request.user, first_day, last_day),
+        })
+
     # Get volume chart data
     @action(detail=False, methods=['get'], url_path='volume-chart')
     def volume_chart(self, request):
         muscle = request.query_params.get('muscle', None)
+        granularity = request.query_params.get('granularity', 'month')
+        if granularity not in CHART_GRANULARITY:
+            raise exceptions.ValidationError({'granularity': f"Must be one of: {', '.join(CHART_GRANULARITY)}."})
+        try:
+            days = int(request.query_params.get('days', 365))
+        except ValueError:
+            raise exceptions.ValidationError({'days': 'Must be an integer.'})
+        if not 0 < days <= 3660:
+            raise exceptions.ValidationError({'days': 'Must be between 1 and 3660.'})
+
         data = get_workouts_volume(
             user=request.user,
-            muscle=muscle
+            muscle=muscle,
+            days=days,
+            granularity=granularity
         )
         return Response(data)
 
 
 
+# Writes of nested rows recompute workout summary once, at the end of their transaction
+# ?summary=true adds the summary (volume and new records) to response
+# Writes accept Idempotency-Key header
+class DeferredSummaryMixin:
+    pending_summary = None
+
+    def _mark_dirty(self, workout, workout_exercise_ids=None, record_exercise_ids=()):
+        self.pending_summary = mark_workout_dirty(workout, workout_exercise_ids, record_exercise_ids)
+
+    def _add_summary(self, response):
+        if self.pending_summary is None or self.request.query_params.get('summary') not in ('1', 'true'):
+            return response
+        if response.status_code == status.HTTP_204_NO_CONTENT:
+            return Response({'summary': self.pending_summary.result})
+        response.data = {**response.data, 'summary': self.pending_summary.result}
+        return response
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        with deferred_summaries():
+            response = super().create(request, *args, **kwargs)
+        return self._add_summary(response)
+
+    @idempotent
+    def update(self, request, *args, **kwargs):
+        with deferred_summaries():
+            response = super().update(request, *args, **kwargs)
+        return self._add_summary(response)
+
+    @idempotent
+    def destroy(self, request, *args, **kwargs):
+        with deferred_summaries():
+            response = super().destroy(request, *args, **kwargs)
+        return self._add_summary(response)
+
 # Single exercise within a workout
-class WorkoutExerciseViewSet(viewsets.ModelViewSet):
+class WorkoutExerciseViewSet(DeferredSummaryMixin, viewsets.ModelViewSet):
     serializer_class = WorkoutExerciseSerializer
     permission_classes = [permissions.IsAuthenticated]
     # Removes PUT method from allowed methods
@@ -79,40 +312,48 @@ class WorkoutExerciseViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         # User has access only to their workout exercises
-        return WorkoutExercise.objects.filter(workout__user=self.request.user)
+        return WorkoutExercise.objects.filter(workout__user=self.request.user)\
+            .select_related('exercise', 'workout')\
+            .prefetch_related('sets', *exercise_details_prefetches('exercise__'))
 
     def perform_create(self, serializer):
         instance = serializer.save()
-        calculate_workout_summary(instance.workout)
+        self._mark_dirty(instance.workout, [instance.id])
 
     def perform_update(self, serializer):
+        old_exercise_id = serializer.instance.exercise_id
         instance = serializer.save()
-        calculate_workout_summary(instance.workout)
+        # Session no longer counts for previous exercise records
+        old_exercise_ids = [old_exercise_id] if instance.exercise_id != old_exercise_id else []
+        self._mark_dirty(instance.workout, [instance.id], old_exercise_ids)
 
     def perform_destroy(self, instance):
         workout = instance.workout
         instance.delete()
-        calculate_workout_summary(workout)
+        # Nothing to recompute, only total volume of remaining sessions
+        self._mark_dirty(workout, [], [instance.exercise_id])
 
 # Single set within an exercise
-class WorkoutSetViewSet(viewsets.ModelViewSet):
+class WorkoutSetViewSet(DeferredSummaryMixin, viewsets.ModelViewSet):
     serializer_class = WorkoutSetSerializer
     permission_classes = [permissions.IsAuthenticated]
     http_method_names = ['get', 'post', 'patch', 'delete']
 
     def get_queryset(self):
         # User has access only to their workout sets
-        return WorkoutSet.objects.filter(workout_exercise__workout__user=self.request.user)
+        return WorkoutSet.objects.filter(workout_exercise__workout__user=self.request.user)\
+            .select_related('workout_exercise__workout')
 
+    # Only session of changed set is recomputed
     def perform_create(self, serializer):
         instance = serializer.save()
-        calculate_workout_summary(instance.workout_exercise.workout)
+        self._mark_dirty(instance.workout_exercise.workout, [instance.workout_exercise_id])
 
     def perform_update(self, serializer):
         instance = serializer.save()
-        calculate_workout_summary(instance.workout_exercise.workout)
+        self._mark_dirty(instance.workout_exercise.workout, [instance.workout_exercise_id])
 
     def perform_destroy(self, instance):
         workout = instance.workout_exercise.workout
         instance.delete()
-        calculate_workout_summary(workout)
\ No newline at end of file
+        self._mark_dirty(workout, [instance.workout_exercise_id])
@@ -5,7 +5,6 @@ import { useLocalSearchParams, useRouter } from 'expo-router';
 import { SafeAreaView } from 'react-native-safe-area-context';
 import { Ionicons } from '@expo/vector-icons';
 import { useWorkoutDetail } from '@/hooks/useWorkoutDetail'; 
-import { calculateOneRepMax } from '@/utils/calculations';
 export default function WorkoutDetailScreen() {
     const { id } = useLocalSearchParams();
     const router = useRouter();
@@ -132,7 +131,7 @@ export default function WorkoutDetailScreen() {
                         {set.reps}
                     </Text>
                     <Text className="text-gray-500 flex-1 text-center text-sm mt-0.5">
-                        {calculateOneRepMax(set.weight, set.reps.toString())}
+                        {set.estimated_1rm > 0 ? Math.round(set.estimated_1rm) : '-'}
                     </Text>
                 </TouchableOpacity>
             ))}
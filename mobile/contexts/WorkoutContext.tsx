@@ -231,7 +231,8 @@ export function WorkoutProvider({ children }: { children: ReactNode }) {
                 return;
             }
 
-            const summaryData = await createWorkout(payload);
+            // Start time is persisted with workout, so retries after failure or app restart reuse the key
+            const summaryData = await createWorkout(payload, `workout-${startTime}`);
             setLastWorkoutSummary(summaryData);
             customAlert("Success", "Workout saved!", [
                 { 
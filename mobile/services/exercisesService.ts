@@ -22,6 +22,12 @@ export interface ExerciseHistoryItem {
     workout_name: string;
     date: string;
     session_1rm: number;
+    session_volume: number;
+    sets_count: number;
+    top_set: {
+        weight: number;
+        reps: number;
+    };
     sets: {
         id: number;
         weight: string;
@@ -44,11 +50,32 @@ export interface ExerciseRecords {
     best_1rm: ExerciseRecordValue | null;
 }
 
+export interface ProgressionPoint {
+    workout_id: number;
+    date: string;
+    e1rm: number;
+    rolling_best: number;
+}
+
+export interface ExerciseProgression {
+    exercise_id: number;
+    sessions_count: number;
+    best_1rm: number;
+    // Fitted line over the whole series, null with less than two sessions
+    trend: {
+        slope_per_week: number;
+        start_value: number;
+        end_value: number;
+        r2: number | null;
+    } | null;
+    points: ProgressionPoint[];
+}
+
 export async function getExercises(params: FetchExercisesParams = {}): Promise<PaginatedExercises> {
     const query = new URLSearchParams();
     
     if (params.page) query.append('page', params.page.toString());
-    if (params.search) query.append('name', params.search);
+    if (params.search) query.append('search', params.search);
     if (params.muscle) query.append('muscle', params.muscle);
     if (params.level) query.append('level', params.level);
     if (params.category) query.append('category', params.category);
@@ -78,11 +105,22 @@ export async function getExerciseById(id: string | number): Promise<Exercise> {
 export async function getExerciseHistory(id: string): Promise<ExerciseHistoryItem[]> {
     const response = await apiFetch(`${ENDPOINTS.EXERCISES}${id}/history/`);
     if (!response.ok) throw new Error('Failed to fetch history');
-    return await response.json();
+    // Response is paginated, first page holds latest sessions
+    const page = await response.json();
+    return page.results;
 }
 
 export async function getExerciseRecords(id: string): Promise<ExerciseRecords> {
     const response = await apiFetch(`${ENDPOINTS.EXERCISES}${id}/records/`);
     if (!response.ok) throw new Error('Failed to fetch records');
     return await response.json();
-}
\ No newline at end of file
+}
+
+// Estimated 1RM series for progression chart, downsampled on server to at most `points` sessions
+export async function getExerciseProgression(id: string, days?: number, points = 60): Promise<ExerciseProgression> {
+    const query = new URLSearchParams({ points: points.toString() });
+    if (days) query.append('days', days.toString());
+    const response = await apiFetch(`${ENDPOINTS.EXERCISES}${id}/progression/?${query.toString()}`);
+    if (!response.ok) throw new Error('Failed to fetch progression');
+    return await response.json();
+}
@@ -14,6 +14,9 @@ export interface HistorySet {
     id: number;
     weight: string; 
     reps: number;
+    rpe: string | null;
+    // Computed by server with formula selected by user
+    estimated_1rm: number;
     order: number;
 }
 
@@ -33,23 +36,39 @@ export interface WorkoutDetail {
     exercises: HistoryExercise[];
 }
 
+interface WorkoutHistoryPage {
+    next: string | null;
+    previous: string | null;
+    results: WorkoutHistoryItem[];
+}
+
 export async function getWorkoutsHistory(fromDate: string, toDate: string): Promise<WorkoutHistoryItem[]> {
     const params = new URLSearchParams();
     params.append('from_date', fromDate); 
     params.append('to_date', toDate);    
 
-    const endpointWithParams = `${ENDPOINTS.WORKOUTS}?${params.toString()}`;
+    const workouts: WorkoutHistoryItem[] = [];
+    let cursor: string | undefined;
 
-    // Use the apiFetch function to make the authenticated request
-    const response = await apiFetch(endpointWithParams, {
-        method: 'GET',
-    });
+    // List is cursor paginated, follow pages until the whole range is loaded
+    do {
+        const endpointWithParams = `${ENDPOINTS.WORKOUTS}?${params.toString()}${cursor ? `&cursor=${cursor}` : ''}`;
 
-    if (!response.ok) {
-        throw new Error('Something went wrong while fetching workout history.');
-    }
+        // Use the apiFetch function to make the authenticated request
+        const response = await apiFetch(endpointWithParams, {
+            method: 'GET',
+        });
 
-    return await response.json();
+        if (!response.ok) {
+            throw new Error('Something went wrong while fetching workout history.');
+        }
+
+        const page: WorkoutHistoryPage = await response.json();
+        workouts.push(...page.results);
+        cursor = page.next?.match(/[?&]cursor=([^&]+)/)?.[1];
+    } while (cursor);
+
+    return workouts;
 }
 
 
@@ -47,10 +47,12 @@ export interface WorkoutSummaryResponse {
     new_records: NewRecord[];
 }
 
-export async function createWorkout(workoutData: CreateWorkoutPayload): Promise<WorkoutSummaryResponse> {
+// idempotencyKey: same value for every retry of one workout, server returns stored summary instead of saving it again
+export async function createWorkout(workoutData: CreateWorkoutPayload, idempotencyKey?: string): Promise<WorkoutSummaryResponse> {
     const response = await apiFetch(ENDPOINTS.WORKOUTS, {
         method: 'POST',
         body: JSON.stringify(workoutData),
+        headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined,
     });
 
     if (!response.ok) {
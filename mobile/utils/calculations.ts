@@ -1,12 +1,31 @@
 
 
-export const calculateOneRepMax = (weightStr: string, repsStr: string): string => {
+// 1RM formulas, same names and results as backend workouts/estimators.py
+// Used for sets not saved yet, saved sets carry estimated_1rm computed by server with user formula
+export type OneRepMaxFormula = 'epley' | 'brzycki' | 'lombardi' | 'rpe';
+
+const epley = (weight: number, reps: number) => reps === 1 ? weight : weight * (1 + reps / 30);
+
+const FORMULAS: Record<OneRepMaxFormula, (weight: number, reps: number, rpe?: number) => number> = {
+    epley,
+    brzycki: (weight, reps) => weight * 36 / (37 - Math.min(reps, 36)),
+    lombardi: (weight, reps) => weight * Math.pow(reps, 0.1),
+    // Reps to failure: reps done plus reps in reserve (10 - RPE)
+    rpe: (weight, reps, rpe) => {
+        const repsToFailure = reps + 10 - (rpe ?? 10);
+        return repsToFailure <= 1 ? weight : epley(weight, repsToFailure);
+    },
+};
+
+export const calculateOneRepMax = (
+    weightStr: string, repsStr: string, formula: OneRepMaxFormula = 'epley', rpe?: number
+): string => {
     const weight = parseFloat(weightStr);
     const reps = parseInt(repsStr);
 
     if (isNaN(weight) || isNaN(reps) || weight <= 0 || reps <= 0) {
         return '-';
     }
-    const oneRM = weight * (1 + reps / 30);
+    const oneRM = FORMULAS[formula](weight, reps, rpe);
     return Math.round(oneRM).toString();
-};
\ No newline at end of file
+};